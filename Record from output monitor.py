@@ -1,96 +1,37 @@
 import asyncio
-import json
-import re
-import subprocess
 
+import pwautoconnect
+import pwgraph
+import pwlink
 from reaper_loop import reaper_loop_run
 
 
-async def get_output(cmdline: list[str] | tuple[str, ...]) -> str:
-    assert cmdline
-    proc = await asyncio.subprocess.create_subprocess_exec(
-        *cmdline, stdout=subprocess.PIPE
-    )
-    assert proc.stdout is not None
-    stdout_bytes, _ = await proc.communicate()
-    exitcode = await proc.wait()
-    if exitcode:
-        raise Exception(f"{cmdline[0]} exited with code {exitcode}")
-    return stdout_bytes.decode()
-
-
-async def just_run(cmdline: list[str] | tuple[str, ...]) -> None:
-    assert cmdline
-    print(" ".join(cmdline))
-    proc = await asyncio.subprocess.create_subprocess_exec(*cmdline)
-    exitcode = await proc.wait()
-    if exitcode:
-        raise Exception(f"{cmdline[0]} exited with code {exitcode}")
-
-
 async def amain(*, in_reaper: bool) -> None:
-    pw_dump = json.loads(await get_output(("pw-dump",)))
-
-    inname = {}
-    outputs = {}
-    nodename = {}
-    links = []
-    defaults = {}
-    for obj in pw_dump:
-        if obj["type"] == "PipeWire:Interface:Link":
-            out = obj["info"]["output-port-id"]
-            inp = obj["info"]["input-port-id"]
-            links.append((out, inp))
-        if obj["type"] == "PipeWire:Interface:Node":
-            nam = obj["info"]["props"].get("node.name")
-            if nam is not None:
-                nodename[nam] = obj["id"]
-        if obj["type"] == "PipeWire:Interface:Port":
-            portname = obj["info"]["props"].get("port.alias")
-            portdir = obj["info"]["props"].get("port.direction")
-            if portname is not None and portdir is not None:
-                if portdir == "in":
-                    inname[obj["id"]] = portname
-                else:
-                    assert portdir in ("in", "out")
-                    outputs[obj["id"]] = (
-                        obj["info"]["props"]["node.id"],
-                        obj["info"]["props"]["port.id"],
-                        portname,
-                    )
-        if obj["type"] == "PipeWire:Interface:Metadata":
-            if obj["props"]["metadata.name"] == "default":
-                for md in obj["metadata"]:
-                    if md["subject"] == 0 and md["type"] == "Spa:String:JSON":
-                        defaults[md["key"]] = md["value"]["name"]
-
-    if "default.audio.sink" not in defaults:
+    try:
+        # Ask the auto-connect daemon if it is running, it already has the graph
+        graph = await pwautoconnect.subgraph(
+            defaults=["default.audio.sink"], port_fmts=["REAPER:in%d"]
+        )
+    except OSError:
+        graph = await pwgraph.dump()
+
+    defaultnode = graph.default_node("default.audio.sink")
+    if defaultnode is None:
         raise SystemExit("don't know the default.audio.sink")
-    defaultnode = nodename[defaults["default.audio.sink"]]
-    defaultportids = [oid for oid in outputs if outputs[oid][0] == defaultnode]
-    defaultportids.sort(key=lambda oid: outputs[oid][1])
-    if len(defaultportids) < 2:
+    defaultports = graph.node_ports(defaultnode.id, "out")
+    if len(defaultports) < 2:
         raise SystemExit("Need at least 2 default ports")
-    monitorlinks = [
-        {inp for out, inp in links if out == portid} for portid in defaultportids
-    ]
+    monitorlinks = [graph.linked_inputs(port.id) for port in defaultports]
 
-    input_has_link = set(inp for out, inp in links)
-    reaper_ins = {}
-    free_ins = []
-    for inp in inname:
-        mo = re.match(r"REAPER:in(\d+)$", inname[inp])
-        if mo is None:
-            continue
-        reaper_ins[int(mo.group(1))] = inp
-        if inp not in input_has_link:
-            free_ins.append(int(mo.group(1)))
+    reaper_ins = {chan: port for chan, port in graph.numbered_ports("REAPER:in%d")}
     if not reaper_ins:
         raise SystemExit("did not find any REAPER input ports??")
-    assert sorted(reaper_ins) == list(range(1, max(reaper_ins) + 1))
+    free_ins = [
+        chan for chan, port in reaper_ins.items() if not graph.linked_outputs(port.id)
+    ]
 
-    in1s = {chan for chan, portid in reaper_ins.items() if portid in monitorlinks[0]}
-    in2s = {chan for chan, portid in reaper_ins.items() if portid in monitorlinks[1]}
+    in1s = {chan for chan, port in reaper_ins.items() if port.id in monitorlinks[0]}
+    in2s = {chan for chan, port in reaper_ins.items() if port.id in monitorlinks[1]}
     if in1s or in2s:
         linked_pair = in1s & {i - 1 for i in in2s}
         if not linked_pair:
@@ -108,10 +49,9 @@ async def amain(*, in_reaper: bool) -> None:
         stereo_in = max(free_stereo_pairs)
         in1 = reaper_ins[stereo_in]
         in2 = reaper_ins[stereo_in + 1]
-        out1 = defaultportids[0]
-        out2 = defaultportids[1]
-        await just_run(("pw-link", outputs[out1][2], inname[in1]))
-        await just_run(("pw-link", outputs[out2][2], inname[in2]))
+        out1 = defaultports[0]
+        out2 = defaultports[1]
+        await pwlink.apply_links([(out1.id, in1.id), (out2.id, in2.id)])
 
     if not in_reaper:
         return
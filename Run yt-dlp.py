@@ -2,6 +2,7 @@ import os
 import tempfile
 
 import aiotk
+import autil
 from reaper_python import RPR_GetProjectPath, RPR_InsertMedia
 from reaper_loop import reaper_loop_run
 import rutil
@@ -17,6 +18,7 @@ async def amain() -> None:
     filename = await run_ytdlp(searchterm.strip(), projpath)
     if filename is None:
         return
+    await autil.build_peaks(filename)
     with rutil.undoblock("Download audio"):
         rutil.clear_item_selection()
         RPR_InsertMedia(filename, 1)
@@ -2,35 +2,68 @@ import asyncio
 import os
 import sys
 
+import autil
+import lalal
 import split_stems
 from reaper_loop import reaper_loop_run
+from split_stems import SplitStems
 
 
-async def main() -> None:
-    prep = await split_stems.prep_split_stems(1.0)
-    filename_fmt = f"{prep.basename}_{{stem}}_split_by_lalalai.flac"
-    filenames = [filename_fmt.format(stem=s) for s in "vocals no_vocals".split()]
-    paths = [os.path.join(prep.dirname, f) for f in filenames]
-    if not all(os.path.exists(p) for p in paths):
+async def main(stem: str = "vocals") -> None:
+    "stem is one of the stems that lalalcli --stem accepts; the rest is no_{stem}"
+    stems = [stem, f"no_{stem}"]
+    preps = await split_stems.prep_split_stems_batch(
+        1.0, splitter="lalalai", stems=stems
+    )
+    jobs: list[tuple[SplitStems, list[str]]] = []
+    # Unfinished jobs of an interrupted earlier run are resumed as well
+    queue = lalal.LalalQueue.load(lalal.DEFAULT_QUEUE_FILE)
+    queued = False
+    for prep in preps:
+        if prep.reused is not None:
+            jobs.append((prep, [prep.reused[s] for s in stems]))
+            continue
+        paths = lalal.stem_paths(os.path.join(prep.dirname, prep.basename), stem)
+        jobs.append((prep, list(paths)))
+        if not all(os.path.exists(p) for p in paths):
+            queue.add(
+                lalal.QueueJob(
+                    str(prep.source_slice.path),
+                    prep.source_slice.slice.start,
+                    prep.source_slice.slice.end,
+                    stem,
+                    paths[0],
+                    paths[1],
+                )
+            )
+            queued = True
+    exitcode: int | None = 0
+    if queued:
+        queue.save()
         proc = await asyncio.subprocess.create_subprocess_exec(
             "gnome-terminal",
             "--geometry=122x10",
             "--wait",
             "--",
             os.path.join(sys.path[0], "lalalcli"),
+            "queue",
             "--no-confirm",
-            str(prep.source_slice.path),
-            str(prep.source_slice.slice.start),
-            str(prep.source_slice.slice.end),
-            paths[0],
-            paths[1],
+            lalal.DEFAULT_QUEUE_FILE,
         )
         exitcode = await proc.wait()
-        if exitcode:
-            raise Exception(f"lalalcli exited with code {exitcode}")
         if exitcode is None:
             return
-    split_stems.insert_split_stems(prep, paths)
+        if exitcode:
+            # lalalcli has reported the failed jobs; insert the others
+            jobs = [(p, paths) for p, paths in jobs if all(map(os.path.exists, paths))]
+    for prep, paths in jobs:
+        split_stems.record_split_stems(
+            prep, "lalalai", dict(zip(stems, paths)), prep.source_slice.slice
+        )
+    await autil.build_peaks_all([p for _, paths in jobs for p in paths])
+    split_stems.insert_split_stems_batch(jobs)
+    if exitcode:
+        raise Exception(f"lalalcli exited with code {exitcode}")
 
 
 reaper_loop_run(main())
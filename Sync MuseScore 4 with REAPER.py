@@ -1,9 +1,13 @@
 import asyncio
+import collections
+import itertools
 import json
 import random
+import statistics
 import sys
+import time
 import traceback
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Any, Callable
 
 import aiohttp
@@ -19,11 +23,270 @@ class Context:
     first_measure_start: float
 
 
-async def server_main(port: int, ctx: Context) -> None:
+@dataclass
+class ClockSync:
+    """
+    NTP-style estimate of the remote clock offset and the message latency,
+    from timestamped ping/pong exchanges:
+    t0 = ping sent (local clock), t1 = ping received and t2 = pong sent
+    (remote clock), t3 = pong received (local clock).
+    """
+
+    samples: collections.deque[tuple[float, float]] = field(default_factory=lambda: collections.deque(maxlen=32))
+    count: int = 0
+
+    def add(self, t0: float, t1: float, t2: float, t3: float) -> None:
+        delay = (t3 - t0) - (t2 - t1)
+        offset = ((t1 - t0) + (t2 - t3)) / 2
+        self.samples.append((delay, offset))
+        self.count += 1
+
+    @property
+    def best(self) -> tuple[float, float] | None:
+        # The sample with the least delay has the least asymmetry error
+        return min(self.samples, default=None)
+
+    @property
+    def one_way_delay(self) -> float:
+        best = self.best
+        return 0.0 if best is None else best[0] / 2
+
+    def remote_to_local(self, t: float) -> float:
+        best = self.best
+        return t if best is None else t - best[1]
+
+    def stats(self) -> str:
+        rtts = sorted(1000 * d for d, _ in self.samples)
+        best = self.best
+        assert best is not None
+        return (
+            f"round trip min {rtts[0]:.1f} / median {statistics.median(rtts):.1f} / max {rtts[-1]:.1f} ms, "
+            f"clock offset {1000 * best[1]:+.1f} ms over {len(rtts)} samples"
+        )
+
+
+PING_INTERVAL = 2.0
+# Print latency statistics after this many pongs
+STATS_EVERY = 30
+
+
+def extrapolate_remote_pos(reply: dict[str, Any], clock: ClockSync) -> float:
+    "Where the remote is now, if it started playing at reply['pos'] when it sent reply"
+    sent_at = reply.get("sentAt")
+    if sent_at is None or not reply["currentlyPlaying"] or not clock.samples:
+        return reply["pos"]
+    return reply["pos"] + max(0.0, time.time() - clock.remote_to_local(sent_at))
+
+
+# Drift correction: how often to compare positions while both sides play,
+# and how far apart they may get before the follower (MuseScore) is re-seeked
+DRIFT_CHECK_INTERVAL = 1.0
+DRIFT_THRESHOLD = 0.040
+
+
+@dataclass
+class DriftMonitor:
+    "Alignment error (remote minus local position) over time during playback"
+
+    # (local time, error) since the last corrective seek
+    window: list[tuple[float, float]] = field(default_factory=list)
+    errors: list[float] = field(default_factory=list)
+    corrections: int = 0
+
+    def add(self, t: float, error: float) -> None:
+        self.window.append((t, error))
+        self.errors.append(error)
+
+    def corrected(self) -> None:
+        self.window.clear()
+        self.corrections += 1
+
+    @property
+    def drift_rate(self) -> float | None:
+        "Least squares slope of the error, in seconds per second"
+        if len(self.window) < 3:
+            return None
+        ts = [t for t, _ in self.window]
+        es = [e for _, e in self.window]
+        t_mean = statistics.fmean(ts)
+        e_mean = statistics.fmean(es)
+        var = sum((t - t_mean) ** 2 for t in ts)
+        if not var:
+            return None
+        return sum((t - t_mean) * (e - e_mean) for t, e in zip(ts, es)) / var
+
+    def stats(self) -> str:
+        abs_errors = [abs(e) for e in self.errors]
+        rate = self.drift_rate
+        drift = "unknown" if rate is None else f"{rate * 1e6:+.0f} ppm"
+        return (
+            f"alignment error mean {1000 * statistics.fmean(abs_errors):.1f} / max {1000 * max(abs_errors):.1f} ms "
+            f"over {len(abs_errors)} samples, drift {drift}, {self.corrections} corrective seeks"
+        )
+
+
+@dataclass(eq=False)
+class Peer:
+    """
+    One connected musicsync peer. Outgoing messages are queued and written by
+    the peer's own writer task, so a slow peer never holds up the others.
+    """
+
+    ws: Any
+    name: str
+    version: int = 1
+    # Identifies the remote instance, which may be connected to us twice
+    instance: str | None = None
+    subscribed: bool = False
+    clock: ClockSync = field(default_factory=ClockSync)
+    drift: DriftMonitor = field(default_factory=DriftMonitor)
+    refs: dict[int, Callable[[Any], None]] = field(default_factory=dict)
+    # The remote's play state as far as we know: what it last told us, or what we last told it
+    remote_state: dict[str, Any] | None = None
+    # Bumped whenever we send a play state, so that polls in flight are discarded
+    sent_generation: int = 0
+    # Protocol version 2: latest pushed remote play state
+    latest_remote_state: dict[str, Any] | None = None
+    remote_changed: asyncio.Event = field(default_factory=asyncio.Event)
+    outbox: collections.deque[str] = field(default_factory=collections.deque)
+    # Play state changes are coalesced: only the latest one is written
+    pending_state: str | None = None
+    wakeup: asyncio.Event = field(default_factory=asyncio.Event)
+    messages_sent: int = 0
+    messages_received: int = 0
+    tasks: list[asyncio.Task] = field(default_factory=list)
+
+    def close(self) -> None:
+        peers.discard(self)
+        if not peers:
+            peers_present.clear()
+        for task in self.tasks:
+            task.cancel()
+
+    def send(self, msg: str) -> None:
+        self.outbox.append(msg)
+        self.wakeup.set()
+
+    def send_state(self, msg: str, state: dict[str, Any]) -> None:
+        self.pending_state = msg
+        self.remote_state = state
+        self.sent_generation += 1
+        self.wakeup.set()
+
+    async def writer(self) -> None:
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            while self.outbox or self.pending_state is not None:
+                if self.pending_state is not None:
+                    msg, self.pending_state = self.pending_state, None
+                else:
+                    msg = self.outbox.popleft()
+                try:
+                    await self.ws.send_str(msg)
+                except ConnectionError:
+                    return
+                self.messages_sent += 1
+
+    async def request(self, obj: dict[str, Any], timeout: float = 1) -> dict[str, Any] | None:
+        ref = 2 + random.randrange(2**30)
+        fut = asyncio.Future[Any]()
+        self.refs[ref] = fut.set_result
+        self.send(json.dumps({**obj, "ref": ref}))
+        try:
+            return await asyncio.wait_for(fut, timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self.refs.pop(ref, None)
+
+
+peers: set[Peer] = set()
+
+# Highest protocol version we speak. The peer replies with the version to use;
+# a version 1 peer (older plugin) makes us fall back to polling getPlayState.
+PROTOCOL_VERSION = 2
+
+
+def play_state_message(peer: Peer, playing: bool, pos: float, sent_at: float) -> dict[str, Any]:
+    if peer.version >= 2:
+        return {"t": "playStateChanged", "currentlyPlaying": playing, "pos": pos, "sentAt": sent_at}
+    return {"t": "setPlayState", "currentlyPlaying": playing, "pos": pos, "ref": 0}
+
+
+def broadcast_play_state(playing: bool, pos: float) -> None:
+    """
+    Queue a local play state change on every peer without waiting for any of them.
+    Each message is serialised once per protocol version and latency (to the ms),
+    which is usually once for all peers.
+    """
+    sent_at = time.time()
+    serialised: dict[tuple[bool, float], str] = {}
+    for peer in peers:
+        if peer.version >= 2 and not peer.subscribed:
+            continue
+        # By the time the remote gets this, we have played on for the one-way delay
+        delay = round(peer.clock.one_way_delay, 3) if playing else 0.0
+        key = (peer.version >= 2, delay)
+        if key not in serialised:
+            serialised[key] = json.dumps(play_state_message(peer, playing, pos + delay, sent_at))
+        peer.send_state(serialised[key], {"currentlyPlaying": playing, "pos": pos})
+
+
+async def ping_loop() -> None:
+    while True:
+        await asyncio.sleep(PING_INTERVAL)
+        for peer in peers:
+            # Don't pile pings onto a peer that isn't keeping up
+            if peer.version >= 2 and not peer.outbox:
+                peer.send(json.dumps({"t": "ping", "t0": time.time()}))
+
+
+async def check_drift(ctx: Context, proj: rutil.RProject, peer: Peer) -> None:
+    reply = await peer.request({"t": "getPlayState"})
+    if reply is None or not reply["currentlyPlaying"] or not proj.get_play_state() & 1:
+        return
+    now = time.time()
+    local_pos = proj.get_play_position() - ctx.first_measure_start
+    if "sentAt" in reply and peer.clock.samples:
+        remote_pos = extrapolate_remote_pos(reply, peer.clock)
+    else:
+        # Older plugin or no pongs yet: assume the reply took the one-way delay
+        remote_pos = reply["pos"] + peer.clock.one_way_delay
+    error = remote_pos - local_pos
+    peer.drift.add(now, error)
+    if abs(error) > DRIFT_THRESHOLD:
+        rate = peer.drift.drift_rate
+        drift = "" if rate is None else f", drifting {rate * 1e6:+.0f} ppm"
+        print(f"Sync: {peer.name}: Remote is {1000 * error:+.0f} ms off{drift}, seeking remote")
+        pos = local_pos + peer.clock.one_way_delay
+        peer.send_state(json.dumps(play_state_message(peer, True, pos, time.time())), {"currentlyPlaying": True, "pos": local_pos})
+        peer.drift.corrected()
+
+
+async def correct_drift(ctx: Context, proj: rutil.RProject) -> None:
+    while True:
+        # Like detect_local_play_pause, don't poll the transport without peers
+        await peers_present.wait()
+        await asyncio.sleep(DRIFT_CHECK_INTERVAL)
+        if not peers:
+            continue
+        if not proj.get_play_state() & 1:
+            for peer in peers:
+                if peer.drift.errors:
+                    print(f"Sync: {peer.name}: Drift: {peer.drift.stats()}")
+                    peer.drift = DriftMonitor()
+            continue
+        await asyncio.gather(*(check_drift(ctx, proj, peer) for peer in list(peers)))
+
+
+async def server_main(port: int, ctx: Context, proj: rutil.RProject) -> None:
+    counter = itertools.count(1)
+
     async def websocket_server_handler(request):
         ws = web.WebSocketResponse()
         await ws.prepare(request)
-        await handle_sync_connection(ctx, ws)
+        await handle_sync_connection(ctx, proj, ws, f"client {next(counter)}")
         return ws
 
     server = web.Server(websocket_server_handler)
@@ -33,151 +296,251 @@ async def server_main(port: int, ctx: Context) -> None:
     await site.start()
 
 
-local_action: asyncio.Future[Any] | None = None
+async def follow_peer(ctx: Context, proj: rutil.RProject, peer: Peer) -> None:
+    """
+    Apply the peer's play state changes locally. Protocol version 1 peers
+    are polled with getPlayState; version 2 peers push playStateChanged events,
+    and rapid toggles are coalesced: only the latest state is applied.
+    """
+    first = True
+    while True:
+        if peer.version >= 2:
+            await peer.remote_changed.wait()
+            peer.remote_changed.clear()
+            reply = peer.latest_remote_state
+            assert reply is not None
+        else:
+            generation = peer.sent_generation
+            reply = await peer.request({"t": "getPlayState"})
+            if reply is None:
+                print(f"Sync: {peer.name}: timeout in getPlayState...")
+                continue
+            if generation != peer.sent_generation:
+                # We changed its play state while the poll was in flight
+                continue
+        if first:
+            print(f"Sync: {peer.name}: Got first play state")
+            first = False
+        elif peer.remote_state is not None and peer.remote_state["currentlyPlaying"] != reply["currentlyPlaying"]:
+            await apply_remote_play_state(ctx, proj, peer, reply)
+        peer.remote_state = reply
 
 
-async def detect_remote_play_pause(ctx: Context, proj: rutil.RProject) -> None:
-    global local_action
-    local_action = asyncio.Future()
-    remote_state = None
-    while True:
-        if the_connection is None:
-            if remote_state is not None:
-                print("Sync: Lost connection")
-            await asyncio.sleep(0)
-            remote_state = None
-            continue
-        if not local_action.done():
-            if remote_state is None:
-                print("Sync: Send first getPlayState")
-            ref = 2 + random.randrange(2**30)
-            fut = asyncio.Future[Any]()
-            refs[ref] = fut.set_result
-            await the_connection.send_str(json.dumps({"t": "getPlayState", "ref": ref}))
-            await asyncio.wait([fut, local_action], timeout=1, return_when=asyncio.FIRST_COMPLETED)
-            refs.pop(ref, None)
-        if local_action.done():
-            while local_action.done():
-                local_playing, local_position = local_action.result()
-                local_action = asyncio.Future()
-                if local_playing:
-                    print("Sync: Local started playing", local_position)
-                else:
-                    print("Sync: Local stopped playing")
-                ref = 2 + random.randrange(2**30)
-                fut = asyncio.Future[Any]()
-                refs[ref] = fut.set_result
-                req = {"t": "setPlayState", "currentlyPlaying": local_playing, "pos": local_position, "ref": ref}
-                await the_connection.send_str(json.dumps(req))
-                await asyncio.wait([fut, local_action], timeout=1, return_when=asyncio.FIRST_COMPLETED)
-                if fut.done():
-                    remote_state = req
-                elif not local_action.done():
-                    print("Sync: timeout in setPlayState...")
-                refs.pop(ref, None)
-            continue
-        if not fut.done():
-            print("Sync: timeout in getPlayState...")
-            continue
-        reply = fut.result()
-        if remote_state is None:
-            print("Sync: Got first play state")
-        if remote_state is not None and remote_state["currentlyPlaying"] != reply["currentlyPlaying"]:
-            play_state = proj.get_play_state()
-            if reply["currentlyPlaying"]:
-                if play_state in (0, 1, 3):
-                    print("Sync: Remote started playing", reply.get("pos"))
-                    proj.set_edit_cursor(reply["pos"] + ctx.first_measure_start, moveview=False, seekplay=True)
-                    proj.play()
-                    # Note, playing the local project causes detect_local_play_pause
-                    # to set local_action, which we COULD ignore here, but we let it play out,
-                    # since it seems to sync the playback much better when REAPER controls
-                    # the start time instead of letting MuseScore control the start time.
-                    # await local_action; local_action = asyncio.Future()
-                elif play_state == 4:
-                    print("Sync: Remote started playing (but we are currently recording)")
-                else:
-                    print(f"Sync: Remote started playing (but we are currently in play state {play_state})")
-            elif play_state == 1:
-                print("Sync: Remote stopped playing")
-                proj.stop()
-                # Get and ignore local_action
-                await local_action
-                local_action = asyncio.Future()
-            elif play_state == 0:
-                print("Sync: Remote stopped playing (but we were already stopped)")
-            elif play_state == 4:
-                print("Sync: Remote stopped playing (but we are currently recording)")
-            else:
-                print(f"Sync: Remote stopped playing (but we are in play state {play_state})")
-        remote_state = reply
+async def apply_remote_play_state(ctx: Context, proj: rutil.RProject, peer: Peer, reply: dict[str, Any]) -> None:
+    play_state = proj.get_play_state()
+    if reply["currentlyPlaying"]:
+        if play_state in (0, 1, 3):
+            pos = extrapolate_remote_pos(reply, peer.clock)
+            print(f"Sync: {peer.name}: Remote started playing", reply.get("pos"), f"(compensated to {pos:.3f})")
+            proj.set_edit_cursor(pos + ctx.first_measure_start, moveview=False, seekplay=True)
+            proj.play()
+            transport_poked.set()
+            # Note, playing the local project causes detect_local_play_pause
+            # to broadcast the new play state to every peer, including this one.
+            # It seems to sync the playback much better when REAPER controls
+            # the start time instead of letting MuseScore control the start time.
+        elif play_state == 4:
+            print(f"Sync: {peer.name}: Remote started playing (but we are currently recording)")
+        else:
+            print(f"Sync: {peer.name}: Remote started playing (but we are currently in play state {play_state})")
+    elif play_state == 1:
+        print(f"Sync: {peer.name}: Remote stopped playing")
+        # The other peers are stopped by detect_local_play_pause
+        proj.stop()
+        transport_poked.set()
+    elif play_state == 0:
+        print(f"Sync: {peer.name}: Remote stopped playing (but we were already stopped)")
+    elif play_state == 4:
+        print(f"Sync: {peer.name}: Remote stopped playing (but we are currently recording)")
+    else:
+        print(f"Sync: {peer.name}: Remote stopped playing (but we are in play state {play_state})")
 
 
-async def detect_local_play_pause(ctx: Context, proj: rutil.RProject) -> None:
-    global remote_state
+# Local transport polling. The event loop runs once per REAPER defer cycle
+# (about 30 Hz), so an interval of 0 polls as often as REAPER lets us.
+# Poll every cycle for POLL_BURST seconds after a transport change, then back off.
+POLL_BURST = 3.0
+POLL_PLAYING = 0.1
+POLL_STOPPED = 0.2
+# Print detection statistics after this many transport changes
+DETECTION_STATS_EVERY = 10
+
+# Set while any peer is connected; without peers the transport isn't polled at all
+peers_present = asyncio.Event()
+# Set when we start or stop the transport ourselves, to poll fast right away
+transport_poked = asyncio.Event()
 
-    state1 = proj.get_play_state()
-    # position1 = proj.get_play_position() - ctx.first_measure_start
-    # print(state1, position1)
-    while True:
-        await asyncio.sleep(0)
-        position2 = proj.get_play_position() - ctx.first_measure_start
-        state2 = 0 if position2 < 0 else proj.get_play_state()
-        if state1 == 0 and state2:
-            # print("Pause -> Play", the_connection is None, remote_state)
-            if local_action is not None and not local_action.done():
-                local_action.set_result((True, position2))
-        if state1 and state2 == 0:
-            # print("Play -> Pause")
-            if local_action is not None and not local_action.done():
-                local_action.set_result((False, position2))
-        state1 = state2
-        # position1 = position2
 
+@dataclass
+class DetectionStats:
+    "How quickly and how cheaply detect_local_play_pause notices transport changes"
 
-the_connection: Any | None = None
-refs: dict[int, Callable[[Any], None]] = {}
+    # Time the transport had been playing when we noticed it started
+    start_latencies: list[float] = field(default_factory=list)
+    # Upper bounds: time since the previous sample, when we noticed it stopped
+    stop_latencies: list[float] = field(default_factory=list)
+    changes: int = 0
+    samples: int = 0
+    bridge_calls: int = 0
+    polling_time: float = 0.0
 
+    def stats(self) -> str:
+        parts = []
+        if self.start_latencies:
+            parts.append(
+                f"start latency mean {1000 * statistics.fmean(self.start_latencies):.0f} / max {1000 * max(self.start_latencies):.0f} ms"
+            )
+        if self.stop_latencies:
+            parts.append(f"stop latency at most {1000 * statistics.fmean(self.stop_latencies):.0f} ms on average")
+        rate = self.samples / self.polling_time if self.polling_time else 0.0
+        calls = self.bridge_calls / self.polling_time if self.polling_time else 0.0
+        parts.append(f"{rate:.1f} samples/s, {calls:.1f} REAPER calls/s while polling")
+        return ", ".join(parts)
 
-async def handle_sync_connection(ctx: Context, ws) -> None:
-    global the_connection
 
-    await ws.send_str(json.dumps({"t": "hello", "protocol": "musicsync", "version": 1, "ref": 1}))
-    async for msg in ws:
-        if msg.type == aiohttp.WSMsgType.TEXT:
-            obj = json.loads(msg.data)
-            if obj["t"] == "helloReply" and obj["protocol"] == "musicsync" and obj["version"] == 1 and obj["ref"] == 1:
-                print("Sync: New remote connection established")
-                the_connection = ws
-            elif "ref" in obj and obj["ref"] in refs:
-                refs.pop(obj["ref"])(obj)
-        elif msg.type == aiohttp.WSMsgType.ERROR:
-            print("Sync: WebSocket client error")
-            break
+async def detect_local_play_pause(ctx: Context, proj: rutil.RProject) -> None:
+    """
+    Notice local transport changes and broadcast them to the peers.
+    Sampling the play state is a REAPER call, so the rate adapts:
+    fast right after a change, slower when idle and not at all without peers.
+    """
+    stats = DetectionStats()
+    last_change = -POLL_BURST
+    state1 = None
+    last_sample = time.monotonic()
+    while True:
+        if not peers:
+            await peers_present.wait()
+            # Start over from the current state without broadcasting it
+            state1 = None
+        now = time.monotonic()
+        if transport_poked.is_set() or now - last_change < POLL_BURST:
+            transport_poked.clear()
+            await asyncio.sleep(0)
         else:
-            print("Sync: WebSocket client unknown message")
-    print("Sync: Connection done")
+            try:
+                await asyncio.wait_for(transport_poked.wait(), POLL_PLAYING if state1 else POLL_STOPPED)
+                last_change = time.monotonic()
+            except asyncio.TimeoutError:
+                pass
+        previous_sample, last_sample = last_sample, time.monotonic()
+        if state1 is not None:
+            stats.polling_time += last_sample - previous_sample
+        stats.samples += 1
+        stats.bridge_calls += 1
+        state2 = proj.get_play_state()
+        position2 = 0.0
+        if state2:
+            stats.bridge_calls += 1
+            position2 = proj.get_play_position() - ctx.first_measure_start
+            if position2 < 0:
+                state2 = 0
+        if state1 is None:
+            state1 = state2
+            continue
+        if bool(state1) != bool(state2):
+            last_change = last_sample
+            if state2:
+                print("Sync: Local started playing", position2)
+                latency = proj.get_play_position2() - proj.get_cursor_position()
+                stats.bridge_calls += 2
+                if 0 <= latency < 1:
+                    stats.start_latencies.append(latency)
+            else:
+                print("Sync: Local stopped playing")
+                position2 = proj.get_play_position() - ctx.first_measure_start
+                stats.bridge_calls += 1
+                stats.stop_latencies.append(last_sample - previous_sample)
+            broadcast_play_state(bool(state2), position2)
+            stats.changes += 1
+            if stats.changes % DETECTION_STATS_EVERY == 0:
+                print(f"Sync: Local detection: {stats.stats()}")
+        state1 = state2
+
+
+def retire_duplicate(peer: Peer) -> None:
+    """
+    The same remote instance connected again (we connect to it and it connects
+    to us): keep the newest. Version 1 plugins don't send their instance, so
+    as before there is only ever one of those: the newest.
+    """
+    for other in list(peers):
+        if other is not peer and other.instance == peer.instance:
+            print(f"Sync: {other.name}: Superseded by {peer.name}")
+            other.close()
+
+
+async def handle_sync_connection(ctx: Context, proj: rutil.RProject, ws, name: str) -> None:
+    peer = Peer(ws, name)
+    await ws.send_str(json.dumps({"t": "hello", "protocol": "musicsync", "version": PROTOCOL_VERSION, "ref": 1}))
+    try:
+        async for msg in ws:
+            if msg.type == aiohttp.WSMsgType.TEXT:
+                obj = json.loads(msg.data)
+                peer.messages_received += 1
+                if obj["t"] == "helloReply" and obj["protocol"] == "musicsync" and obj["version"] in (1, 2) and obj["ref"] == 1:
+                    print(f"Sync: {name}: New remote connection established (protocol version {obj['version']})")
+                    peer.version = obj["version"]
+                    peer.instance = obj.get("instance")
+                    retire_duplicate(peer)
+                    peers.add(peer)
+                    peers_present.set()
+                    peer.tasks = [asyncio.create_task(peer.writer()), asyncio.create_task(follow_peer(ctx, proj, peer))]
+                    if peer.version >= 2:
+                        peer.send(json.dumps({"t": "subscribePlayState", "ref": 2}))
+                elif peer not in peers:
+                    # Not yet (or no longer) a peer
+                    continue
+                elif obj["t"] == "subscribePlayState":
+                    peer.subscribed = True
+                    # Sampled now: the transport isn't polled while there are no peers
+                    pos = proj.get_play_position() - ctx.first_measure_start
+                    playing = bool(proj.get_play_state()) and pos >= 0
+                    peer.send(json.dumps({"t": "subscribePlayStateReply", "currentlyPlaying": playing, "pos": pos, "ref": obj.get("ref")}))
+                elif obj["t"] == "ping":
+                    t1 = time.time()
+                    peer.send(json.dumps({"t": "pong", "t0": obj["t0"], "t1": t1, "t2": time.time()}))
+                elif obj["t"] == "pong":
+                    peer.clock.add(obj["t0"], obj["t1"], obj["t2"], time.time())
+                    if peer.clock.count % STATS_EVERY == 1:
+                        print(f"Sync: {name}: Latency: {peer.clock.stats()}")
+                elif obj["t"] in ("playStateChanged", "subscribePlayStateReply"):
+                    # Only the latest state matters; follow_peer picks it up
+                    peer.latest_remote_state = obj
+                    peer.remote_changed.set()
+                elif "ref" in obj and obj["ref"] in peer.refs:
+                    peer.refs.pop(obj["ref"])(obj)
+            elif msg.type == aiohttp.WSMsgType.ERROR:
+                print(f"Sync: {name}: WebSocket client error")
+                break
+            else:
+                print(f"Sync: {name}: WebSocket client unknown message")
+    finally:
+        peer.close()
+    print(f"Sync: {name}: Connection done ({peer.messages_sent} messages sent, {peer.messages_received} received)")
 
 
 async def amain() -> None:
     proj = rutil.get_current_project_index_name()[0]
     ctx = Context(first_measure_start=RPR_parse_timestr_pos('1.1.00', 2))
-    server_task = asyncio.create_task(server_main(8085, ctx))
+    server_task = asyncio.create_task(server_main(8085, ctx, proj))
     local_task = asyncio.create_task(detect_local_play_pause(ctx, proj))
-    remote_task = asyncio.create_task(detect_remote_play_pause(ctx, proj))
+    ping_task = asyncio.create_task(ping_loop())
+    drift_task = asyncio.create_task(correct_drift(ctx, proj))
     async with aiohttp.ClientSession() as session:
         print("Sync: Listening on 8085, connecting to 8084")
         try:
             async with session.ws_connect('http://localhost:8084') as ws:
                 try:
-                    await handle_sync_connection(ctx, ws)
+                    await handle_sync_connection(ctx, proj, ws, "MuseScore on 8084")
                 except Exception:
                     traceback.print_exc(file=sys.stdout)
         except OSError:
             print("Sync: OSError involving websocket connection, ignoring")
     await server_task
     await local_task
-    await remote_task
+    await ping_task
+    await drift_task
 
 
 def main() -> None:
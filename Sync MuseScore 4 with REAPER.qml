@@ -10,71 +10,217 @@ MuseScore {
 
     property var playbackModel: null
 
+    // Highest musicsync protocol version we speak.
+    // Version 2 adds push-based play state subscriptions.
+    property int protocolVersion: 2
+
+    // Lets REAPER recognise our two connections to it (client and server) as one peer
+    property string instanceId: Math.random().toString(36).slice(2)
+
+    // Connections that subscribed to our play state: {server: bool, id: ..., lastSeen: ms}
+    property var subscribers: []
+
+    // REAPER pings every 2 s, so a subscriber that has been silent for this
+    // long is gone. onClose isn't available in every MuseScore version, and
+    // this is what cleans up after closed connections there.
+    property int subscriberTimeout: 10000
+
+    // Last play state pushed to subscribers (or applied from the remote)
+    property bool lastPlaying: false
+
+    Timer {
+        id: playStateTimer
+        // Local check only; nothing is sent unless the state changed
+        interval: 20
+        repeat: true
+        running: false
+        onTriggered: root.pushPlayStateIfChanged()
+    }
+
+    Timer {
+        id: staleSubscriberTimer
+        interval: 2000
+        repeat: true
+        running: false
+        onTriggered: root.dropStaleSubscribers()
+    }
+
+    function send(conn, obj) {
+        if (conn.server) {
+            api.websocketserver.send(conn.id, JSON.stringify(obj));
+        } else {
+            api.websocket.send(conn.id, JSON.stringify(obj));
+        }
+    }
+
     function onMessageToServer(id, msg) {
-        let obj = JSON.parse(msg);
-        console.log("received message: " + JSON.stringify(obj));
-        let reply = getReplyForMessage(obj);
-        if (reply == null) return;
-        api.websocketserver.send(id, JSON.stringify(reply));
+        handleMessage({"server": true, "id": id}, msg);
     }
 
     function onMessageToClient(id, msg) {
+        handleMessage({"server": false, "id": id}, msg);
+    }
+
+    function removeSubscriber(conn) {
+        subscribers = subscribers.filter(function (c) {
+            return c.server !== conn.server || c.id !== conn.id;
+        });
+    }
+
+    function updateTimers() {
+        playStateTimer.running = subscribers.length > 0;
+        staleSubscriberTimer.running = subscribers.length > 0;
+    }
+
+    function onClosed(conn) {
+        console.warn("Sync: connection closed, id: " + conn.id);
+        removeSubscriber(conn);
+        updateTimers();
+    }
+
+    function touchSubscriber(conn) {
+        for (let i = 0; i < subscribers.length; ++i) {
+            let c = subscribers[i];
+            if (c.server === conn.server && c.id === conn.id) {
+                c.lastSeen = Date.now();
+            }
+        }
+    }
+
+    function dropStaleSubscribers() {
+        let now = Date.now();
+        subscribers = subscribers.filter(function (c) {
+            if (now - c.lastSeen <= subscriberTimeout) return true;
+            console.warn("Sync: dropping silent subscriber, id: " + c.id);
+            return false;
+        });
+        updateTimers();
+    }
+
+    function handleMessage(conn, msg) {
         let obj = JSON.parse(msg);
+        touchSubscriber(conn);
         console.log("received message: " + JSON.stringify(obj));
-        let reply = getReplyForMessage(obj);
+        let reply = getReplyForMessage(conn, obj);
         if (reply == null) return;
-        api.websocket.send(id, JSON.stringify(reply));
+        send(conn, reply);
+        if (reply.t === "helloReply" && reply.version >= 2) {
+            // Subscribe to REAPER's play state as well
+            send(conn, {"t": "subscribePlayState", "ref": 2});
+        }
     }
 
-    function getReplyForMessage(obj) {
+    function isPlaying() {
         let playButton = playbackModel.items[1];
-        let currentlyPlaying = (playButton.icon === 62409); // Pause icon indicates playing
+        return (playButton.icon === 62409); // Pause icon indicates playing
+    }
+
+    function currentPos() {
+        let currentTime = playbackModel.playTime;
+        let hours = currentTime.getHours();
+        let minutes = currentTime.getMinutes();
+        let seconds = currentTime.getSeconds();
+        let ms = currentTime.getMilliseconds();
+        return hours * 3600 + minutes * 60 + seconds + (ms / 1000);
+    }
+
+    function applyPlayState(playing, pos) {
+        let currentlyPlaying = isPlaying();
+        if (playing) {
+            console.warn("Sync: Remote started playing");
+            let newTime = new Date();
+            newTime.setHours(Math.floor(pos / 3600));
+            newTime.setMinutes(Math.floor((pos % 3600) / 60));
+            newTime.setSeconds(Math.floor(pos % 60));
+            newTime.setMilliseconds((pos % 1) * 1000);
+            playbackModel.playTime = newTime;
+            if (!currentlyPlaying) {
+                cmd("play");
+            }
+        } else {
+            console.warn("Sync: Remote stopped playing");
+            if (currentlyPlaying) {
+                // "play" is toggle between play and pause...
+                cmd("play");
+            }
+        }
+        // Don't echo the change back to the remote
+        lastPlaying = playing;
+    }
+
+    function pushPlayStateIfChanged() {
+        let currentlyPlaying = isPlaying();
+        if (currentlyPlaying === lastPlaying) return;
+        lastPlaying = currentlyPlaying;
+        let event = {
+            "t": "playStateChanged",
+            "currentlyPlaying": currentlyPlaying,
+            "pos": currentPos(),
+            // Lets REAPER extrapolate our position to when it receives this
+            "sentAt": Date.now() / 1000,
+        };
+        let failed = [];
+        for (let i = 0; i < subscribers.length; ++i) {
+            try {
+                send(subscribers[i], event);
+            } catch (e) {
+                failed.push(subscribers[i]);
+            }
+        }
+        for (let i = 0; i < failed.length; ++i) {
+            onClosed(failed[i]);
+        }
+    }
+
+    function getReplyForMessage(conn, obj) {
+        let currentlyPlaying = isPlaying();
         if (obj.t === "hello") {
-            console.warn("Sync: New remote connection established");
+            let version = Math.min(obj.version || 1, protocolVersion);
+            console.warn("Sync: New remote connection established (protocol version " + version + ")");
             return {
                 "t": "helloReply",
                 "protocol": "musicsync",
-                "version": 1,
+                "version": version,
+                "instance": instanceId,
                 "ref": obj.ref,
             };
         } else if (obj.t === "getPlayState") {
-            let currentTime = playbackModel.playTime;
-            let hours = currentTime.getHours();
-            let minutes = currentTime.getMinutes();
-            let seconds = currentTime.getSeconds();
-            let ms = currentTime.getMilliseconds();
-            let pos = hours * 3600 + minutes * 60 + seconds + (ms / 1000);
             return {
                 "t": "getPlayStateReply",
                 "currentlyPlaying": currentlyPlaying,
-                "pos": pos,
+                "pos": currentPos(),
+                "sentAt": Date.now() / 1000,
                 "ref": obj.ref,
             };
         } else if (obj.t == "setPlayState") {
-            if (obj.currentlyPlaying) {
-                console.warn("Sync: Remote started playing");
-                let pos = obj.pos;
-                let newTime = new Date();
-                newTime.setHours(Math.floor(pos / 3600));
-                newTime.setMinutes(Math.floor((pos % 3600) / 60));
-                newTime.setSeconds(Math.floor(pos % 60));
-                newTime.setMilliseconds((pos % 1) * 1000);
-                playbackModel.playTime = newTime;
-                if (!currentlyPlaying) {
-                    cmd("play");
-                }
-            } else if (!obj.currentlyPlaying) {
-                console.warn("Sync: Remote stopped playing");
-                if (currentlyPlaying) {
-                    // "play" is toggle between play and pause...
-                    cmd("play");
-                }
-            }
+            applyPlayState(obj.currentlyPlaying, obj.pos);
             return {
                 "t": "setPlayStateReply",
                 "ok": true,
                 "ref": obj.ref,
             };
+        } else if (obj.t === "subscribePlayState") {
+            removeSubscriber(conn);
+            subscribers.push({"server": conn.server, "id": conn.id, "lastSeen": Date.now()});
+            lastPlaying = currentlyPlaying;
+            updateTimers();
+            return {
+                "t": "subscribePlayStateReply",
+                "currentlyPlaying": currentlyPlaying,
+                "pos": currentPos(),
+                "ref": obj.ref,
+            };
+        } else if (obj.t === "playStateChanged") {
+            applyPlayState(obj.currentlyPlaying, obj.pos);
+        } else if (obj.t === "ping") {
+            // Timestamps for REAPER's clock offset and latency estimate
+            let t1 = Date.now() / 1000;
+            return {
+                "t": "pong",
+                "t0": obj.t0,
+                "t1": t1,
+                "t2": Date.now() / 1000,
+            };
         }
         return null;
     }
@@ -89,11 +235,17 @@ MuseScore {
         api.websocketserver.listen(8084, function(id) {
             console.warn("Sync: connection from client, id: " + id);
             api.websocketserver.onMessage(id, function (msg) { root.onMessageToServer(id, msg); })
+            if (typeof api.websocketserver.onClose === "function") {
+                api.websocketserver.onClose(id, function () { root.onClosed({"server": true, "id": id}); })
+            }
         })
         console.warn("Sync: Listening on 8084, connecting to 8085");
         api.websocket.open(8085, function(id) {
             console.warn("Sync: connected to server id: " + id);
             api.websocket.onMessage(id, function (msg) { root.onMessageToClient(id, msg); })
+            if (typeof api.websocket.onClose === "function") {
+                api.websocket.onClose(id, function () { root.onClosed({"server": false, "id": id}); })
+            }
         });
     }
 }
@@ -1,9 +1,21 @@
 import asyncio
+import codecs
+import collections
+import ctypes
+import ctypes.util
 import subprocess
 import tkinter
+from dataclasses import dataclass, field
 
+import _tkinter
 
-def window_closed(tk: tkinter.Tk) -> bool:
+# Tk timers and redraws are serviced at most this often while no X events arrive
+IDLE_FPS = 30
+# tksubprocess redraws its output at most this often
+LOG_FPS = 10
+
+
+def window_closed(tk: tkinter.Misc) -> bool:
     try:
         return not tk.winfo_exists()
     except tkinter.TclError:
@@ -11,10 +23,82 @@ def window_closed(tk: tkinter.Tk) -> bool:
         return True
 
 
-async def tk_mainloop(tk: tkinter.Tk) -> None:
-    while not window_closed(tk):
-        tk.update()
-        await asyncio.sleep(0)
+_root: tkinter.Tk | None = None
+
+
+def get_root() -> tkinter.Tk:
+    """
+    The hidden Tk root shared by all dialogs in this process.
+    Creating a Tcl interpreter and connecting to the display is slow,
+    so it is only done once; dialogs are Toplevels on this root.
+    """
+    global _root
+    if _root is None or window_closed(_root):
+        _root = tkinter.Tk()
+        _root.withdraw()
+    return _root
+
+
+def display_fd(tk: tkinter.Misc) -> int | None:
+    "File descriptor of Tk's X display connection, or None if not on X11"
+    try:
+        libtk = ctypes.CDLL(_tkinter.__file__)
+        libtk.Tk_MainWindow.argtypes = [ctypes.c_void_p]
+        libtk.Tk_MainWindow.restype = ctypes.c_void_p
+        tkwin = libtk.Tk_MainWindow(tk.tk.interpaddr())
+        if not tkwin:
+            return None
+        # Tk_Display(tkwin): the Display* is the first member of Tk_FakeWin
+        display = ctypes.c_void_p.from_address(tkwin).value
+        libx11 = ctypes.CDLL(ctypes.util.find_library("X11") or "libX11.so.6")
+        libx11.XConnectionNumber.argtypes = [ctypes.c_void_p]
+        libx11.XConnectionNumber.restype = ctypes.c_int
+        return libx11.XConnectionNumber(display)
+    except (OSError, AttributeError):
+        return None
+
+
+# Everyone waiting for X events on a display connection. Each event loop
+# (concurrent actions may each run their own) watches the fd for its waiters.
+_display_waiters: dict[tuple[asyncio.AbstractEventLoop, int], set[asyncio.Event]] = {}
+
+
+def _display_readable(key: tuple[asyncio.AbstractEventLoop, int]) -> None:
+    for event in _display_waiters.get(key, ()):
+        event.set()
+
+
+async def tk_mainloop(tk: tkinter.Misc) -> None:
+    """
+    Service Tk until the window is closed. Wakes up immediately on X events,
+    and otherwise only IDLE_FPS times per second, so an open dialog
+    doesn't keep a core busy.
+    """
+    loop = asyncio.get_running_loop()
+    wakeup = asyncio.Event()
+    fd = display_fd(tk)
+    key = (loop, fd) if fd is not None else None
+    if key is not None:
+        if key not in _display_waiters:
+            _display_waiters[key] = set()
+            loop.add_reader(key[1], _display_readable, key)
+        _display_waiters[key].add(wakeup)
+    try:
+        while not window_closed(tk):
+            # Handles every pending event, so any later X traffic
+            # makes the display connection readable again.
+            tk.update()
+            wakeup.clear()
+            try:
+                await asyncio.wait_for(wakeup.wait(), 1 / IDLE_FPS)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        if key is not None:
+            _display_waiters[key].discard(wakeup)
+            if not _display_waiters[key]:
+                del _display_waiters[key]
+                loop.remove_reader(key[1])
 
 
 async def tkprompt(
@@ -25,7 +109,7 @@ async def tkprompt(
 ) -> str | None:
     from tkinter import ttk
 
-    root = tkinter.Tk()
+    root = tkinter.Toplevel(get_root())
     root.title(title)
     frm = ttk.Frame(root, padding=10)
     frm.grid()
@@ -52,15 +136,47 @@ async def tkprompt(
     return result
 
 
+@dataclass
+class LogBuffer:
+    """
+    The last max_lines lines of a terminal-style output stream.
+    A carriage return overwrites the current line, like a progress bar does.
+    """
+
+    max_lines: int = 1000
+    lines: collections.deque[str] = field(default_factory=collections.deque)
+    # Unterminated last line
+    partial: str = ""
+    dirty: bool = False
+
+    def __post_init__(self) -> None:
+        self.lines = collections.deque(self.lines, maxlen=self.max_lines)
+
+    def feed(self, text: str) -> None:
+        *complete, partial = (self.partial + text).split("\n")
+        for line in complete:
+            self.lines.append(line.rstrip("\r").rpartition("\r")[2])
+        # Only keep what's after the last carriage return
+        head, cr, tail = partial[:-1].rpartition("\r")
+        self.partial = tail + partial[-1:] if cr else partial
+        self.dirty = True
+
+    @property
+    def text(self) -> str:
+        current = self.partial.rstrip("\r").rpartition("\r")[2]
+        return "\n".join((*self.lines, current))
+
+
 async def tksubprocess(
     cmdline: list[str] | tuple[str, ...],
     *,
     title: str = "Terminak",
     stderr: int | None = subprocess.STDOUT,
+    max_lines: int = 1000,
 ) -> int | None:
     from tkinter import ttk
 
-    root = tkinter.Tk()
+    root = tkinter.Toplevel(get_root())
     root.title(title)
     frm = ttk.Frame(root, padding=10)
     frm.grid()
@@ -71,21 +187,38 @@ async def tksubprocess(
         *cmdline, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=stderr
     )
 
+    log = LogBuffer(max_lines)
+
+    def redraw() -> None:
+        if log.dirty:
+            log.dirty = False
+            textwidget.delete("1.0", "end")
+            textwidget.insert("end", log.text)
+            textwidget.see("end")
+
     async def process_stdout() -> None:
         assert p.stdout is not None
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
         while True:
-            line = await p.stdout.readline()
-            if not line:
+            # Not readline(), since progress bars only end lines with \r
+            chunk = await p.stdout.read(1 << 16)
+            if not chunk:
                 await p.wait()
                 break
-            textwidget.insert("end", line.decode("utf-8", errors="replace"))
-            textwidget.see("end")
+            log.feed(decoder.decode(chunk))
+
+    async def redraw_loop() -> None:
+        while True:
+            redraw()
+            await asyncio.sleep(1 / LOG_FPS)
 
     process_stdout_task = asyncio.create_task(process_stdout())
     mainloop_task = asyncio.create_task(tk_mainloop(root))
+    redraw_task = asyncio.create_task(redraw_loop())
     done, pending = await asyncio.wait(
         (process_stdout_task, mainloop_task), return_when=asyncio.FIRST_COMPLETED
     )
+    redraw_task.cancel()
     if mainloop_task in pending:
         root.destroy()
         await mainloop_task
@@ -1,9 +1,12 @@
+import asyncio
 import os
+import subprocess
 from dataclasses import dataclass
 
 import aiotk
 import rutil
-from rutil import TimeRange, RMediaItem
+import silence
+from rutil import TimeRange, RMediaItem, RMediaSource
 
 
 @dataclass
@@ -58,6 +61,59 @@ async def cut_source_slice_into_new_file(s: SourceSlice) -> SourceSlice:
     )
 
 
+async def build_peaks(path: str) -> None:
+    """
+    Build REAPER's peak file for `path` a little at a time,
+    so that a subsequent RPR_InsertMedia doesn't block the GUI building peaks.
+
+    This is REAPER's own incremental builder, not a background process: the
+    .reapeaks format isn't documented, so only REAPER can write it reliably.
+    Each step runs on REAPER's main thread, one step per defer cycle, so the
+    GUI still pauses for the length of a step (how much REAPER reads per step
+    is up to REAPER). That is shorter than the one long stall on insert, but
+    the total work on the main thread is the same.
+    """
+    src = RMediaSource.from_file(path)
+    try:
+        if not src.build_peaks(0):
+            # Peaks are already up to date
+            return
+        while src.build_peaks(1):
+            await asyncio.sleep(0)
+        src.build_peaks(2)
+    finally:
+        src.destroy()
+
+
+async def build_peaks_all(
+    paths: list[str], started: dict[str, asyncio.Task[None]] | None = None
+) -> None:
+    "Build peaks for all paths, waiting for those already `started` instead"
+    started = started or {}
+    tasks = {p: started.get(p) or asyncio.create_task(build_peaks(p)) for p in paths}
+    await asyncio.gather(*tasks.values())
+
+
+async def run_ffmpeg(cmdline: list[str]) -> str:
+    "Run ffmpeg and return its stderr, which is where it prints its analysis"
+    proc = await asyncio.subprocess.create_subprocess_exec(
+        *cmdline, stdin=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    _, stderr_bytes = await proc.communicate()
+    if proc.returncode:
+        raise Exception(f"ffmpeg exited with code {proc.returncode}")
+    return stderr_bytes.decode(errors="replace")
+
+
+async def detect_nonsilent_spans(
+    path: str, start: float, end: float
+) -> list[silence.Span] | None:
+    "Non-silent spans of the slice, or None if skipping silence isn't worthwhile"
+    output = await run_ffmpeg(silence.silencedetect_cmdline(path, start, end))
+    spans = silence.parse_silencedetect(output, end - start)
+    return spans if silence.worthwhile(spans, end - start) else None
+
+
 def script_get_selected_audio_source(
     item: RMediaItem, inside_time_selection: bool = True
 ) -> SourceSlice:
@@ -0,0 +1,713 @@
+"""
+Client for the LALAL.AI API using keep-alive HTTP connections.
+
+Used by lalalcli. Only depends on the standard library, so that lalalcli
+can run outside REAPER with any Python 3.10+.
+"""
+
+import concurrent.futures
+import hashlib
+import http.client
+import json
+import os
+import subprocess
+import threading
+import time
+import urllib.parse
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, TypeVar
+
+import silence
+
+T = TypeVar("T")
+
+DEFAULT_BASE_URL = "https://www.lalal.ai"
+DEFAULT_QUEUE_FILE = os.path.expanduser("~/.cache/lalalqueue.json")
+
+
+class HTTPError(Exception):
+    def __init__(
+        self, status: int, body: bytes, headers: dict[str, str] | None = None
+    ) -> None:
+        super().__init__(f"HTTP {status}: {body[:200].decode(errors='replace')}")
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+
+class TransientHTTPError(HTTPError):
+    "Server-side error that is worth retrying"
+
+
+class NotSentError(ConnectionError):
+    "The connection failed before the whole request was sent"
+
+
+class StaleDownload(Exception):
+    "The partial download doesn't fit what the server sends"
+
+
+RETRYABLE = (OSError, http.client.HTTPException, TransientHTTPError)
+
+
+def retry(
+    fn: Callable[[], T],
+    *,
+    attempts: int = 5,
+    backoff: float = 0.5,
+    retry_on: tuple[type[Exception], ...] = RETRYABLE,
+) -> T:
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except retry_on as exc:
+            if attempt + 1 == attempts:
+                raise
+            delay = backoff * 2**attempt
+            print(f"{exc!r}, retrying in {delay:.1f} s", flush=True)
+            time.sleep(delay)
+    raise AssertionError("unreachable")
+
+
+@dataclass
+class HTTPPool:
+    "Reuses one idle keep-alive connection per host between requests"
+
+    timeout: float = 60
+    _idle: dict[tuple[str, str], list[http.client.HTTPConnection]] = field(
+        default_factory=dict
+    )
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def _get(
+        self, scheme: str, netloc: str, fresh: bool = False
+    ) -> http.client.HTTPConnection:
+        with self._lock:
+            conns = self._idle.get((scheme, netloc))
+            if conns and not fresh:
+                return conns.pop()
+        if scheme == "https":
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        assert scheme == "http"
+        return http.client.HTTPConnection(netloc, timeout=self.timeout)
+
+    def _put(self, scheme: str, netloc: str, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            self._idle.setdefault((scheme, netloc), []).append(conn)
+
+    def close(self) -> None:
+        with self._lock:
+            for conns in self._idle.values():
+                for conn in conns:
+                    conn.close()
+            self._idle.clear()
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        body: bytes | BinaryIO | Iterable[bytes] | None = None,
+        headers: dict[str, str] | None = None,
+        *,
+        sink: Callable[[http.client.HTTPResponse], T] | None = None,
+        fresh: bool = False,
+    ) -> tuple[int, dict[str, str], Any]:
+        """
+        Send one request. An iterable body without Content-Length is sent
+        with chunked transfer encoding. The response body is returned
+        as bytes, or passed to `sink` for streaming consumption.
+        With `fresh`, the request goes over a new connection rather than an
+        idle one, which the server may have closed in the meantime.
+        """
+        u = urllib.parse.urlsplit(url)
+        path = u.path or "/"
+        if u.query:
+            path += "?" + u.query
+        conn = self._get(u.scheme, u.netloc, fresh)
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+        except (OSError, http.client.HTTPException) as exc:
+            conn.close()
+            raise NotSentError(f"{method} {url}: {exc!r}") from exc
+        except BaseException:
+            # E.g. the body iterator's SystemExit: don't reuse a half-sent request
+            conn.close()
+            raise
+        try:
+            resp = conn.getresponse()
+            if sink is not None and 200 <= resp.status < 300:
+                result: Any = sink(resp)
+            else:
+                result = resp.read()
+            resp_headers = {k.lower(): v for k, v in resp.getheaders()}
+        except BaseException:
+            conn.close()
+            raise
+        if resp.will_close:
+            conn.close()
+        else:
+            self._put(u.scheme, u.netloc, conn)
+        if resp.status >= 500 or resp.status == 429:
+            raise TransientHTTPError(resp.status, result, resp_headers)
+        if resp.status >= 400:
+            raise HTTPError(resp.status, result, resp_headers)
+        return resp.status, resp_headers, result
+
+    def download(self, url: str, path: str, *, chunk_size: int = 1 << 16) -> None:
+        """
+        Download to `path` via a part file named after the URL, resuming a
+        partial download. The part file is only appended to when the server
+        sends exactly the missing range of a file of the same length.
+        """
+        digest = hashlib.sha256(url.encode()).hexdigest()[:16]
+        partpath = f"{path}.{digest}.part"
+
+        def fetch() -> None:
+            try:
+                have = os.path.getsize(partpath)
+            except FileNotFoundError:
+                have = 0
+            headers = {"Range": f"bytes={have}-"} if have else {}
+            total = None
+
+            def sink(resp: http.client.HTTPResponse) -> None:
+                nonlocal total
+                if resp.status == 206:
+                    first, total = parse_content_range(resp.getheader("Content-Range"))
+                    if first != have:
+                        raise StaleDownload(
+                            f"{url}: asked for byte {have}, got {first}"
+                        )
+                else:
+                    # The server ignored the Range header: start over
+                    length = resp.getheader("Content-Length")
+                    total = int(length) if length is not None else None
+                with open(partpath, "ab" if resp.status == 206 else "wb") as fp:
+                    while chunk := resp.read(chunk_size):
+                        fp.write(chunk)
+
+            try:
+                self.request("GET", url, headers=headers, sink=sink)
+            except HTTPError as exc:
+                if exc.status != 416:
+                    raise
+                # Range not satisfiable: the part file may already be complete
+                _, total = parse_content_range(exc.headers.get("content-range"))
+                if total is None:
+                    raise StaleDownload(f"{url}: no length in 416 response")
+            if total is not None and os.path.getsize(partpath) != total:
+                raise StaleDownload(
+                    f"{url}: have {os.path.getsize(partpath)} of {total} bytes"
+                )
+
+        def attempt() -> None:
+            try:
+                fetch()
+            except StaleDownload as exc:
+                print(f"{exc}, downloading again", flush=True)
+                os.remove(partpath)
+                fetch()
+
+        retry(attempt)
+        os.replace(partpath, path)
+
+
+def parse_content_range(value: str | None) -> tuple[int | None, int | None]:
+    "First byte and total length from a Content-Range like `bytes 10-99/100`"
+    if value is None:
+        return None, None
+    unit, _, rest = value.strip().partition(" ")
+    span, _, total = rest.partition("/")
+    if unit != "bytes":
+        return None, None
+    first = span.partition("-")[0]
+    return (
+        int(first) if first.isdigit() else None,
+        int(total) if total.isdigit() else None,
+    )
+
+
+def encode_multipart(fields: dict[str, str]) -> tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    parts = [
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{k}"\r\n\r\n{v}\r\n'
+        for k, v in fields.items()
+    ]
+    body = "".join(parts) + f"--{boundary}--\r\n"
+    return body.encode(), f"multipart/form-data; boundary={boundary}"
+
+
+class APIError(Exception):
+    pass
+
+
+@dataclass
+class LalalClient:
+    apikey: str
+    base_url: str = field(
+        default_factory=lambda: os.environ.get("LALAL_API_URL", DEFAULT_BASE_URL)
+    )
+    pool: HTTPPool = field(default_factory=HTTPPool)
+
+    def _json(self, resp_bytes: bytes) -> Any:
+        try:
+            obj = json.loads(resp_bytes)
+            if obj["status"] != "success":
+                raise APIError(obj.get("error") or obj)
+        except (ValueError, KeyError, TypeError):
+            raise APIError(resp_bytes.decode("utf-8", errors="replace"))
+        return obj
+
+    def _post_form(
+        self,
+        endpoint: str,
+        fields: dict[str, str],
+        retry_on: tuple[type[Exception], ...] = RETRYABLE,
+        fresh: bool = False,
+    ) -> Any:
+        body, content_type = encode_multipart(fields)
+        headers = {
+            "Authorization": f"license {self.apikey}",
+            "Content-Type": content_type,
+        }
+        _status, _headers, resp_bytes = retry(
+            lambda: self.pool.request(
+                "POST", f"{self.base_url}{endpoint}", body, headers, fresh=fresh
+            ),
+            retry_on=retry_on,
+        )
+        return self._json(resp_bytes)
+
+    def get_limits(self) -> Any:
+        url = f"{self.base_url}/billing/get-limits/?key={self.apikey}"
+        _status, _headers, resp_bytes = retry(lambda: self.pool.request("GET", url))
+        return self._json(resp_bytes)
+
+    def upload(self, filename: str, path: str) -> Any:
+        def attempt() -> tuple[int, dict[str, str], bytes]:
+            with open(path, "rb") as fp:
+                return self.pool.request(
+                    "POST",
+                    f"{self.base_url}/api/upload/",
+                    fp,
+                    {
+                        "Content-Disposition": f"attachment; filename={filename}",
+                        "Authorization": f"license {self.apikey}",
+                        "Content-Length": str(os.path.getsize(path)),
+                    },
+                )
+
+        _status, _headers, resp_bytes = retry(attempt)
+        return self._json(resp_bytes)
+
+    def upload_chunks(
+        self, filename: str, make_chunks: Callable[[], Iterable[bytes]]
+    ) -> Any:
+        """
+        Upload a body of unknown length using chunked transfer encoding.
+        make_chunks is called again for each retry, so it must be repeatable.
+        """
+        _status, _headers, resp_bytes = retry(
+            lambda: self.pool.request(
+                "POST",
+                f"{self.base_url}/api/upload/",
+                make_chunks(),
+                {
+                    "Content-Disposition": f"attachment; filename={filename}",
+                    "Authorization": f"license {self.apikey}",
+                },
+            )
+        )
+        return self._json(resp_bytes)
+
+    def split(self, params: list[dict[str, Any]]) -> Any:
+        # Not idempotent: a request the server may have received could start
+        # a second, billed split, so only retry if it was never sent. A fresh
+        # connection can't have been closed by the server while it was idle.
+        return self._post_form(
+            "/api/split/",
+            {"params": json.dumps(params)},
+            retry_on=(NotSentError,),
+            fresh=True,
+        )
+
+    def check(self, file_ids: list[str]) -> dict[str, Any]:
+        "Status of each of the given uploads, keyed by file id"
+        return self._post_form("/api/check/", {"id": ",".join(file_ids)})["result"]
+
+    def wait_for_split(
+        self,
+        file_id: str,
+        on_progress: Callable[[str], None] = lambda progress: None,
+    ) -> dict[str, Any]:
+        poller = Poller()
+        while True:
+            check_result = self.check([file_id])[file_id]
+            if check_result.get("status") != "success":
+                raise APIError(check_result)
+            split_result = check_result.get("split")
+            if split_result:
+                return split_result
+            task_result = check_result.get("task") or {}
+            progress = task_result.get("progress")
+            on_progress(str(progress or "?"))
+            time.sleep(poller.next_interval(progress))
+
+    def download_all(self, downloads: list[tuple[str, str]]) -> None:
+        "Download (url, path) pairs concurrently"
+        with concurrent.futures.ThreadPoolExecutor(len(downloads) or 1) as executor:
+            futures = [
+                executor.submit(self.pool.download, url, path)
+                for url, path in downloads
+            ]
+            for f in futures:
+                f.result()
+
+
+@dataclass
+class Poller:
+    """
+    Adapts the status polling interval to the rate of reported progress:
+    poll rarely while far from done, and often when close to finishing.
+    """
+
+    min_interval: float = 0.5
+    max_interval: float = 10.0
+    interval: float = 1.0
+    _last: tuple[float, float] | None = None
+
+    def next_interval(self, progress: Any) -> float:
+        now = time.monotonic()
+        if not isinstance(progress, int | float):
+            return self.interval
+        if self._last is not None:
+            t0, p0 = self._last
+            if progress > p0 and now > t0:
+                rate = (progress - p0) / (now - t0)
+                remaining = (100 - progress) / rate
+                # Aim for a few polls over the estimated remaining time
+                self.interval = remaining / 4
+            else:
+                # No progress since last poll: back off
+                self.interval *= 1.5
+        self._last = (now, progress)
+        self.interval = min(self.max_interval, max(self.min_interval, self.interval))
+        return self.interval
+
+
+@dataclass
+class Encoder:
+    """
+    Runs the encoder and yields its stdout as it is produced,
+    so the upload can start before encoding has finished.
+    Memory use is bounded by chunk_size.
+    """
+
+    cmdline: list[str]
+    chunk_size: int = 1 << 16
+    proc: subprocess.Popen[bytes] | None = None
+    cancelled: bool = False
+
+    def chunks(self) -> Iterator[bytes]:
+        if self.cancelled:
+            raise SystemExit(1)
+        with subprocess.Popen(
+            self.cmdline, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE
+        ) as self.proc:
+            if self.cancelled:
+                # terminate() ran while the process was starting
+                self.proc.terminate()
+            assert self.proc.stdout is not None
+            while chunk := self.proc.stdout.read1(self.chunk_size):
+                yield chunk
+        if self.proc.returncode:
+            raise SystemExit(f"processing failed (exit code {self.proc.returncode})")
+
+    def terminate(self) -> None:
+        self.cancelled = True
+        if self.proc is not None:
+            self.proc.terminate()
+
+
+def flac_encoder(
+    filename: str, start: float, end: float, spans: list[silence.Span] | None = None
+) -> Encoder:
+    # FLAC to a pipe: ffmpeg can't seek back to finalize the STREAMINFO header,
+    # which only means the header lacks the total sample count and MD5.
+    if spans:
+        outargs = ["-f", "flac", "pipe:1"]
+        return Encoder(silence.compact_cmdline(filename, spans, start, outargs))
+    return Encoder(
+        [
+            "ffmpeg",
+            "-v",
+            "fatal",
+            "-i",
+            filename,
+            "-ss",
+            str(start),
+            "-to",
+            str(end),
+            "-f",
+            "flac",
+            "pipe:1",
+        ]
+    )
+
+
+def stem_paths(basename: str, stem: str) -> tuple[str, str]:
+    "Output paths of the stem and of the rest, distinct for every stem"
+    fmt = f"{basename}_{{}}_split_by_lalalai.flac"
+    return fmt.format(stem), fmt.format(f"no_{stem}")
+
+
+@dataclass
+class QueueJob:
+    filename: str
+    start: float
+    end: float
+    stem: str
+    stem_track: str
+    back_track: str
+    # Progress, persisted so that an interrupted queue can be resumed
+    file_id: str | None = None
+    split_requested: bool = False
+    done: bool = False
+    # Why the job failed; failed jobs are skipped and then pruned
+    failed: str | None = None
+    # Non-silent spans, if only those are uploaded
+    silence_checked: bool = False
+    spans: list[silence.Span] | None = None
+
+    @property
+    def key(self) -> tuple[str, float, float, str, str]:
+        return (self.filename, self.start, self.end, self.stem, self.stem_track)
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    @property
+    def billed_duration(self) -> float:
+        return silence.total_length(self.spans) if self.spans else self.duration
+
+    def detect_silence(self) -> None:
+        if self.silence_checked:
+            return
+        proc = subprocess.run(
+            silence.silencedetect_cmdline(self.filename, self.start, self.end),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            check=True,
+        )
+        spans = silence.parse_silencedetect(
+            proc.stderr.decode(errors="replace"), self.duration
+        )
+        if silence.worthwhile(spans, self.duration):
+            self.spans = spans
+        self.silence_checked = True
+
+
+@dataclass
+class LalalQueue:
+    """
+    Any number of (slice, stem) split jobs, stored in a JSON file.
+    The file is rewritten after every step, and jobs that were already
+    split are never split again, so running the queue again after an
+    interruption does not pay for finished jobs a second time.
+    """
+
+    path: str
+    jobs: list[QueueJob] = field(default_factory=list)
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    @classmethod
+    def load(cls, path: str) -> "LalalQueue":
+        try:
+            with open(path) as fp:
+                jobs = [QueueJob(**j) for j in json.load(fp)]
+            for job in jobs:
+                # JSON has no tuples
+                if job.spans is not None:
+                    job.spans = [(a, b) for a, b in job.spans]
+        except FileNotFoundError:
+            jobs = []
+        return cls(path, jobs)
+
+    def save(self) -> None:
+        with self._lock:
+            with open(f"{self.path}.tmp", "w") as fp:
+                json.dump([asdict(j) for j in self.jobs], fp, indent=1)
+            os.replace(f"{self.path}.tmp", self.path)
+
+    def add(self, job: QueueJob) -> None:
+        "Add job, unless an identical job is already queued"
+        if all(j.key != job.key for j in self.jobs):
+            self.jobs.append(job)
+
+    def prune(self) -> None:
+        self.jobs = [j for j in self.jobs if not j.done and j.failed is None]
+
+    @property
+    def pending(self) -> list[QueueJob]:
+        return [j for j in self.jobs if not j.done and j.failed is None]
+
+    @property
+    def failed(self) -> list[QueueJob]:
+        return [j for j in self.jobs if j.failed is not None]
+
+    def fail(self, job: QueueJob, error: BaseException | str) -> None:
+        "Set the job aside, so that it doesn't hold up the rest of the queue"
+        job.failed = error if isinstance(error, str) else repr(error)
+        print(f"Failed: {job.stem} of {job.filename}: {job.failed}", flush=True)
+        self.save()
+
+    def detect_silence(self) -> None:
+        "Find silence to skip in the jobs that haven't been uploaded yet"
+        for job in self.pending:
+            if job.file_id is None and not job.silence_checked:
+                try:
+                    job.detect_silence()
+                except (OSError, subprocess.CalledProcessError) as exc:
+                    self.fail(job, exc)
+                    continue
+                if job.spans:
+                    skipped = job.duration - job.billed_duration
+                    print(f"Skipping {skipped:.1f} s of silence in {job.filename}")
+        self.save()
+
+    def run(
+        self,
+        client: LalalClient,
+        split_params: dict[str, Any],
+        *,
+        concurrency: int = 4,
+    ) -> list[QueueJob]:
+        """
+        Run the pending jobs. A job that fails is marked as failed and the
+        others carry on; the failed jobs are returned.
+        """
+        pending = self.pending
+        if not pending:
+            return self.failed
+        with concurrent.futures.ThreadPoolExecutor(
+            concurrency
+        ) as uploader, concurrent.futures.ThreadPoolExecutor(concurrency) as downloader:
+            submitted = [
+                uploader.submit(
+                    self._guard, job, self._upload_and_split, client, job, split_params
+                )
+                for job in pending
+                if not job.split_requested
+            ]
+            downloads: dict[int, concurrent.futures.Future[None]] = {}
+            poller = Poller()
+            while True:
+                for f in submitted:
+                    if f.done():
+                        # Raise cancellation
+                        f.result()
+                for f in downloads.values():
+                    if f.done():
+                        f.result()
+                polling = [
+                    j
+                    for j in pending
+                    if j.split_requested
+                    and j.file_id
+                    and j.failed is None
+                    and id(j) not in downloads
+                ]
+                if not polling and all(f.done() for f in submitted):
+                    break
+                progress: list[float] = []
+                if polling:
+                    results = client.check([j.file_id for j in polling if j.file_id])
+                    for job in polling:
+                        assert job.file_id is not None
+                        result = results.get(job.file_id) or {}
+                        if result.get("status") != "success":
+                            # E.g. the upload expired before it was split
+                            self.fail(job, str(result.get("error") or result))
+                            continue
+                        split_result = result.get("split")
+                        if split_result:
+                            print(f"Done: {job.stem} of {job.filename}", flush=True)
+                            downloads[id(job)] = downloader.submit(
+                                self._guard,
+                                job,
+                                self._download,
+                                client,
+                                job,
+                                split_result,
+                            )
+                        else:
+                            p = (result.get("task") or {}).get("progress")
+                            progress.append(p if isinstance(p, int | float) else 0)
+                if progress:
+                    print(
+                        f"Progress: {' '.join(f'{p}%' for p in progress)}", flush=True
+                    )
+                    interval = poller.next_interval(sum(progress) / len(progress))
+                else:
+                    interval = poller.min_interval
+                time.sleep(interval)
+            for f in downloads.values():
+                f.result()
+        return self.failed
+
+    def _guard(self, job: QueueJob, fn: Callable[..., None], *args: Any) -> None:
+        "Call fn, failing the job if it raises"
+        try:
+            fn(*args)
+        except SystemExit as exc:
+            # Encoder failures exit with a message; other exits are cancellation
+            if not isinstance(exc.code, str):
+                raise
+            self.fail(job, exc.code)
+        except Exception as exc:
+            self.fail(job, exc)
+
+    def _upload_and_split(
+        self, client: LalalClient, job: QueueJob, split_params: dict[str, Any]
+    ) -> None:
+        if job.file_id is None:
+            bn = os.path.splitext(os.path.basename(job.filename))[0]
+            encoder = flac_encoder(job.filename, job.start, job.end, job.spans)
+            print(f"Uploading {bn} {job.start:.1f}-{job.end:.1f}...", flush=True)
+            upload_response = client.upload_chunks(f"{bn}.flac", encoder.chunks)
+            job.file_id = upload_response["id"]
+            self.save()
+        client.split([{"id": job.file_id, "stem": job.stem, **split_params}])
+        job.split_requested = True
+        self.save()
+
+    def _download(
+        self, client: LalalClient, job: QueueJob, split_result: dict[str, Any]
+    ) -> None:
+        paths = [job.stem_track, job.back_track]
+        if job.spans:
+            # Download the compacted stems, then put the silence back
+            downloads = [f"{p}.compact.flac" for p in paths]
+        else:
+            downloads = paths
+        client.download_all(
+            [
+                (split_result["stem_track"], downloads[0]),
+                (split_result["back_track"], downloads[1]),
+            ]
+        )
+        if job.spans:
+            for compact, path in zip(downloads, paths):
+                subprocess.run(
+                    silence.expand_cmdline(
+                        compact, job.spans, job.duration, ["-y", path]
+                    ),
+                    stdin=subprocess.DEVNULL,
+                    check=True,
+                )
+                os.remove(compact)
+        job.done = True
+        self.save()
@@ -0,0 +1,236 @@
+"""
+Local stand-in for the LALAL.AI API, for trying out lalalcli without credits.
+
+Implements the get-limits, upload, split and check endpoints and serves
+deterministic fake stems with Range support. Usage:
+
+    python3 lalalstub.py --port 8086 &
+    LALAL_API_URL=http://localhost:8086 ./lalalcli -n song.flac 0 30 v.flac b.flac
+
+--fail-every N makes every Nth request fail with HTTP 503,
+to exercise lalalcli's retries.
+"""
+
+import argparse
+import hashlib
+import http.server
+import itertools
+import json
+import threading
+import time
+import urllib.parse
+import uuid
+from dataclasses import dataclass, field
+from email.parser import BytesParser
+from email.policy import HTTP
+from typing import Any
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--port", type=int, default=8086)
+parser.add_argument("--split-seconds", type=float, default=5.0)
+parser.add_argument("--fail-every", type=int, default=0)
+
+
+@dataclass
+class Upload:
+    data: bytes
+    filename: str
+    split_started: float | None = None
+    params: dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class StubState:
+    split_seconds: float = 5.0
+    fail_every: int = 0
+    uploads: dict[str, Upload] = field(default_factory=dict)
+    requests: itertools.count = field(default_factory=itertools.count)
+    connections: set[int] = field(default_factory=set)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def stem_bytes(self, file_id: str, track: str) -> bytes:
+        "Fake stem: a deterministic function of the uploaded bytes"
+        digest = hashlib.sha256(self.uploads[file_id].data + track.encode()).digest()
+        return digest * (1 + len(self.uploads[file_id].data) // len(digest))
+
+
+def parse_form(content_type: str, body: bytes) -> dict[str, str]:
+    msg = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + body
+    )
+    return {
+        part.get_param("name", header="content-disposition"): part.get_content()
+        for part in msg.iter_parts()
+    }
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "StubServer"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    @property
+    def state(self) -> StubState:
+        return self.server.state
+
+    def read_body(self) -> bytes | None:
+        "Returns None if the client aborted a chunked body"
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return None
+                size = int(line.split(b";")[0], 16)
+                if not size:
+                    self.rfile.readline()
+                    return b"".join(chunks)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def send(self, status: int, body: bytes, headers: dict[str, str] = {}) -> None:
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, obj: Any) -> None:
+        self.send(200, json.dumps(obj).encode(), {"Content-Type": "application/json"})
+
+    def should_fail(self) -> bool:
+        with self.state.lock:
+            self.state.connections.add(id(self.connection))
+            n = next(self.state.requests)
+        return bool(self.state.fail_every) and n % self.state.fail_every == 1
+
+    def do_GET(self) -> None:
+        u = urllib.parse.urlsplit(self.path)
+        if self.should_fail():
+            self.send(503, b"try again")
+        elif u.path == "/billing/get-limits/":
+            self.send_json(
+                {
+                    "status": "success",
+                    "email": "stub@localhost",
+                    "process_duration_left": 100,
+                }
+            )
+        elif u.path.startswith("/media/"):
+            _, _, file_id, track = u.path.split("/")
+            if file_id not in self.state.uploads:
+                self.send(404, b"")
+                return
+            data = self.state.stem_bytes(file_id, track)
+            if rng := self.headers.get("Range"):
+                start = int(rng.removeprefix("bytes=").split("-")[0])
+                if start >= len(data):
+                    self.send(416, b"", {"Content-Range": f"bytes */{len(data)}"})
+                    return
+                content_range = f"bytes {start}-{len(data) - 1}/{len(data)}"
+                self.send(206, data[start:], {"Content-Range": content_range})
+            else:
+                self.send(200, data)
+        else:
+            self.send(404, b"")
+
+    def do_POST(self) -> None:
+        u = urllib.parse.urlsplit(self.path)
+        body = self.read_body()
+        if body is None:
+            print("Upload aborted by client")
+            self.close_connection = True
+            return
+        # lalalcli doesn't retry splits, which aren't idempotent
+        if u.path != "/api/split/" and self.should_fail():
+            self.send(503, b"try again")
+            return
+        if u.path == "/api/upload/":
+            disposition = self.headers.get("Content-Disposition", "")
+            filename = disposition.partition("filename=")[2]
+            file_id = uuid.uuid4().hex
+            with self.state.lock:
+                self.state.uploads[file_id] = Upload(body, filename)
+            # Compare against e.g. `ffmpeg ... -f flac - | sha256sum`
+            digest = hashlib.sha256(body).hexdigest()
+            chunked = "Content-Length" not in self.headers
+            print(f"Upload {file_id}: {filename} {len(body)} bytes {chunked=} {digest}")
+            self.send_json(
+                {
+                    "status": "success",
+                    "id": file_id,
+                    "size": len(body),
+                    "name": filename,
+                }
+            )
+        elif u.path == "/api/split/":
+            form = parse_form(self.headers["Content-Type"], body)
+            for params in json.loads(form["params"]):
+                upload = self.state.uploads.get(params["id"])
+                if upload is None:
+                    self.send_json({"status": "error", "error": "unknown id"})
+                    return
+                upload.split_started = time.monotonic()
+                upload.params = params
+            self.send_json({"status": "success"})
+        elif u.path == "/api/check/":
+            form = parse_form(self.headers["Content-Type"], body)
+            result = {file_id: self.check(file_id) for file_id in form["id"].split(",")}
+            self.send_json({"status": "success", "result": result})
+        else:
+            self.send(404, b"")
+
+    def check(self, file_id: str) -> dict[str, Any]:
+        upload = self.state.uploads.get(file_id)
+        if upload is None:
+            return {"status": "error", "error": "unknown id"}
+        if upload.split_started is None:
+            return {"status": "success", "split": None, "task": None}
+        elapsed = time.monotonic() - upload.split_started
+        if elapsed < self.state.split_seconds:
+            progress = int(100 * elapsed / self.state.split_seconds)
+            return {
+                "status": "success",
+                "split": None,
+                "task": {"state": "progress", "progress": progress},
+            }
+        base = f"http://{self.headers['Host']}/media/{file_id}"
+        return {
+            "status": "success",
+            "split": {
+                "stem": upload.params.get("stem"),
+                "stem_track": f"{base}/stem_track",
+                "back_track": f"{base}/back_track",
+            },
+            "task": {"state": "success"},
+        }
+
+
+class StubServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int, state: StubState) -> None:
+        super().__init__(("localhost", port), Handler)
+        self.state = state
+
+
+def main() -> None:
+    args = parser.parse_args()
+    state = StubState(split_seconds=args.split_seconds, fail_every=args.fail_every)
+    server = StubServer(args.port, state)
+    print(
+        f"LALAL stand-in listening on http://localhost:{server.server_port}",
+        flush=True,
+    )
+    try:
+        server.serve_forever()
+    finally:
+        print(f"{len(state.uploads)} uploads over {len(state.connections)} connections")
+
+
+if __name__ == "__main__":
+    main()
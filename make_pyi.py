@@ -1,8 +1,25 @@
-"Generate reaper_python.pyi"
+"""
+Generate reaper_python.pyi, or with --stand-in, reaper_python_sim.py:
 
+    python3 make_pyi.py > reaper_python.pyi
+    python3 make_pyi.py --stand-in > reaper_python_sim.py
+
+The stand-in has every function of the ReaScript API with its parameters,
+forwarding to reapersim.Sim and counted and timed by reapersim.bridge;
+reapersim.install() makes it importable as reaper_python.
+"""
+
+import argparse
 import collections
+import keyword
 import re
 import urllib.request
+from typing import Iterator, NamedTuple
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--stand-in", action="store_true", help="generate reaper_python_sim.py instead"
+)
 
 
 def get_reascripthelp() -> bytes:
@@ -55,14 +72,19 @@ reapertypes.update(
 varnames = {"in": "in_"}
 
 
-def main() -> None:
-    print("from typing import NewType\n\n")
-    for v in reapertypes.values():
-        v = v.split()[0]
-        if v not in dir(__builtins__):
-            print(f'{v} = NewType("{v}", object)')
-    print("\n")
-    for line in get_reascripthelp().decode().splitlines():
+def varname(p: str) -> str:
+    return varnames.get(p, f"{p}_" if keyword.iskeyword(p) else p)
+
+
+class Function(NamedTuple):
+    name: str
+    # (parameter name, type)
+    params: list[tuple[str, str]]
+    returns: str
+
+
+def parse_functions(html: bytes) -> Iterator[Function]:
+    for line in html.decode().splitlines():
         if not line.startswith('<div class="p_func">'):
             continue
         c = line[line.index("<code>") : line.index("</code>")].removeprefix("<code>")
@@ -100,13 +122,44 @@ def main() -> None:
             paramstr = paramstr.strip(")")
             params = [p.split()[-1] for p in paramstr.split(",")] if paramstr else []
         funname = f.split("(")[0].strip()
-        plist = ", ".join(
-            f"{varnames.get(p, p)}: {reapertypes[typs[p]]}" for p in params
+        yield Function(
+            funname, [(varname(p), reapertypes[typs[p]]) for p in params], ot
         )
-        print(f"def {funname}({plist}) -> {ot}: ...")
+
+
+def print_pyi(functions: list[Function]) -> None:
+    print("from typing import NewType\n\n")
+    for v in reapertypes.values():
+        v = v.split()[0]
+        if v not in dir(__builtins__):
+            print(f'{v} = NewType("{v}", object)')
+    print("\n")
+    for fn in functions:
+        plist = ", ".join(f"{p}: {t}" for p, t in fn.params)
+        print(f"def {fn.name}({plist}) -> {fn.returns}: ...")
     if "?" in reapertypes.values():
         print("\n".join(f'"{v}": "{v}",' for v, t in reapertypes.items() if t == "?"))
 
 
+def print_stand_in(functions: list[Function]) -> None:
+    print('"Generated by make_pyi.py --stand-in, see reapersim.py"\n')
+    print("import reapersim as _reapersim")
+    print("from reapersim import bridge as _bridge\n")
+    print("_sim = _reapersim.sim")
+    for fn in functions:
+        args = ", ".join(p for p, _ in fn.params)
+        print(f"\n\n@_bridge\ndef {fn.name}({args}):")
+        print(f"    return _sim.{fn.name}({args})")
+
+
+def main() -> None:
+    args = parser.parse_args()
+    functions = list(parse_functions(get_reascripthelp()))
+    if args.stand_in:
+        print_stand_in(functions)
+    else:
+        print_pyi(functions)
+
+
 if __name__ == "__main__":
     main()
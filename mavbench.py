@@ -0,0 +1,132 @@
+"""
+Benchmark the Mav protocol clients against mavstub.py, in operations per second.
+
+    python3 mavbench.py --ops 300 --tick-ms 33
+
+- blocking: remote_showmenu.Conn.showmenu(), one request per round trip
+- pipelined: remote_showmenu.Conn.showmenus() with --batch menus per write
+- batch: remote_showmenu.Conn.batch(), as few OP_BATCH messages as fit
+- asyncio: mavclient.MavClient.showmenu() from --concurrency tasks at once
+- asyncio batch: mavclient.MavClient.batch() from --concurrency tasks,
+  --batch menus each
+
+Every reply is checked against the menu it belongs to.
+"""
+
+import argparse
+import asyncio
+import threading
+import time
+
+import mavclient
+import mavstub
+import remote_showmenu
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--ops", type=int, default=300)
+parser.add_argument("--tick-ms", type=float, default=33.0)
+parser.add_argument("--batch", type=int, default=50)
+parser.add_argument("--concurrency", type=int, default=50)
+parser.add_argument("--port", type=int, default=18569)
+
+
+def menus(n: int) -> list[str]:
+    return ["|".join(f"item {j}" for j in range(1 + i % 7)) for i in range(n)]
+
+
+def run_stub(stub: mavstub.MavStub, port: int) -> None:
+    ready = threading.Event()
+
+    async def amain() -> None:
+        async with await stub.listen(port) as server:
+            ready.set()
+            await server.serve_forever()
+
+    threading.Thread(target=asyncio.run, args=(amain(),), daemon=True).start()
+    ready.wait()
+
+
+def check(menus: list[str], replies: list[int]) -> None:
+    expected = [mavstub.count_items(m) for m in menus]
+    if replies != expected:
+        raise Exception("Replies out of order or missing")
+
+
+def blocking(args: argparse.Namespace, ms: list[str]) -> None:
+    conn = remote_showmenu.open_conn(args.port)
+    check(ms, [conn.showmenu(m) for m in ms])
+    conn.sock.close()
+
+
+def pipelined(args: argparse.Namespace, ms: list[str]) -> None:
+    conn = remote_showmenu.open_conn(args.port)
+    replies = []
+    for i in range(0, len(ms), args.batch):
+        replies += conn.showmenus(ms[i : i + args.batch])
+    check(ms, replies)
+    conn.sock.close()
+
+
+def batch(args: argparse.Namespace, ms: list[str]) -> None:
+    conn = remote_showmenu.open_conn(args.port)
+    check(ms, conn.batch(remote_showmenu.showmenu_message(m) for m in ms))
+    conn.sock.close()
+
+
+def concurrent(args: argparse.Namespace, ms: list[str]) -> None:
+    async def amain() -> None:
+        client = mavclient.MavClient(port=args.port)
+        replies: list[int] = [0] * len(ms)
+
+        async def worker(k: int) -> None:
+            for i in range(k, len(ms), args.concurrency):
+                replies[i] = await client.showmenu(ms[i])
+
+        await asyncio.gather(*(worker(k) for k in range(args.concurrency)))
+        await client.close()
+        check(ms, replies)
+
+    asyncio.run(amain())
+
+
+def concurrent_batch(args: argparse.Namespace, ms: list[str]) -> None:
+    async def amain() -> None:
+        client = mavclient.MavClient(port=args.port)
+        chunks = [ms[i : i + args.batch] for i in range(0, len(ms), args.batch)]
+        replies = await asyncio.gather(
+            *(
+                client.batch(remote_showmenu.showmenu_message(m) for m in chunk)
+                for chunk in chunks
+            )
+        )
+        await client.close()
+        check(ms, [r for reply in replies for r in reply])
+
+    asyncio.run(amain())
+
+
+def main() -> None:
+    args = parser.parse_args()
+    stub = mavstub.MavStub(tick=args.tick_ms / 1000)
+    run_stub(stub, args.port)
+    ms = menus(args.ops)
+    print(f"{'client':14} {'ops/s':>10} {'defer cycles':>12}")
+    clients = (
+        ("blocking", blocking),
+        ("pipelined", pipelined),
+        ("batch", batch),
+        ("asyncio", concurrent),
+        ("asyncio batch", concurrent_batch),
+    )
+    for name, f in clients:
+        ticks = stub.ticks
+        t = time.perf_counter()
+        f(args, ms)
+        elapsed = time.perf_counter() - t
+        print(
+            f"{name:14} {args.ops / elapsed:10.1f} {stub.ticks - ticks:12}", flush=True
+        )
+
+
+if __name__ == "__main__":
+    main()
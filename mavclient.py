@@ -0,0 +1,184 @@
+"""
+asyncio client for the Mav protocol of eelsynctest.eel.
+
+remote_showmenu.Conn uses blocking sockets, which would freeze REAPER when
+used from an action running on reaper_loop. This client works on any
+asyncio loop, including ReaperCoopEventLoop:
+
+    client = MavClient()
+    i = await client.showmenu("first|second")
+    await client.gfx_init("foo", 200, 150, 0, 0, 0)
+    results = await client.batch([showmenu_message("a|b"), gfx_quit_message()])
+
+Any number of tasks can await showmenu() at the same time. Requests are
+written in the order they are made and the server replies in that order,
+so one reader task hands each reply to the oldest waiting request.
+At most MAX_IN_FLIGHT requests wait for a reply; further callers wait for
+room, and writes wait for the socket to drain. MavClient keeps one
+connection and opens a new one when it was lost.
+"""
+
+import asyncio
+import collections
+import struct
+from dataclasses import dataclass, field
+
+from typing import Any, Iterable
+
+from remote_showmenu import (
+    OP_BATCH_REPLY,
+    OP_GFX_SHOWMENU_REPLY,
+    PORT,
+    batch_message,
+    gfx_init_message,
+    gfx_quit_message,
+    showmenu_message,
+    split_batches,
+)
+
+MAX_IN_FLIGHT = 64
+HANDSHAKE = b"Mav\n"
+
+
+class AsyncConn:
+    def __init__(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self.reader = reader
+        self.writer = writer
+        # Futures of the requests waiting for a reply, oldest first
+        # (an int for OP_GFX_SHOWMENU, a list of ints for OP_BATCH)
+        self.waiting: collections.deque[asyncio.Future[Any]] = collections.deque()
+        self.in_flight = asyncio.Semaphore(MAX_IN_FLIGHT)
+        # Set once the connection is unusable
+        self.error: BaseException | None = None
+        self.read_task = asyncio.create_task(self.read_replies())
+
+    async def read_replies(self) -> None:
+        try:
+            while True:
+                reply = await self.reader.readexactly(5)
+                (n,) = struct.unpack_from("<xI", reply)
+                if reply[0] == OP_BATCH_REPLY:
+                    result: Any = list(
+                        struct.unpack(f"<{n}i", await self.reader.readexactly(4 * n))
+                    )
+                elif reply[0] == OP_GFX_SHOWMENU_REPLY:
+                    result = n
+                else:
+                    raise Exception("Unknown response opcode")
+                if not self.waiting:
+                    raise Exception("Reply without a request")
+                fut = self.waiting.popleft()
+                self.in_flight.release()
+                # The caller may have been cancelled
+                if not fut.done():
+                    fut.set_result(result)
+        except asyncio.IncompleteReadError:
+            self.fail(Exception("Early EOF"))
+        except (Exception, asyncio.CancelledError) as exc:
+            self.fail(exc)
+
+    def fail(self, exc: BaseException) -> None:
+        if self.error is None:
+            self.error = exc
+        while self.waiting:
+            fut = self.waiting.popleft()
+            if not fut.done():
+                fut.set_exception(Exception("Mav connection lost"))
+        self.writer.close()
+
+    def check(self) -> None:
+        if self.error is not None:
+            raise Exception("Mav connection lost") from self.error
+
+    async def send(self, message: bytes) -> None:
+        self.check()
+        self.writer.write(message)
+        await self.writer.drain()
+
+    async def request(self, message: bytes) -> Any:
+        "Send a message that gets a reply and wait for the reply"
+        await self.in_flight.acquire()
+        try:
+            self.check()
+        except Exception:
+            self.in_flight.release()
+            raise
+        fut = asyncio.get_running_loop().create_future()
+        # No await between queueing the future and writing the request,
+        # so the order of self.waiting is the order on the wire
+        self.waiting.append(fut)
+        self.writer.write(message)
+        await self.writer.drain()
+        return await fut
+
+    async def showmenu(self, menustr: str, x: int = 0, y: int = 0) -> int:
+        return await self.request(showmenu_message(menustr, x, y))
+
+    async def batch(self, messages: Iterable[bytes]) -> list[int]:
+        "Run the messages in as few OP_BATCH messages as possible, one result each"
+        replies = await asyncio.gather(
+            *(self.request(batch_message(b)) for b in split_batches(messages))
+        )
+        return [result for reply in replies for result in reply]
+
+    async def gfx_init(
+        self, name: str, width: int, height: int, dockstate: int, xpos: int, ypos: int
+    ) -> None:
+        await self.send(gfx_init_message(name, width, height, dockstate, xpos, ypos))
+
+    async def gfx_quit(self) -> None:
+        await self.send(gfx_quit_message())
+
+    async def close(self) -> None:
+        self.read_task.cancel()
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except OSError:
+            pass
+
+
+async def open_conn(host: str = "localhost", port: int = PORT) -> AsyncConn:
+    reader, writer = await asyncio.open_connection(host, port)
+    header = await reader.readexactly(len(HANDSHAKE))
+    if header != HANDSHAKE:
+        writer.close()
+        raise Exception(f"Unexpected handshake {header!r}")
+    return AsyncConn(reader, writer)
+
+
+@dataclass
+class MavClient:
+    host: str = "localhost"
+    port: int = PORT
+    conn: AsyncConn | None = None
+    connect_lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    async def connection(self) -> AsyncConn:
+        async with self.connect_lock:
+            if self.conn is None or self.conn.error is not None:
+                self.conn = await open_conn(self.host, self.port)
+            return self.conn
+
+    async def showmenu(self, menustr: str, x: int = 0, y: int = 0) -> int:
+        return await (await self.connection()).showmenu(menustr, x, y)
+
+    async def gfx_init(
+        self, name: str, width: int, height: int, dockstate: int, xpos: int, ypos: int
+    ) -> None:
+        await (await self.connection()).gfx_init(
+            name, width, height, dockstate, xpos, ypos
+        )
+
+    async def gfx_quit(self) -> None:
+        await (await self.connection()).gfx_quit()
+
+    async def batch(self, messages: Iterable[bytes]) -> list[int]:
+        return await (await self.connection()).batch(messages)
+
+    async def close(self) -> None:
+        if self.conn is not None:
+            await self.conn.close()
+            self.conn = None
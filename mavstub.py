@@ -0,0 +1,157 @@
+"""
+Stand-in for eelsynctest.eel: the server side of the Mav protocol, without REAPER.
+
+Like the EEL script, it sends the "Mav\n" handshake, then handles every
+complete message it has received and waits for the next defer cycle
+(--tick-ms) before reading again. gfx_showmenu answers with the next of
+--answers, or by default with the number of items in the menu.
+
+    python3 mavstub.py --tick-ms 33 --answers 1,1,3
+    python3 remote_showmenu.py
+
+mavbench.py measures the clients against it.
+"""
+
+import argparse
+import asyncio
+import collections
+import itertools
+import struct
+from dataclasses import dataclass, field
+from typing import Callable
+
+from remote_showmenu import (
+    MAX_MSGSIZE,
+    OP_BATCH,
+    OP_BATCH_REPLY,
+    OP_GFX_INIT,
+    OP_GFX_QUIT,
+    OP_GFX_SHOWMENU,
+    OP_GFX_SHOWMENU_REPLY,
+    PORT,
+)
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--port", type=int, default=PORT)
+parser.add_argument("--tick-ms", type=float, default=33.0, help="REAPER defer interval")
+parser.add_argument("--answers", help="comma-separated menu choices to answer in turn")
+
+
+def count_items(menustr: str) -> int:
+    "What gfx_showmenu would return when the last item is chosen"
+    return sum(1 for item in menustr.split("|") if not item.startswith(">"))
+
+
+@dataclass
+class MavStub:
+    tick: float = 0.0
+    choose: Callable[[str], int] = count_items
+    ops: collections.Counter[str] = field(default_factory=collections.Counter)
+    ticks: int = 0
+    gfx_open: bool = False
+
+    def handle_message(self, op: int, body: bytes) -> bytes | None:
+        "Returns the reply, or raises to drop the connection"
+        if op == OP_BATCH:
+            return self.run_batch(body)
+        result = self.run(op, body)
+        if op == OP_GFX_SHOWMENU:
+            return struct.pack("<Bi", OP_GFX_SHOWMENU_REPLY, result)
+        return None
+
+    def run_batch(self, body: bytes) -> bytes:
+        if len(body) < 4:
+            raise Exception("malformed OP_BATCH")
+        (count,) = struct.unpack_from("<I", body)
+        self.ops["batch"] += 1
+        results = []
+        pos = 4
+        for _ in range(count):
+            if pos + 5 > len(body):
+                raise Exception("malformed OP_BATCH")
+            (msgsize,) = struct.unpack_from("<I", body, pos)
+            if msgsize < 1 or pos + 4 + msgsize > len(body):
+                raise Exception("malformed OP_BATCH")
+            # Batches do not nest: OP_BATCH inside is skipped like unknown messages
+            results.append(self.run(body[pos + 4], body[pos + 5 : pos + 4 + msgsize]))
+            pos += 4 + msgsize
+        return struct.pack(f"<BI{count}i", OP_BATCH_REPLY, count, *results)
+
+    def run(self, op: int, body: bytes) -> int:
+        "Run one message; returns the choice for OP_GFX_SHOWMENU, otherwise 0"
+        if op == OP_GFX_SHOWMENU:
+            if len(body) < 9:
+                raise Exception(
+                    f"msgsize {len(body) + 1} too small for OP_GFX_SHOWMENU"
+                )
+            self.ops["showmenu"] += 1
+            return self.choose(body[8:].decode())
+        if op == OP_GFX_INIT:
+            if len(body) < 20:
+                print(f"msgsize {len(body) + 1} too small for OP_GFX_INIT", flush=True)
+            else:
+                self.ops["gfx_init"] += 1
+                self.gfx_open = True
+        elif op == OP_GFX_QUIT:
+            if body:
+                print(f"msgsize {len(body) + 1} incorrect for OP_GFX_QUIT", flush=True)
+            else:
+                self.ops["gfx_quit"] += 1
+                self.gfx_open = False
+        else:
+            # The EEL script skips unknown messages
+            self.ops["unknown"] += 1
+        return 0
+
+    async def serve(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        writer.write(b"Mav\n")
+        buf = bytearray()
+        pos = 0
+        try:
+            while data := await reader.read(65536):
+                buf += data
+                replies = []
+                while len(buf) - pos >= 4:
+                    (msgsize,) = struct.unpack_from("<I", buf, pos)
+                    if msgsize > MAX_MSGSIZE:
+                        writer.write(b"bye\n")
+                        raise Exception(f"msgsize {msgsize} exceeds limit")
+                    if len(buf) - pos < 4 + msgsize:
+                        break
+                    body = bytes(buf[pos + 5 : pos + 4 + msgsize])
+                    reply = self.handle_message(buf[pos + 4], body)
+                    if reply is not None:
+                        replies.append(reply)
+                    pos += 4 + msgsize
+                del buf[:pos]
+                pos = 0
+                writer.write(b"".join(replies))
+                await writer.drain()
+                # Out of complete messages: defer() until the next cycle
+                self.ticks += 1
+                await asyncio.sleep(self.tick)
+        except Exception as exc:
+            print(f"mavstub: {exc}", flush=True)
+        finally:
+            writer.close()
+
+    async def listen(self, port: int) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self.serve, "localhost", port)
+
+
+async def amain() -> None:
+    args = parser.parse_args()
+    stub = MavStub(tick=args.tick_ms / 1000)
+    if args.answers:
+        answers = itertools.cycle(int(a) for a in args.answers.split(","))
+        stub.choose = lambda menustr: next(answers)
+    server = await stub.listen(args.port)
+    print(f"Listening on {args.port}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(amain())
@@ -0,0 +1,298 @@
+"""
+Headless stand-in for MuseScore running "Sync MuseScore 4 with REAPER.qml".
+
+Speaks the musicsync protocol the way the plugin does, with a simulated
+playback clock instead of a score. Like the plugin, it listens on 8084 and
+connects to 8085. Usage, with the sync action running in REAPER:
+
+    python3 musicsyncstub.py --delay-ms 20 --toggle-every 5
+
+--delay-ms and --jitter-ms delay every message in both directions,
+--clock-offset shifts the stand-in's wall clock and --drift-ppm makes its
+playback run fast or slow, to exercise the latency and drift compensation.
+--toggle-every N plays/pauses every N seconds, like a user pressing space.
+
+syncbench.py runs the sync coroutines against this stand-in.
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any
+
+import aiohttp
+from aiohttp import web
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--port", type=int, default=8084)
+parser.add_argument("--connect", type=int, default=8085)
+parser.add_argument("--protocol-version", type=int, default=2)
+parser.add_argument("--delay-ms", type=float, default=0.0)
+parser.add_argument("--jitter-ms", type=float, default=0.0)
+parser.add_argument("--clock-offset", type=float, default=0.0)
+parser.add_argument("--drift-ppm", type=float, default=0.0)
+parser.add_argument("--toggle-every", type=float, default=0.0)
+
+# The plugin checks for its own play state changes on a 20 ms timer
+PUSH_INTERVAL = 0.020
+
+
+@dataclass
+class SimPlayback:
+    "Score playback position, in seconds, advancing at rate while playing"
+
+    rate: float = 1.0
+    playing: bool = False
+    start_pos: float = 0.0
+    started_at: float = 0.0
+
+    def pos(self) -> float:
+        if not self.playing:
+            return self.start_pos
+        return self.start_pos + (time.monotonic() - self.started_at) * self.rate
+
+    def seek(self, pos: float) -> None:
+        self.start_pos = pos
+        self.started_at = time.monotonic()
+
+    def play(self) -> None:
+        self.seek(self.pos())
+        self.playing = True
+
+    def stop(self) -> None:
+        self.seek(self.pos())
+        self.playing = False
+
+
+@dataclass(eq=False)
+class DelayedConnection:
+    """
+    A websocket with simulated network delay. Messages are delivered in order,
+    each no earlier than delay (plus random jitter) after it was sent.
+    """
+
+    ws: Any
+    delay: float
+    jitter: float
+    server: bool
+    outgoing: asyncio.Queue[tuple[float, str]] = field(default_factory=asyncio.Queue)
+    last_delivery: float = 0.0
+
+    def deliver_at(self) -> float:
+        t = time.monotonic() + self.delay + random.uniform(0, self.jitter)
+        self.last_delivery = max(self.last_delivery, t)
+        return self.last_delivery
+
+    def send(self, obj: dict[str, Any]) -> None:
+        self.outgoing.put_nowait((self.deliver_at(), json.dumps(obj)))
+
+    async def writer(self) -> None:
+        while True:
+            t, msg = await self.outgoing.get()
+            await asyncio.sleep(max(0.0, t - time.monotonic()))
+            try:
+                await self.ws.send_str(msg)
+            except ConnectionError:
+                return
+
+
+@dataclass
+class MusicSyncStub:
+    protocol_version: int = 2
+    delay: float = 0.0
+    jitter: float = 0.0
+    clock_offset: float = 0.0
+    playback: SimPlayback = field(default_factory=SimPlayback)
+    instance: str = field(default_factory=lambda: uuid.uuid4().hex)
+    subscribers: list[DelayedConnection] = field(default_factory=list)
+    last_playing: bool = False
+    # Messages by type, counted when sent and when handled
+    sent: collections.Counter[str] = field(default_factory=collections.Counter)
+    received: collections.Counter[str] = field(default_factory=collections.Counter)
+    # (time.monotonic(), playing, pos) of each play state applied for the remote
+    applied: list[tuple[float, bool, float]] = field(default_factory=list)
+
+    def now(self) -> float:
+        "The stand-in's wall clock, like Date.now() / 1000 in the plugin"
+        return time.time() + self.clock_offset
+
+    def send(self, conn: DelayedConnection, obj: dict[str, Any]) -> None:
+        self.sent[obj["t"]] += 1
+        conn.send(obj)
+
+    def user_play(self) -> None:
+        self.playback.play()
+
+    def user_stop(self) -> None:
+        self.playback.stop()
+
+    def apply_play_state(self, playing: bool, pos: float) -> None:
+        if playing:
+            self.playback.seek(pos)
+            if not self.playback.playing:
+                self.playback.play()
+        elif self.playback.playing:
+            self.playback.stop()
+        self.applied.append((time.monotonic(), playing, pos))
+        # Don't echo the change back to the remote
+        self.last_playing = playing
+
+    async def push_play_state(self) -> None:
+        while True:
+            await asyncio.sleep(PUSH_INTERVAL)
+            playing = self.playback.playing
+            if playing == self.last_playing:
+                continue
+            self.last_playing = playing
+            event = {
+                "t": "playStateChanged",
+                "currentlyPlaying": playing,
+                "pos": self.playback.pos(),
+                "sentAt": self.now(),
+            }
+            for conn in self.subscribers:
+                self.send(conn, event)
+
+    def handle_message(self, conn: DelayedConnection, obj: dict[str, Any]) -> None:
+        self.received[obj["t"]] += 1
+        reply = self.get_reply_for_message(conn, obj)
+        if reply is None:
+            return
+        self.send(conn, reply)
+        if reply["t"] == "helloReply" and reply["version"] >= 2:
+            # Subscribe to REAPER's play state as well
+            self.send(conn, {"t": "subscribePlayState", "ref": 2})
+
+    def get_reply_for_message(
+        self, conn: DelayedConnection, obj: dict[str, Any]
+    ) -> dict[str, Any] | None:
+        playing = self.playback.playing
+        if obj["t"] == "hello":
+            version = min(obj.get("version", 1), self.protocol_version)
+            reply = {
+                "t": "helloReply",
+                "protocol": "musicsync",
+                "version": version,
+                "ref": obj["ref"],
+            }
+            # Like the plugin: version 1 didn't identify the instance
+            if self.protocol_version >= 2:
+                reply["instance"] = self.instance
+            return reply
+        elif obj["t"] == "getPlayState":
+            reply = {
+                "t": "getPlayStateReply",
+                "currentlyPlaying": playing,
+                "pos": self.playback.pos(),
+                "ref": obj["ref"],
+            }
+            if self.protocol_version >= 2:
+                reply["sentAt"] = self.now()
+            return reply
+        elif obj["t"] == "setPlayState":
+            self.apply_play_state(obj["currentlyPlaying"], obj["pos"])
+            return {"t": "setPlayStateReply", "ok": True, "ref": obj["ref"]}
+        elif obj["t"] == "subscribePlayState" and self.protocol_version >= 2:
+            self.subscribers = [c for c in self.subscribers if c is not conn]
+            self.subscribers.append(conn)
+            self.last_playing = playing
+            return {
+                "t": "subscribePlayStateReply",
+                "currentlyPlaying": playing,
+                "pos": self.playback.pos(),
+                "ref": obj.get("ref"),
+            }
+        elif obj["t"] == "playStateChanged" and self.protocol_version >= 2:
+            self.apply_play_state(obj["currentlyPlaying"], obj["pos"])
+        elif obj["t"] == "ping" and self.protocol_version >= 2:
+            t1 = self.now()
+            return {"t": "pong", "t0": obj["t0"], "t1": t1, "t2": self.now()}
+        return None
+
+    async def serve_connection(self, ws: Any, server: bool) -> None:
+        conn = DelayedConnection(ws, self.delay, self.jitter, server)
+        writer = asyncio.create_task(conn.writer())
+        incoming: asyncio.Queue[tuple[float, dict[str, Any]]] = asyncio.Queue()
+
+        async def reader() -> None:
+            while True:
+                t, obj = await incoming.get()
+                await asyncio.sleep(max(0.0, t - time.monotonic()))
+                self.handle_message(conn, obj)
+
+        reader_task = asyncio.create_task(reader())
+        try:
+            async for msg in ws:
+                if msg.type == aiohttp.WSMsgType.TEXT:
+                    incoming.put_nowait((conn.deliver_at(), json.loads(msg.data)))
+        finally:
+            self.subscribers = [c for c in self.subscribers if c is not conn]
+            writer.cancel()
+            reader_task.cancel()
+
+    async def listen(self, port: int) -> web.AppRunner:
+        async def handler(request: web.Request) -> web.WebSocketResponse:
+            ws = web.WebSocketResponse()
+            await ws.prepare(request)
+            print(f"Sync stand-in: connection from client on {port}")
+            await self.serve_connection(ws, server=True)
+            return ws
+
+        app = web.Application()
+        app.router.add_get("/", handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "localhost", port).start()
+        return runner
+
+    async def connect(self, session: aiohttp.ClientSession, port: int) -> None:
+        async with session.ws_connect(f"http://localhost:{port}") as ws:
+            print(f"Sync stand-in: connected to server on {port}")
+            await self.serve_connection(ws, server=False)
+
+
+async def amain() -> None:
+    args = parser.parse_args()
+    stub = MusicSyncStub(
+        protocol_version=args.protocol_version,
+        delay=args.delay_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        clock_offset=args.clock_offset,
+        playback=SimPlayback(rate=1 + args.drift_ppm * 1e-6),
+    )
+    runner = await stub.listen(args.port)
+    push_task = asyncio.create_task(stub.push_play_state())
+    print(f"Sync stand-in: Listening on {args.port}, connecting to {args.connect}")
+    try:
+        async with aiohttp.ClientSession() as session:
+            try:
+                connect_task = asyncio.create_task(stub.connect(session, args.connect))
+                if not args.toggle_every:
+                    await connect_task
+                while True:
+                    await asyncio.sleep(args.toggle_every)
+                    if stub.playback.playing:
+                        stub.user_stop()
+                        print(f"Sync stand-in: Stopped at {stub.playback.pos():.3f}")
+                    else:
+                        stub.user_play()
+                        print(f"Sync stand-in: Playing from {stub.playback.pos():.3f}")
+            except OSError as e:
+                print(f"Sync stand-in: Could not connect to {args.connect}: {e}")
+                await asyncio.Future()
+    finally:
+        push_task.cancel()
+        await runner.cleanup()
+        print(f"Sync stand-in: sent {dict(stub.sent)}, received {dict(stub.received)}")
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(amain())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,441 @@
+"""
+Auto-connect PipeWire ports like auto-connect-ports.lua, as a Python daemon
+that also answers graph queries from REAPER actions.
+
+Keeps a single `pw-dump --monitor` running and applies its updates to a
+pwgraph.Graph. When the default sink or source changes, or a port that a
+link spec looked for appears or disappears, the links in AUTO_CONNECT are
+enforced the same way as auto-connect-ports.lua does it. Run either this
+daemon or the WirePlumber script, not both.
+
+    python3 pwautoconnect.py
+
+Actions get the part of the graph they need with subgraph(), a round trip
+over a Unix socket (SOCKET_PATH) instead of running pw-dump.
+"""
+
+import argparse
+import asyncio
+import codecs
+import json
+import os
+import subprocess
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+import pwgraph
+import pwlink
+from pwgraph import Graph, Port
+
+SOCKET_PATH = os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR", "/tmp"), "pwautoconnect.sock"
+)
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--socket", default=SOCKET_PATH)
+parser.add_argument(
+    "-n",
+    "--dry-run",
+    action="store_true",
+    help="only print the links to create and destroy",
+)
+
+# Same as auto_connect in auto-connect-ports.lua; see the comments there.
+AUTO_CONNECT: list[dict[str, Any]] = [
+    {
+        "input": {"portfmt": "REAPER:in%d", "from": 1},
+        "output": [
+            {"portfmt": "Scarlett 18i16 4th Gen:capture_AUX%d", "from": 10},
+            {"portfmt": "Scarlett 4i4 USB:capture_AUX%d", "from": 0},
+        ],
+        "max_count": 8,
+    },
+    {
+        "input": {"portfmt": "REAPER:in%d", "from": 9},
+        "output": [{"default_source": True}],
+        "max_count": 2,
+    },
+    {
+        "output": {"portfmt": "REAPER:out%d", "from": 1},
+        "input": [
+            {"portfmt": "Scarlett 18i16 4th Gen:playback_AUX%d", "from": 2},
+            {"portfmt": "Scarlett 4i4 USB:playback_AUX%d", "from": 0},
+            {"default_sink": True, "min_count": 4},
+        ],
+        "max_count": 16,
+    },
+    {
+        "output": {"portfmt": "REAPER:out%d", "from": 17},
+        "input": [{"portfmt": "Scarlett 18i16 4th Gen:playback_AUX%d", "from": 0}],
+        "max_count": 2,
+    },
+    {
+        "output": {"portfmt": "REAPER:out%d", "from": 19},
+        "input": {"default_sink": True, "min_count": 2},
+        "max_count": 2,
+    },
+    {
+        "output": {"portfmt": "REAPER:out%d", "from": 21},
+        "input": [
+            {"portfmt": "Blue Microphones:playback_%s", "ports": ["FL", "FR"]},
+            {"portfmt": "Blue Microphones:playback_%s", "ports": ["AUX0", "AUX1"]},
+        ],
+    },
+    {
+        "input": {"portfmt": "REAPER:in%d", "from": 11},
+        "output": [
+            {"portfmt": "Blue Microphones:capture_%s", "ports": ["FL", "FR"]},
+            {"portfmt": "Blue Microphones:capture_%s", "ports": ["AUX0", "AUX1"]},
+        ],
+    },
+    {
+        "output": {"portfmt": "REAPER:out%d", "from": 23},
+        "input": [
+            {"portfmt": "Yeti Nano:playback_%s", "ports": ["FL", "FR"]},
+            {"portfmt": "Yeti Nano:playback_%s", "ports": ["AUX0", "AUX1"]},
+        ],
+    },
+    {
+        "input": {"portfmt": "REAPER:in%d", "from": 13},
+        "output": [
+            {"portfmt": "Yeti Nano:capture_%s", "ports": ["FL", "FR"]},
+            {"portfmt": "Yeti Nano:capture_%s", "ports": ["AUX0", "AUX1"]},
+        ],
+    },
+    {
+        "input": {"portfmt": "REAPER:in%d", "from": 19},
+        "output": {"default_sink_monitor": True},
+    },
+]
+
+# Links we created are not created again for this long, while we wait
+# for pw-dump to report them (the Lua script has a bug about this)
+PENDING_TIMEOUT = 5.0
+
+PortLookup = Callable[[int], Port | None]
+
+
+def find_port(
+    graph: Graph, checked: dict[str, bool], direction: pwgraph.Direction, alias: str
+) -> Port | None:
+    port = graph.port_by_alias(alias)
+    if port is not None and port.direction != direction:
+        port = None
+    # Remember what we looked for, so that we reconnect when it appears or disappears
+    checked[alias] = port is not None
+    return port
+
+
+def get_default_ports(
+    graph: Graph, key: str, direction: pwgraph.Direction, min_count: int | None
+) -> PortLookup:
+    node = graph.default_node(key)
+    found = [] if node is None else graph.node_ports(node.id, direction)
+    if found and min_count:
+        found = found * -(-min_count // len(found))
+    return lambda i: found[i - 1] if i <= len(found) else None
+
+
+def resolve_ports(
+    graph: Graph, checked: dict[str, bool], direction: pwgraph.Direction, specs: Any
+) -> PortLookup | None:
+    "Port i (from 1) of the first spec that is present, like the Lua resolve_ports"
+    for spec in specs if isinstance(specs, list) else [specs]:
+        if spec.get("default_sink"):
+            return get_default_ports(
+                graph, "default.audio.sink", "in", spec.get("min_count")
+            )
+        elif spec.get("default_source"):
+            return get_default_ports(
+                graph, "default.audio.source", "out", spec.get("min_count")
+            )
+        elif spec.get("default_sink_monitor"):
+            return get_default_ports(
+                graph, "default.audio.sink", "out", spec.get("min_count")
+            )
+        elif "ports" in spec:
+            fmt, names = spec["portfmt"], spec["ports"]
+            if find_port(graph, checked, direction, fmt % names[0]):
+                return lambda i, fmt=fmt, names=names: (
+                    find_port(graph, checked, direction, fmt % names[i - 1])
+                    if i <= len(names)
+                    else None
+                )
+        else:
+            fmt, start = spec["portfmt"], spec["from"]
+            if find_port(graph, checked, direction, fmt % start):
+                return lambda i, fmt=fmt, start=start: find_port(
+                    graph, checked, direction, fmt % (start + i - 1)
+                )
+    return None
+
+
+def desired_links(graph: Graph, checked: dict[str, bool]) -> list[tuple[Port, Port]]:
+    "(output, input) pairs that AUTO_CONNECT asks for in the current graph"
+    links = []
+    for spec in AUTO_CONNECT:
+        inputs = resolve_ports(graph, checked, "in", spec["input"])
+        outputs = resolve_ports(graph, checked, "out", spec["output"])
+        if inputs is None or outputs is None:
+            continue
+        for i in range(1, spec.get("max_count", 100) + 1):
+            inp = inputs(i)
+            if inp is None:
+                break
+            out = outputs(i)
+            if out is None:
+                break
+            links.append((out, inp))
+    return links
+
+
+def plan_links(
+    graph: Graph, links: list[tuple[Port, Port]]
+) -> tuple[set[int], list[tuple[Port, Port]]]:
+    """
+    (link ids to destroy, links to create). Like _connect in the Lua script:
+    a physical or monitor output may be the only one linked to its input,
+    and any other output may only be linked to its desired input.
+    """
+    destroy: set[int] = set()
+    create: dict[tuple[int, int], tuple[Port, Port]] = {}
+    for out, inp in links:
+        skip = False
+        if out.physical or out.monitor:
+            for link_id, other in graph.links_by_input.get(inp.id, {}).items():
+                if other == out.id:
+                    skip = True
+                else:
+                    destroy.add(link_id)
+        else:
+            for link_id, other in graph.links_by_output.get(out.id, {}).items():
+                if other == inp.id:
+                    skip = True
+                else:
+                    destroy.add(link_id)
+        if not skip:
+            create[out.id, inp.id] = (out, inp)
+    return destroy, list(create.values())
+
+
+@dataclass
+class AutoConnect:
+    dry_run: bool = False
+    graph: Graph = field(default_factory=Graph)
+    # Port aliases the link specs looked for -> whether they were found
+    checked: dict[str, bool] = field(default_factory=dict)
+    dirty: asyncio.Event = field(default_factory=asyncio.Event)
+    ready: asyncio.Event = field(default_factory=asyncio.Event)
+    # (output, input) -> when we created it, until the link shows up in the graph
+    pending: dict[tuple[int, int], float] = field(default_factory=dict)
+    updates: int = 0
+    connects: int = 0
+
+    def is_relevant(self, obj: dict[str, Any]) -> bool:
+        "Whether applying obj to the graph should make us reconnect"
+        oid = obj["id"]
+        if obj.get("info", True) is None:
+            port = self.graph.ports.get(oid)
+        elif obj.get("type") == pwgraph.PORT and oid not in self.graph.ports:
+            props = obj["info"].get("props", {})
+            port = Port(
+                oid,
+                props.get("node.id", -1),
+                0,
+                props.get("port.direction", "in"),
+                props.get("port.alias"),
+                props,
+            )
+        else:
+            return False
+        if port is None:
+            return False
+        if port.alias is not None and port.alias in self.checked:
+            # Added and looked for but missing, or removed and was found
+            return self.checked[port.alias] == (obj.get("info") is None)
+        default_nodes = {
+            self.graph.nodes_by_name.get(name) for name in self.graph.defaults.values()
+        }
+        return port.node_id in default_nodes
+
+    async def monitor(self) -> None:
+        proc = await asyncio.subprocess.create_subprocess_exec(
+            "pw-dump", "--monitor", stdout=subprocess.PIPE
+        )
+        assert proc.stdout is not None
+        dump_parser = pwgraph.DumpParser()
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        relevant = True
+        defaults = dict(self.graph.defaults)
+        while chunk := await proc.stdout.read(pwgraph.CHUNK_SIZE):
+            for obj in dump_parser.feed(decoder.decode(chunk)):
+                if obj is not None:
+                    relevant = relevant or self.is_relevant(obj)
+                    self.graph.apply(obj)
+                    continue
+                # End of one update
+                self.updates += 1
+                self.ready.set()
+                if self.graph.defaults != defaults:
+                    defaults = dict(self.graph.defaults)
+                    relevant = True
+                if relevant:
+                    self.dirty.set()
+                    relevant = False
+        raise SystemExit(f"pw-dump exited with code {await proc.wait()}")
+
+    async def connect_loop(self) -> None:
+        while True:
+            await self.dirty.wait()
+            self.dirty.clear()
+            checked: dict[str, bool] = {}
+            destroy, create = plan_links(self.graph, desired_links(self.graph, checked))
+            self.checked = checked
+            self.connects += 1
+            for link_id in sorted(destroy):
+                link = self.graph.links[link_id]
+                output = self.describe(link.output_port)
+                inp = self.describe(link.input_port)
+                print(f"auto-connect: destroy {output} -> {inp}", flush=True)
+            now = time.monotonic()
+            self.pending = {
+                k: t
+                for k, t in self.pending.items()
+                if now - t < PENDING_TIMEOUT and not self.graph.has_link(*k)
+            }
+            new_links = []
+            for out, inp in create:
+                if (out.id, inp.id) in self.pending:
+                    continue
+                self.pending[out.id, inp.id] = now
+                print(f"auto-connect: link {out.alias} -> {inp.alias}", flush=True)
+                new_links.append((out.id, inp.id))
+            if not self.dry_run and (destroy or new_links):
+                # pw-dump --monitor reports the result, so there's nothing to verify
+                await pwlink.apply_links(
+                    new_links, sorted(destroy), verify=False, verbose=False
+                )
+
+    def describe(self, port_id: int) -> str:
+        port = self.graph.ports.get(port_id)
+        return str(port_id) if port is None else str(port.alias)
+
+    def subgraph(self, request: dict[str, Any]) -> list[dict[str, Any]]:
+        port_ids: set[int] = set()
+        for key in request.get("defaults", []):
+            node = self.graph.default_node(key)
+            if node is not None:
+                for direction in ("in", "out"):
+                    port_ids.update(
+                        p.id for p in self.graph.node_ports(node.id, direction)
+                    )
+        for fmt in request.get("port_fmts", []):
+            port_ids.update(p.id for _, p in self.graph.numbered_ports(fmt))
+        for alias in request.get("aliases", []):
+            port = self.graph.port_by_alias(alias)
+            if port is not None:
+                port_ids.add(port.id)
+        return self.graph.subgraph_objects(port_ids)
+
+    def answer(self, request: dict[str, Any]) -> dict[str, Any]:
+        if request.get("q") == "subgraph":
+            return {"ok": True, "objects": self.subgraph(request)}
+        elif request.get("q") == "status":
+            return {
+                "ok": True,
+                "nodes": len(self.graph.nodes),
+                "ports": len(self.graph.ports),
+                "links": len(self.graph.links),
+                "updates": self.updates,
+                "connects": self.connects,
+            }
+        elif request.get("q") == "connect":
+            self.dirty.set()
+            return {"ok": True}
+        return {"ok": False, "error": f"unknown query {request.get('q')!r}"}
+
+    async def handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        # Don't answer from a half-read graph
+        await self.ready.wait()
+        try:
+            while line := await reader.readline():
+                try:
+                    reply = self.answer(json.loads(line))
+                except (ValueError, KeyError) as e:
+                    reply = {"ok": False, "error": str(e)}
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def query(request: dict[str, Any], path: str = SOCKET_PATH) -> dict[str, Any]:
+    reader, writer = await asyncio.open_unix_connection(path)
+    try:
+        writer.write(json.dumps(request).encode() + b"\n")
+        await writer.drain()
+        reply = json.loads(await reader.readline())
+    finally:
+        writer.close()
+    if not reply["ok"]:
+        raise Exception(f"pwautoconnect: {reply['error']}")
+    return reply
+
+
+async def subgraph(
+    *,
+    defaults: list[str] = [],
+    port_fmts: list[str] = [],
+    aliases: list[str] = [],
+    path: str = SOCKET_PATH,
+) -> Graph:
+    """
+    The ports of the default nodes (e.g. "default.audio.sink"), the numbered ports
+    (e.g. "REAPER:in%d") and the named ports, with their nodes and links, from the
+    running daemon. Raises OSError if the daemon isn't running.
+    """
+    reply = await query(
+        {
+            "q": "subgraph",
+            "defaults": defaults,
+            "port_fmts": port_fmts,
+            "aliases": aliases,
+        },
+        path,
+    )
+    graph = Graph()
+    for obj in reply["objects"]:
+        graph.apply(obj)
+    return graph
+
+
+async def amain() -> None:
+    args = parser.parse_args()
+    daemon = AutoConnect(dry_run=args.dry_run)
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+    server = await asyncio.start_unix_server(daemon.handle_client, args.socket)
+    print(f"auto-connect: Listening on {args.socket}", flush=True)
+    t = time.monotonic()
+    monitor_task = asyncio.create_task(daemon.monitor())
+    connect_task = asyncio.create_task(daemon.connect_loop())
+    await daemon.ready.wait()
+    print(
+        f"auto-connect: Read {len(daemon.graph.ports)} ports and "
+        f"{len(daemon.graph.links)} links in {time.monotonic() - t:.3f} s",
+        flush=True,
+    )
+    async with server:
+        await asyncio.gather(monitor_task, connect_task)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(amain())
+    except KeyboardInterrupt:
+        pass
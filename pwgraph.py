@@ -0,0 +1,320 @@
+"""
+Indexed model of the PipeWire graph, as reported by pw-dump.
+
+Graph keeps typed tables of nodes, ports and links, with indexes for the
+lookups the actions need: nodes by name, ports by node and by alias,
+links by output and by input port. pw-dump's JSON is parsed incrementally
+as it is read, and removals and updates from `pw-dump --monitor` can be
+applied to an existing Graph.
+"""
+
+import asyncio
+import codecs
+import json
+import re
+import subprocess
+from dataclasses import dataclass, field
+from typing import Any, Iterator, Literal
+
+Direction = Literal["in", "out"]
+
+NODE = "PipeWire:Interface:Node"
+PORT = "PipeWire:Interface:Port"
+LINK = "PipeWire:Interface:Link"
+METADATA = "PipeWire:Interface:Metadata"
+
+
+@dataclass(slots=True)
+class Node:
+    id: int
+    name: str | None
+    props: dict[str, Any]
+
+
+@dataclass(slots=True)
+class Port:
+    id: int
+    node_id: int
+    # Index of the port within its node and direction
+    port_id: int
+    direction: Direction
+    alias: str | None
+    props: dict[str, Any]
+
+    @property
+    def physical(self) -> bool:
+        return bool(self.props.get("port.physical"))
+
+    @property
+    def monitor(self) -> bool:
+        return bool(self.props.get("port.monitor"))
+
+
+@dataclass(slots=True)
+class Link:
+    id: int
+    output_node: int
+    output_port: int
+    input_node: int
+    input_port: int
+
+
+@dataclass
+class Graph:
+    nodes: dict[int, Node] = field(default_factory=dict)
+    ports: dict[int, Port] = field(default_factory=dict)
+    links: dict[int, Link] = field(default_factory=dict)
+    # Values of the "default" metadata, e.g. "default.audio.sink" -> node name
+    defaults: dict[str, str] = field(default_factory=dict)
+    # Metadata object id -> metadata.name; updates don't repeat the name
+    metadata_names: dict[int, str] = field(default_factory=dict)
+
+    nodes_by_name: dict[str, int] = field(default_factory=dict)
+    # node id -> direction -> port.id -> port object id
+    ports_by_node: dict[int, dict[Direction, dict[int, int]]] = field(
+        default_factory=dict
+    )
+    ports_by_alias: dict[str, int] = field(default_factory=dict)
+    # port object id -> link id -> the port at the other end
+    links_by_output: dict[int, dict[int, int]] = field(default_factory=dict)
+    links_by_input: dict[int, dict[int, int]] = field(default_factory=dict)
+
+    def apply(self, obj: dict[str, Any]) -> None:
+        "Add, update or (when info is null) remove one object from pw-dump"
+        if obj.get("type") == METADATA or obj["id"] in self.metadata_names:
+            self._apply_metadata(obj)
+            return
+        oid = obj["id"]
+        if oid in self.nodes or oid in self.ports or oid in self.links:
+            self.remove(oid)
+        info = obj.get("info")
+        if info is None:
+            return
+        if obj["type"] == PORT:
+            self._add_port(oid, info)
+        elif obj["type"] == LINK:
+            self._add_link(oid, info)
+        elif obj["type"] == NODE:
+            self._add_node(oid, info)
+
+    def remove(self, oid: int) -> None:
+        self.metadata_names.pop(oid, None)
+        if (node := self.nodes.pop(oid, None)) is not None:
+            if node.name is not None and self.nodes_by_name.get(node.name) == oid:
+                del self.nodes_by_name[node.name]
+        elif (port := self.ports.pop(oid, None)) is not None:
+            by_id = self.ports_by_node.get(port.node_id, {}).get(port.direction, {})
+            if by_id.get(port.port_id) == oid:
+                del by_id[port.port_id]
+            if port.alias is not None and self.ports_by_alias.get(port.alias) == oid:
+                del self.ports_by_alias[port.alias]
+        elif (link := self.links.pop(oid, None)) is not None:
+            self.links_by_output.get(link.output_port, {}).pop(oid, None)
+            self.links_by_input.get(link.input_port, {}).pop(oid, None)
+
+    def _add_node(self, oid: int, info: dict[str, Any]) -> None:
+        props = info.get("props", {})
+        node = Node(oid, props.get("node.name"), props)
+        self.nodes[oid] = node
+        if node.name is not None:
+            self.nodes_by_name[node.name] = oid
+
+    def _add_port(self, oid: int, info: dict[str, Any]) -> None:
+        props = info.get("props", {})
+        direction = props.get("port.direction")
+        if direction not in ("in", "out") or "node.id" not in props:
+            return
+        port = Port(
+            oid,
+            props["node.id"],
+            props.get("port.id", 0),
+            direction,
+            props.get("port.alias"),
+            props,
+        )
+        self.ports[oid] = port
+        by_dir = self.ports_by_node.setdefault(port.node_id, {})
+        by_dir.setdefault(direction, {})[port.port_id] = oid
+        if port.alias is not None:
+            self.ports_by_alias[port.alias] = oid
+
+    def _add_link(self, oid: int, info: dict[str, Any]) -> None:
+        link = Link(
+            oid,
+            info["output-node-id"],
+            info["output-port-id"],
+            info["input-node-id"],
+            info["input-port-id"],
+        )
+        self.links[oid] = link
+        self.links_by_output.setdefault(link.output_port, {})[oid] = link.input_port
+        self.links_by_input.setdefault(link.input_port, {})[oid] = link.output_port
+
+    def _apply_metadata(self, obj: dict[str, Any]) -> None:
+        if "info" in obj and obj["info"] is None:
+            if self.metadata_names.get(obj["id"]) == "default":
+                self.defaults.clear()
+            self.remove(obj["id"])
+            return
+        if (name := (obj.get("props") or {}).get("metadata.name")) is not None:
+            self.metadata_names[obj["id"]] = name
+        if self.metadata_names.get(obj["id"]) != "default":
+            return
+        for md in obj.get("metadata") or []:
+            if md["subject"] != 0:
+                continue
+            if md.get("value") is None:
+                self.defaults.pop(md["key"], None)
+            elif md.get("type") == "Spa:String:JSON":
+                self.defaults[md["key"]] = md["value"]["name"]
+
+    def node_by_name(self, name: str) -> Node | None:
+        oid = self.nodes_by_name.get(name)
+        return None if oid is None else self.nodes[oid]
+
+    def default_node(self, key: str) -> Node | None:
+        "key is e.g. default.audio.sink or default.audio.source"
+        name = self.defaults.get(key)
+        return None if name is None else self.node_by_name(name)
+
+    def node_ports(self, node_id: int, direction: Direction) -> list[Port]:
+        "Ports of the node in the given direction, ordered by port.id"
+        by_id = self.ports_by_node.get(node_id, {}).get(direction, {})
+        return [self.ports[by_id[i]] for i in sorted(by_id)]
+
+    def port_by_alias(self, alias: str) -> Port | None:
+        oid = self.ports_by_alias.get(alias)
+        return None if oid is None else self.ports[oid]
+
+    def linked_inputs(self, output_port: int) -> set[int]:
+        return set(self.links_by_output.get(output_port, {}).values())
+
+    def linked_outputs(self, input_port: int) -> set[int]:
+        return set(self.links_by_input.get(input_port, {}).values())
+
+    def has_link(self, output_port: int, input_port: int) -> bool:
+        return input_port in self.links_by_output.get(output_port, {}).values()
+
+    def numbered_ports(self, fmt: str, start: int = 1) -> Iterator[tuple[int, Port]]:
+        "(n, port) for the ports with alias fmt % n, for n = start, start + 1, ..."
+        n = start
+        while (port := self.port_by_alias(fmt % n)) is not None:
+            yield n, port
+            n += 1
+
+    def subgraph_objects(self, port_ids: set[int]) -> list[dict[str, Any]]:
+        """
+        The given ports, their nodes, the links touching them and the defaults,
+        as pw-dump objects: Graph.apply() on them gives a graph with just those.
+        """
+        link_ids = {
+            link_id
+            for oid in port_ids
+            for by_port in (self.links_by_output, self.links_by_input)
+            for link_id in by_port.get(oid, {})
+        }
+        node_ids = {self.ports[oid].node_id for oid in port_ids} & self.nodes.keys()
+        objs: list[dict[str, Any]] = [
+            {
+                "id": 0,
+                "type": METADATA,
+                "props": {"metadata.name": "default"},
+                "metadata": [
+                    {
+                        "subject": 0,
+                        "key": k,
+                        "type": "Spa:String:JSON",
+                        "value": {"name": v},
+                    }
+                    for k, v in self.defaults.items()
+                ],
+            }
+        ]
+        for oid in node_ids:
+            objs.append(
+                {"id": oid, "type": NODE, "info": {"props": self.nodes[oid].props}}
+            )
+        for oid in port_ids:
+            objs.append(
+                {"id": oid, "type": PORT, "info": {"props": self.ports[oid].props}}
+            )
+        for oid in link_ids:
+            link = self.links[oid]
+            info = {
+                "output-node-id": link.output_node,
+                "output-port-id": link.output_port,
+                "input-node-id": link.input_node,
+                "input-port-id": link.input_port,
+            }
+            objs.append({"id": oid, "type": LINK, "info": info})
+        return objs
+
+
+_SEPARATORS = re.compile(r"[\s,]*")
+
+
+@dataclass
+class DumpParser:
+    """
+    Incremental parser for pw-dump output: a JSON array of objects,
+    or with --monitor, a sequence of such arrays (one per update).
+    """
+
+    buf: str = ""
+    pos: int = 0
+    in_array: bool = False
+    decoder: json.JSONDecoder = field(default_factory=json.JSONDecoder)
+
+    def feed(self, data: str) -> Iterator[dict[str, Any] | None]:
+        "Yield each complete object, and None at the end of each array"
+        self.buf = self.buf[self.pos :] + data
+        self.pos = 0
+        while True:
+            self.pos = _SEPARATORS.match(self.buf, self.pos).end()  # type: ignore
+            if self.pos == len(self.buf):
+                return
+            c = self.buf[self.pos]
+            if not self.in_array:
+                if c != "[":
+                    raise ValueError(f"pw-dump: expected '[', got {c!r}")
+                self.in_array = True
+                self.pos += 1
+            elif c == "]":
+                self.in_array = False
+                self.pos += 1
+                yield None
+            else:
+                try:
+                    obj, end = self.decoder.raw_decode(self.buf, self.pos)
+                except json.JSONDecodeError:
+                    # Incomplete object: wait for more data
+                    return
+                self.pos = end
+                yield obj
+
+    def close(self) -> None:
+        if self.in_array or self.buf[self.pos :].strip():
+            raise ValueError("pw-dump: truncated output")
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+async def dump(cmdline: tuple[str, ...] = ("pw-dump",)) -> Graph:
+    "Run pw-dump and build the graph while its output is being read"
+    proc = await asyncio.subprocess.create_subprocess_exec(
+        *cmdline, stdout=subprocess.PIPE
+    )
+    assert proc.stdout is not None
+    graph = Graph()
+    parser = DumpParser()
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    while chunk := await proc.stdout.read(CHUNK_SIZE):
+        for obj in parser.feed(decoder.decode(chunk)):
+            if obj is not None:
+                graph.apply(obj)
+    parser.close()
+    exitcode = await proc.wait()
+    if exitcode:
+        raise Exception(f"{cmdline[0]} exited with code {exitcode}")
+    return graph
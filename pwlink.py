@@ -0,0 +1,93 @@
+"""
+Create and destroy PipeWire links in batches.
+
+pw-link handles one link per process, and each process has to connect to
+PipeWire first, so doing links one after another costs a process start and
+a round trip each. apply_links() runs the pw-link processes concurrently,
+then re-reads the graph once to check that every link is in place.
+For a handful of links the processes are run one after another, since
+starting them all at once doesn't pay off there.
+
+Ports are given as pw-link accepts them: by object id or by name/alias.
+"""
+
+import asyncio
+from typing import Iterable
+
+import pwgraph
+
+PortRef = int | str
+
+# At most this many pw-link processes at a time
+CONCURRENCY = 16
+# Up to this many links (created plus destroyed), pw-link runs one at a time
+SEQUENTIAL_MAX = 4
+
+
+async def pw_link(*args: str, cmd: str = "pw-link") -> int:
+    proc = await asyncio.subprocess.create_subprocess_exec(cmd, *args)
+    return await proc.wait()
+
+
+def resolve(graph: pwgraph.Graph, ref: PortRef) -> int | None:
+    if isinstance(ref, int):
+        return ref if ref in graph.ports else None
+    port = graph.port_by_alias(ref)
+    return None if port is None else port.id
+
+
+async def apply_links(
+    create: Iterable[tuple[PortRef, PortRef]] = (),
+    destroy: Iterable[int] = (),
+    *,
+    verify: bool = True,
+    verbose: bool = True,
+    concurrency: int = CONCURRENCY,
+    cmd: str = "pw-link",
+    dump_cmdline: tuple[str, ...] = ("pw-dump",),
+) -> pwgraph.Graph | None:
+    """
+    Destroy the given links (by link id), then create the given (output, input) links.
+    With verify, returns the re-read graph, and raises if any link is missing or
+    still there. Otherwise returns None, and failing pw-link runs are only reported.
+    """
+    create = list(create)
+    destroy = list(destroy)
+    if len(create) + len(destroy) <= SEQUENTIAL_MAX:
+        concurrency = 1
+    limit = asyncio.Semaphore(concurrency)
+
+    async def run(*args: str) -> tuple[tuple[str, ...], int]:
+        async with limit:
+            if verbose:
+                print(cmd, " ".join(args), flush=True)
+            return args, await pw_link(*args, cmd=cmd)
+
+    failed = []
+    for results in (
+        await asyncio.gather(*(run("-d", str(link_id)) for link_id in destroy)),
+        await asyncio.gather(*(run(str(out), str(inp)) for out, inp in create)),
+    ):
+        failed += [(args, exitcode) for args, exitcode in results if exitcode]
+    for args, exitcode in failed:
+        print(f"{cmd} {' '.join(args)} exited with code {exitcode}", flush=True)
+    if not verify:
+        return None
+
+    graph = await pwgraph.dump(dump_cmdline)
+    problems = []
+    created = set()
+    for out, inp in create:
+        out_id = resolve(graph, out)
+        inp_id = resolve(graph, inp)
+        if out_id is None or inp_id is None or not graph.has_link(out_id, inp_id):
+            problems.append(f"{out} is not linked to {inp}")
+        created.add((out_id, inp_id))
+    for link_id in destroy:
+        # PipeWire reuses ids, so a new link may have the id of a destroyed one
+        link = graph.links.get(link_id)
+        if link is not None and (link.output_port, link.input_port) not in created:
+            problems.append(f"link {link_id} still exists")
+    if problems:
+        raise Exception("Could not link ports: " + "; ".join(problems))
+    return graph
@@ -0,0 +1,102 @@
+"""
+Benchmark pwlink.apply_links against running pw-link once per link,
+one after another, using the pwstub.py stand-in for the PipeWire tools.
+
+    python3 pwlinkbench.py --spawn-ms 30
+
+Both ways link the stand-in capture device to REAPER's inputs and check
+the result with one pw-dump; the batch then removes the links again.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import pwgraph
+import pwlink
+import pwstub
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--channels", type=int, nargs="+", default=[2, 8, 32, 128])
+parser.add_argument(
+    "--spawn-ms",
+    type=float,
+    default=30.0,
+    help="added to every pw-link run, for its round trips to PipeWire",
+)
+parser.add_argument("--nodes", type=int, default=100)
+
+
+async def link_one_by_one(pairs: list[tuple[int, int]], bindir: str) -> None:
+    "What Record from output monitor.py used to do"
+    for out, inp in pairs:
+        exitcode = await pwlink.pw_link(
+            str(out), str(inp), cmd=os.path.join(bindir, "pw-link")
+        )
+        if exitcode:
+            raise Exception(f"pw-link exited with code {exitcode}")
+    graph = await pwgraph.dump((os.path.join(bindir, "pw-dump"),))
+    assert all(graph.has_link(out, inp) for out, inp in pairs)
+
+
+async def bench(channels: int, args: argparse.Namespace, tmpdir: str) -> None:
+    state = os.path.join(tmpdir, f"graph{channels}.json")
+    bindir = os.path.join(tmpdir, "bin")
+    pwstub.install(bindir, state, args.spawn_ms)
+    tools = dict(
+        cmd=os.path.join(bindir, "pw-link"),
+        dump_cmdline=(os.path.join(bindir, "pw-dump"),),
+    )
+
+    def fresh_graph() -> list[tuple[int, int]]:
+        objs = pwstub.generate(channels, args.nodes)
+        with open(state, "w") as fp:
+            json.dump(objs, fp)
+        graph = pwgraph.Graph()
+        for obj in objs:
+            graph.apply(obj)
+        capture = graph.numbered_ports("Stub Capture:capture_AUX%d", 0)
+        return [
+            (port.id, graph.ports_by_alias[f"REAPER:in{25 + n}"]) for n, port in capture
+        ]
+
+    pairs = fresh_graph()
+    t = time.perf_counter()
+    await link_one_by_one(pairs, bindir)
+    sequential = time.perf_counter() - t
+
+    pairs = fresh_graph()
+    t = time.perf_counter()
+    graph = await pwlink.apply_links(pairs, verbose=False, **tools)
+    batch = time.perf_counter() - t
+    assert graph is not None
+
+    link_ids = [link_id for out, _ in pairs for link_id in graph.links_by_output[out]]
+    t = time.perf_counter()
+    graph = await pwlink.apply_links(destroy=link_ids, verbose=False, **tools)
+    unlink = time.perf_counter() - t
+    assert graph is not None and not graph.links
+
+    print(
+        f"{channels:8} {sequential:12.3f} {batch:12.3f} "
+        f"{sequential / batch:8.1f}x {unlink:12.3f}",
+        flush=True,
+    )
+
+
+async def amain() -> None:
+    args = parser.parse_args()
+    print(
+        f"{'channels':>8} {'one by one':>12} {'batch':>12} "
+        f"{'speedup':>9} {'batch unlink':>12}"
+    )
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for channels in args.channels:
+            await bench(channels, args, tmpdir)
+
+
+if __name__ == "__main__":
+    asyncio.run(amain())
@@ -0,0 +1,204 @@
+"""
+Scripted stand-in for pw-dump and pw-link, for trying out the PipeWire
+scripts without touching the real graph.
+
+The graph is a JSON file of pw-dump objects. pw-link adds and removes link
+objects in it, pw-dump prints it. Usage:
+
+    python3 pwstub.py generate /tmp/pw/graph.json --channels 16
+    python3 pwstub.py install /tmp/pw/bin /tmp/pw/graph.json --spawn-ms 10
+    PATH=/tmp/pw/bin:$PATH python3 "Record from output monitor.py"
+
+--spawn-ms adds a delay to every pw-link run, for what the real tool spends
+connecting to PipeWire.
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import shlex
+import sys
+import time
+from typing import Any
+
+# Not using pwgraph: importing asyncio would make every pw-link run slower
+# than the real one
+NODE = "PipeWire:Interface:Node"
+PORT = "PipeWire:Interface:Port"
+LINK = "PipeWire:Interface:Link"
+METADATA = "PipeWire:Interface:Metadata"
+
+parser = argparse.ArgumentParser()
+subparsers = parser.add_subparsers(dest="command", required=True)
+p = subparsers.add_parser("generate", help="write a synthetic graph")
+p.add_argument("state")
+p.add_argument(
+    "--channels",
+    type=int,
+    default=2,
+    help="ports of the capture device and REAPER inputs beyond 24",
+)
+p.add_argument("--nodes", type=int, default=100, help="unrelated filler nodes")
+p = subparsers.add_parser(
+    "install", help="write pw-dump and pw-link wrappers using the stand-in"
+)
+p.add_argument("bindir")
+p.add_argument("state")
+p.add_argument("--spawn-ms", type=float, default=0.0)
+p = subparsers.add_parser("pw-dump")
+p.add_argument("--state", required=True)
+p.add_argument("--monitor", action="store_true")
+p = subparsers.add_parser("pw-link")
+p.add_argument("--state", required=True)
+p.add_argument("--spawn-ms", type=float, default=0.0)
+p.add_argument("-d", "--disconnect", action="store_true")
+p.add_argument("ports", nargs="+")
+
+
+def generate(channels: int, nodes: int) -> list[dict[str, Any]]:
+    objs: list[dict[str, Any]] = []
+    next_id = iter(range(100, 10**9))
+
+    def node(name: str) -> int:
+        oid = next(next_id)
+        objs.append({"id": oid, "type": NODE, "info": {"props": {"node.name": name}}})
+        return oid
+
+    def port(
+        node_id: int, port_id: int, direction: str, alias: str, **props: Any
+    ) -> int:
+        oid = next(next_id)
+        props = {
+            "node.id": node_id,
+            "port.id": port_id,
+            "port.direction": direction,
+            "port.alias": alias,
+            **props,
+        }
+        objs.append({"id": oid, "type": PORT, "info": {"props": props}})
+        return oid
+
+    sink = node("alsa_output.stub")
+    for i, ch in enumerate(("FL", "FR")):
+        port(sink, i, "in", f"Stub Sink:playback_{ch}")
+        port(sink, i, "out", f"Stub Sink:monitor_{ch}", **{"port.monitor": True})
+    capture = node("alsa_input.stub")
+    for i in range(channels):
+        port(
+            capture, i, "out", f"Stub Capture:capture_AUX{i}", **{"port.physical": True}
+        )
+    reaper = node("REAPER")
+    for i in range(24 + channels):
+        port(reaper, i, "in", f"REAPER:in{i + 1}")
+        port(reaper, i, "out", f"REAPER:out{i + 1}")
+    for k in range(nodes):
+        filler = node(f"filler{k}")
+        port(filler, 0, "in", f"Filler {k}:in_MONO")
+        port(filler, 0, "out", f"Filler {k}:out_MONO")
+    objs.append(
+        {
+            "id": next(next_id),
+            "type": METADATA,
+            "props": {"metadata.name": "default"},
+            "metadata": [
+                {
+                    "subject": 0,
+                    "key": "default.audio.sink",
+                    "type": "Spa:String:JSON",
+                    "value": {"name": "alsa_output.stub"},
+                }
+            ],
+        }
+    )
+    return objs
+
+
+def install(bindir: str, state: str, spawn_ms: float) -> None:
+    os.makedirs(bindir, exist_ok=True)
+    stub = os.path.abspath(__file__)
+    for tool, extra in (("pw-dump", []), ("pw-link", ["--spawn-ms", str(spawn_ms)])):
+        args = [sys.executable, stub, tool, "--state", os.path.abspath(state), *extra]
+        path = os.path.join(bindir, tool)
+        with open(path, "w") as fp:
+            fp.write(f'#!/bin/sh\nexec {shlex.join(args)} "$@"\n')
+        os.chmod(path, 0o755)
+
+
+def pw_link(state: str, disconnect: bool, args: list[str]) -> int:
+    with open(state, "r+") as fp:
+        # pw-link runs concurrently
+        fcntl.flock(fp, fcntl.LOCK_EX)
+        objs = json.load(fp)
+        ports = {o["id"]: o["info"]["props"] for o in objs if o["type"] == PORT}
+        aliases = {props.get("port.alias"): oid for oid, props in ports.items()}
+        links = {o["id"]: o["info"] for o in objs if o["type"] == LINK}
+
+        def port_id(ref: str) -> int | None:
+            if ref.isdigit():
+                return int(ref) if int(ref) in ports else None
+            return aliases.get(ref)
+
+        if disconnect and len(args) == 1:
+            remove = {int(args[0])} & links.keys()
+        else:
+            if len(args) != 2:
+                print("pw-link: expected an output and an input port", file=sys.stderr)
+                return 2
+            out, inp = port_id(args[0]), port_id(args[1])
+            if out is None or inp is None:
+                print("pw-link: unknown port", file=sys.stderr)
+                return 1
+            existing = {
+                link_id
+                for link_id, info in links.items()
+                if info["output-port-id"] == out and info["input-port-id"] == inp
+            }
+            if disconnect:
+                remove = existing
+            elif existing:
+                print("pw-link: failed to link ports: File exists", file=sys.stderr)
+                return 1
+            else:
+                info = {
+                    "output-node-id": ports[out]["node.id"],
+                    "output-port-id": out,
+                    "input-node-id": ports[inp]["node.id"],
+                    "input-port-id": inp,
+                }
+                objs.append(
+                    {"id": max(o["id"] for o in objs) + 1, "type": LINK, "info": info}
+                )
+                remove = set()
+        if disconnect and not remove:
+            print("pw-link: link not found", file=sys.stderr)
+            return 1
+        objs = [o for o in objs if o["id"] not in remove]
+        fp.seek(0)
+        fp.truncate()
+        json.dump(objs, fp)
+    return 0
+
+
+def main() -> None:
+    args = parser.parse_args()
+    if args.command == "generate":
+        with open(args.state, "w") as fp:
+            json.dump(generate(args.channels, args.nodes), fp, indent=2)
+    elif args.command == "install":
+        install(args.bindir, args.state, args.spawn_ms)
+    elif args.command == "pw-dump":
+        with open(args.state) as fp:
+            fcntl.flock(fp, fcntl.LOCK_SH)
+            sys.stdout.write(fp.read())
+        if args.monitor:
+            # No updates ever come
+            while True:
+                time.sleep(3600)
+    elif args.command == "pw-link":
+        time.sleep(args.spawn_ms / 1000)
+        sys.exit(pw_link(args.state, args.disconnect, args.ports))
+
+
+if __name__ == "__main__":
+    main()
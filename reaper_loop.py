@@ -16,17 +16,25 @@ Usage:
         RPR_InsertMedia("test.mp3", 1)
 
     reaper_loop_run(main)
+
+Pass trace="/tmp/main.trace.json" (or set REAPER_TRACE) to record where the
+time goes, see reapertrace.py.
 """
 
 import asyncio.base_events
 import logging
 import sys
+import time
 import traceback
 import typing
 from typing import Any, Awaitable, Callable, TextIO
 
+import reapertrace
+
 
-def reaper_loop_run(f: Awaitable[None], name: str | None = None) -> None:
+def reaper_loop_run(
+    f: Awaitable[None], name: str | None = None, trace: str | bool | None = None
+) -> None:
     if name is None:
         name = traceback.extract_stack()[1][0]
     # Need to set asyncio logger to use stdout to get unhandled exception errors
@@ -35,6 +43,10 @@ def reaper_loop_run(f: Awaitable[None], name: str | None = None) -> None:
     logger.addHandler(logging.StreamHandler(sys.stdout))
     loop = ReaperCoopEventLoop()
     asyncio.set_event_loop(loop)
+    path = reapertrace.trace_path(trace, name)
+    if path is not None:
+        loop.tracer = reapertrace.Tracer(path)
+        loop.tracer.start(loop)
     loop.reaper_run_until_complete(f, name)
 
 
@@ -50,6 +62,7 @@ def reaper_run_until_complete_cb(fut):
 
 class ReaperCoopEventLoop(asyncio.SelectorEventLoop):
     reaper_script_name = "unknown"
+    tracer: reapertrace.Tracer | None = None
 
     def reaper_run_until_complete(self, future, name: str) -> None:
         self.reaper_script_name = name
@@ -75,15 +88,25 @@ class ReaperCoopEventLoop(asyncio.SelectorEventLoop):
         run_forever_cleanup = unixloop._run_forever_cleanup
         run_once = unixloop._run_once
 
+        def stop_tracer() -> None:
+            if self.tracer is not None:
+                self.tracer.stop()
+                self.tracer = None
+
+        def cleanup() -> None:
+            run_forever_cleanup()
+            stop_tracer()
+
         if unixloop._stopping:
             print("ReaperCoopEventLoop stopping early", flush=True)
+            stop_tracer()
             return
 
         try:
             run_forever_setup()
         except BaseException:
             print("ReaperCoopEventLoop crashing early", flush=True)
-            run_forever_cleanup()
+            cleanup()
             raise
 
         runloop = f"__runloop{id(self)}"
@@ -109,7 +132,7 @@ class ReaperCoopEventLoop(asyncio.SelectorEventLoop):
                     print(
                         f"{self.reaper_script_name}({id(self)}) cancelled", flush=True
                     )
-                    run_forever_cleanup()
+                    cleanup()
                     if isinstance(exc, SystemExit):
                         # Do not reraise SystemExit as it causes REAPER to exit.
                         if exc.args:
@@ -122,14 +145,19 @@ class ReaperCoopEventLoop(asyncio.SelectorEventLoop):
                     flush=True,
                 )
             print(f"{self.reaper_script_name}({id(self)}) cancelled", flush=True)
-            run_forever_cleanup()
+            cleanup()
 
         def _runloop_coop() -> None:
             try:
                 unixloop.call_soon(lambda: None)
-                run_once()
+                if self.tracer is None:
+                    run_once()
+                else:
+                    start = time.perf_counter()
+                    run_once()
+                    self.tracer.span("defer cycle", "loop", start, time.perf_counter())
             except BaseException as exc:
-                run_forever_cleanup()
+                cleanup()
                 if isinstance(exc, SystemExit):
                     # Do not reraise SystemExit as it causes REAPER to exit.
                     if exc.args:
@@ -138,7 +166,7 @@ class ReaperCoopEventLoop(asyncio.SelectorEventLoop):
                 raise exc
             if unixloop._stopping:
                 print(f"{self.reaper_script_name}({id(self)}) stopping", flush=True)
-                run_forever_cleanup()
+                cleanup()
             else:
                 RPR_runloop(f"{runloop}()")
 
@@ -0,0 +1,279 @@
+"""
+Benchmark rutil, autil and the tempo fitter against synthetic projects,
+using the reapersim stand-in for reaper_python.
+
+Each scenario reports wall time (the best of --repeat runs), bridge calls
+(RPR_* calls through the stand-in) and peak memory (tracemalloc, measured
+in a separate run so it doesn't slow down the timed ones).
+
+    python3 reaperbench.py              # compare with reaperbench_baseline.json
+    python3 reaperbench.py --save       # store the results as the new baseline
+    python3 reaperbench.py -k selection # only scenarios with "selection" in the name
+
+Compared with the baseline, any increase in bridge calls is a regression,
+and so is peak memory above --memory-factor times the baseline. The exit
+code is 1 if there are regressions.
+
+Times depend on the machine, so the baseline only has them if it was saved
+with --time, and then only for the host that saved it. On that host, time
+above --time-factor times the baseline (and more than --time-slack-ms above
+it) is a warning, or a regression with --time. The committed baseline has
+no times.
+"""
+
+import argparse
+import gc
+import importlib.util
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import types
+from dataclasses import dataclass
+from typing import Any, Callable
+
+import reapersim
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "-k", dest="filter", default="", help="only run scenarios whose name contains this"
+)
+parser.add_argument(
+    "--baseline",
+    default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "reaperbench_baseline.json"
+    ),
+)
+parser.add_argument(
+    "--save", action="store_true", help="store the results as the baseline"
+)
+parser.add_argument(
+    "--time",
+    action="store_true",
+    help="save times with the baseline, and fail on time regressions",
+)
+parser.add_argument(
+    "--repeat", type=int, default=5, help="time this many runs and take the best"
+)
+parser.add_argument("--time-factor", type=float, default=1.5)
+parser.add_argument(
+    "--time-slack-ms",
+    type=float,
+    default=5.0,
+    help="ignore time differences below this",
+)
+parser.add_argument("--memory-factor", type=float, default=1.25)
+parser.add_argument("--json", action="store_true", help="print results as JSON lines")
+
+reapersim.install()
+import autil  # noqa: E402
+import rutil  # noqa: E402
+
+
+def load_action(filename: str) -> types.ModuleType:
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+    spec = importlib.util.spec_from_file_location(
+        os.path.splitext(filename)[0].replace(" ", "_"), path
+    )
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+set_tempo = load_action("Set tempo from take markers.py")
+
+
+@dataclass
+class Scenario:
+    name: str
+    project: Callable[[], reapersim.Project]
+    run: Callable[[], Any]
+
+
+def with_time_selection(
+    proj: reapersim.Project, start: float, end: float
+) -> reapersim.Project:
+    proj.time_selection = (start, end)
+    return proj
+
+
+def reselect_every_other() -> None:
+    items = rutil.get_item_selection()
+    rutil.set_item_selection(items[::2])
+
+
+def all_take_markers() -> None:
+    for item in rutil.get_item_selection():
+        item.active_take.get_take_markers()
+
+
+def selected_audio_sources() -> None:
+    for item in rutil.get_item_selection():
+        autil.script_get_selected_audio_source(item)
+
+
+def scenarios() -> list[Scenario]:
+    res = []
+    for n in (10, 1000, 50000):
+        res += [
+            Scenario(
+                f"get_item_selection {n} items",
+                lambda n=n: reapersim.generate_project(items=n),
+                rutil.get_item_selection,
+            ),
+            Scenario(
+                f"set_item_selection {n} items",
+                lambda n=n: reapersim.generate_project(items=n),
+                reselect_every_other,
+            ),
+            Scenario(
+                f"script_get_selected_audio_source {n} items",
+                lambda n=n: with_time_selection(
+                    reapersim.generate_project(items=n), 1.0, 1e9
+                ),
+                selected_audio_sources,
+            ),
+        ]
+    for items, markers in ((1, 1000), (1, 100000), (1000, 100)):
+        res.append(
+            Scenario(
+                f"get_take_markers {items} items x {markers} markers",
+                lambda items=items, markers=markers: reapersim.generate_project(
+                    items=items, markers_per_take=markers
+                ),
+                all_take_markers,
+            )
+        )
+    for items, markers in ((10, 10), (1000, 100), (50000, 2)):
+        res.append(
+            Scenario(
+                f"set tempo from take markers {items} items x {markers} markers",
+                lambda items=items, markers=markers: reapersim.generate_project(
+                    items=items, markers_per_take=markers
+                ),
+                set_tempo.main,
+            )
+        )
+    return res
+
+
+@dataclass
+class Result:
+    name: str
+    seconds: float
+    calls: int
+    peak_kib: float
+
+    def row(self) -> str:
+        return (
+            f"{self.name:55} {1000 * self.seconds:10.1f} ms "
+            f"{self.calls:9} calls {self.peak_kib:10.0f} KiB"
+        )
+
+
+def measure(scenario: Scenario, repeat: int) -> Result:
+    times = []
+    for i in range(repeat):
+        reapersim.sim.project = scenario.project()
+        reapersim.stats.reset()
+        gc.collect()
+        t = time.perf_counter()
+        scenario.run()
+        times.append(time.perf_counter() - t)
+        if i == 0:
+            calls = reapersim.stats.total_calls
+
+    reapersim.sim.project = scenario.project()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        scenario.run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return Result(scenario.name, min(times), calls, peak / 1024)
+
+
+def regressions(
+    args: argparse.Namespace, result: Result, baseline: dict[str, Any]
+) -> tuple[list[str], list[str]]:
+    "Regressions and warnings compared with the baseline"
+    base = baseline.get(result.name)
+    if base is None:
+        return [], []
+    res = []
+    warnings = []
+    if result.calls > base["calls"]:
+        res.append(f"bridge calls {base['calls']} -> {result.calls}")
+    if (
+        "seconds" in base
+        and base.get("host") == platform.node()
+        and result.seconds
+        > max(
+            args.time_factor * base["seconds"],
+            base["seconds"] + args.time_slack_ms / 1000,
+        )
+    ):
+        (res if args.time else warnings).append(
+            f"time {1000 * base['seconds']:.1f} -> {1000 * result.seconds:.1f} ms"
+        )
+    if result.peak_kib > args.memory_factor * base["peak_kib"]:
+        res.append(f"peak memory {base['peak_kib']:.0f} -> {result.peak_kib:.0f} KiB")
+    return res, warnings
+
+
+def baseline_entry(args: argparse.Namespace, result: Result) -> dict[str, Any]:
+    entry: dict[str, Any] = {"calls": result.calls, "peak_kib": result.peak_kib}
+    if args.time:
+        entry.update(seconds=result.seconds, host=platform.node())
+    return entry
+
+
+def main() -> None:
+    args = parser.parse_args()
+    baseline: dict[str, Any] = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+    results = []
+    failed = []
+    for scenario in scenarios():
+        if args.filter not in scenario.name:
+            continue
+        result = measure(scenario, args.repeat)
+        results.append(result)
+        problems, warnings = [], []
+        if not args.save:
+            problems, warnings = regressions(args, result, baseline)
+        if args.json:
+            print(
+                json.dumps(
+                    {**result.__dict__, "regressions": problems, "warnings": warnings}
+                ),
+                flush=True,
+            )
+        else:
+            print(
+                result.row()
+                + "".join(f"\n    REGRESSION: {p}" for p in problems)
+                + "".join(f"\n    warning: {w}" for w in warnings),
+                flush=True,
+            )
+        if problems:
+            failed.append(result.name)
+    if args.save:
+        baseline.update({r.name: baseline_entry(args, r) for r in results})
+        with open(args.baseline, "w") as fp:
+            json.dump(baseline, fp, indent=2)
+            fp.write("\n")
+        print(f"Saved {len(results)} results to {args.baseline}", file=sys.stderr)
+    elif failed:
+        print(f"{len(failed)} regressions", file=sys.stderr)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
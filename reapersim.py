@@ -0,0 +1,589 @@
+"""
+In-memory REAPER project behind a stand-in for reaper_python, so rutil,
+autil and the actions can be run and measured outside of REAPER.
+
+The project has tracks, media items, takes with sources and take markers,
+the item and track selection, the time selection, tempo markers and the
+transport. Sim implements the RPR_* functions the scripts use on top of it,
+with the same argument and return conventions as ReaScript (functions with
+output parameters return a tuple of the return value and all parameters).
+Every call through the stand-in is counted and timed in `stats`.
+
+    import reapersim
+    reapersim.install(reapersim.generate_project(items=1000))
+    import rutil
+    rutil.get_item_selection()
+    print(reapersim.stats.report())
+
+install() uses the module generated by `python3 make_pyi.py --stand-in`
+(reaper_python_sim.py, which has every function of the ReaScript API with
+its real parameters) when it can be imported, and otherwise a module with
+just the functions Sim implements.
+"""
+
+import collections
+import functools
+import math
+import sys
+import time
+import types
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator
+
+DEFAULT_BPM = 120.0
+DEFAULT_SOURCE_LENGTH = 60.0
+# Main_OnCommand command ids that Sim implements
+INSERT_EMPTY_ITEM = 40142
+
+
+@dataclass(eq=False)
+class Source:
+    path: str
+    length: float = DEFAULT_SOURCE_LENGTH
+    # Runs of PCM_Source_BuildPeaks(src, 1) left before the peaks are done
+    peaks_todo: int = 3
+    destroyed: bool = False
+
+
+@dataclass(eq=False)
+class Take:
+    item: "Item"
+    source: Source
+    info: dict[str, float] = field(
+        default_factory=lambda: {"D_STARTOFFS": 0.0, "D_PLAYRATE": 1.0}
+    )
+    # (srcpos, name, color), kept sorted by srcpos like REAPER does
+    markers: list[tuple[float, str, int]] = field(default_factory=list)
+
+
+@dataclass(eq=False)
+class Item:
+    track: "Track"
+    info: dict[str, float] = field(
+        default_factory=lambda: {
+            "D_POSITION": 0.0,
+            "D_LENGTH": 0.0,
+            "C_BEATATTACHMODE": -1.0,
+        }
+    )
+    strings: dict[str, str] = field(default_factory=dict)
+    takes: list[Take] = field(default_factory=list)
+    active_take: int = 0
+    selected: bool = False
+
+
+@dataclass(eq=False)
+class Track:
+    name: str = ""
+    info: dict[str, float] = field(
+        default_factory=lambda: {"B_MUTE": 0.0, "I_RECINPUT": -1.0, "I_RECMON": 0.0}
+    )
+    items: list[Item] = field(default_factory=list)
+    selected: bool = False
+
+
+@dataclass(eq=False)
+class Project:
+    path: str = "/tmp/reapersim"
+    filename: str = "/tmp/reapersim/sim.rpp"
+    tracks: list[Track] = field(default_factory=list)
+    time_selection: tuple[float, float] = (0.0, 0.0)
+    loop: bool = False
+    cursor: float = 0.0
+    play_state: int = 0
+    play_position: float = 0.0
+    # (time, bpm), sorted by time; DEFAULT_BPM before the first one
+    tempo_markers: list[tuple[float, float]] = field(default_factory=list)
+    undo_blocks: list[str] = field(default_factory=list)
+    undo_depth: int = 0
+    console: list[str] = field(default_factory=list)
+    commands: list[int] = field(default_factory=list)
+    # Built on demand, dropped when items or their selection change
+    _selected_items: list[Item] | None = None
+
+    def items(self) -> Iterator[Item]:
+        for track in self.tracks:
+            yield from track.items
+
+    def selected_items(self) -> list[Item]:
+        if self._selected_items is None:
+            self._selected_items = [item for item in self.items() if item.selected]
+        return self._selected_items
+
+    def selected_tracks(self) -> list[Track]:
+        return [track for track in self.tracks if track.selected]
+
+    def set_item_selected(self, item: Item, selected: bool) -> None:
+        if item.selected != selected:
+            item.selected = selected
+            self._selected_items = None
+
+    def add_item(
+        self, track: Track, position: float, length: float, source: Source | None = None
+    ) -> Item:
+        item = Item(track)
+        item.info["D_POSITION"] = position
+        item.info["D_LENGTH"] = length
+        if source is not None:
+            item.takes.append(Take(item, source))
+        track.items.append(item)
+        self._selected_items = None
+        return item
+
+    def insert_track(self, index: int) -> Track:
+        track = Track()
+        self.tracks.insert(index, track)
+        return track
+
+
+def generate_project(
+    items: int = 10,
+    tracks: int = 0,
+    markers_per_take: int = 0,
+    selected: int | None = None,
+    item_length: float = 10.0,
+) -> Project:
+    """
+    A project with the given number of items, spread over `tracks` tracks
+    (by default one per 100 items), each with a take with take markers every
+    half second. The first `selected` items (by default all) are selected.
+    """
+    proj = Project()
+    tracks = tracks or max(1, math.ceil(items / 100))
+    for t in range(tracks):
+        proj.tracks.append(Track(name=f"Track {t + 1}"))
+    for i in range(items):
+        track = proj.tracks[i % tracks]
+        source = Source(f"{proj.path}/audio{i}.flac", length=item_length * 2)
+        item = proj.add_item(track, (i // tracks) * item_length, item_length, source)
+        item.takes[0].markers = [(0.5 * k, "", 0) for k in range(markers_per_take)]
+        item.selected = selected is None or i < selected
+    proj.tracks[0].selected = True
+    return proj
+
+
+class Unimplemented(Exception):
+    pass
+
+
+class Sim:
+    """
+    RPR_* functions on an in-memory Project. Projects (ReaProject) are passed
+    as None for the current one or as the Project object itself; the other
+    handles (MediaTrack, MediaItem, MediaItem_Take, PCM_source) are the model
+    objects.
+    """
+
+    def __init__(self, project: Project | None = None) -> None:
+        self.project = project or Project()
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("RPR_"):
+            raise Unimplemented(f"{name} is not implemented by reapersim")
+        raise AttributeError(name)
+
+    def proj(self, proj: Project | None) -> Project:
+        return self.project if proj is None else proj
+
+    # Console, undo and UI
+
+    def RPR_ShowConsoleMsg(self, msg: str) -> None:
+        self.project.console.append(msg)
+
+    def RPR_Undo_BeginBlock2(self, proj: Project | None) -> None:
+        self.proj(proj).undo_depth += 1
+
+    def RPR_Undo_EndBlock2(
+        self, proj: Project | None, descchange: str, extraflags: int
+    ) -> None:
+        p = self.proj(proj)
+        p.undo_depth -= 1
+        if not p.undo_depth:
+            p.undo_blocks.append(descchange)
+
+    def RPR_UpdateArrange(self) -> None:
+        pass
+
+    def RPR_Main_OnCommand(self, command: int, flag: int) -> None:
+        p = self.project
+        p.commands.append(command)
+        if command == INSERT_EMPTY_ITEM:
+            # On the first selected track, over the time selection,
+            # selecting just the new item
+            tracks = p.selected_tracks()
+            start, end = p.time_selection
+            if not tracks or start >= end:
+                return
+            for item in p.selected_items():
+                p.set_item_selected(item, False)
+            p.set_item_selected(p.add_item(tracks[0], start, end - start), True)
+
+    # Projects, transport and time
+
+    def RPR_EnumProjects(
+        self, idx: int, projfn: str, projfn_sz: int
+    ) -> tuple[Any, int, str, int]:
+        if idx not in (-1, 0):
+            return None, idx, "", projfn_sz
+        return self.project, idx, self.project.filename, projfn_sz
+
+    def RPR_GetProjectPath(self, buf: str, buf_sz: int) -> tuple[str, int]:
+        return self.project.path, buf_sz
+
+    def RPR_GetPlayStateEx(self, proj: Project | None) -> int:
+        return self.proj(proj).play_state
+
+    def RPR_GetPlayPositionEx(self, proj: Project | None) -> float:
+        p = self.proj(proj)
+        return p.play_position if p.play_state else p.cursor
+
+    def RPR_GetPlayPosition2Ex(self, proj: Project | None) -> float:
+        return self.RPR_GetPlayPositionEx(proj)
+
+    def RPR_GetCursorPosition(self) -> float:
+        return self.project.cursor
+
+    def RPR_GetCursorPositionEx(self, proj: Project | None) -> float:
+        return self.proj(proj).cursor
+
+    def RPR_SetEditCurPos2(
+        self, proj: Project | None, time: float, moveview: bool, seekplay: bool
+    ) -> None:
+        p = self.proj(proj)
+        p.cursor = time
+        if p.play_state and seekplay:
+            p.play_position = time
+
+    def RPR_OnPlayButtonEx(self, proj: Project | None) -> None:
+        p = self.proj(proj)
+        p.play_state = 1
+        p.play_position = p.cursor
+
+    def RPR_OnStopButtonEx(self, proj: Project | None) -> None:
+        self.proj(proj).play_state = 0
+
+    def RPR_GetSet_LoopTimeRange(
+        self, isSet: bool, isLoop: bool, start: float, end: float, allowautoseek: bool
+    ) -> tuple[bool, bool, float, float, bool]:
+        p = self.project
+        if isSet:
+            p.time_selection = (start, end)
+            p.loop = isLoop
+        else:
+            start, end = p.time_selection
+        return isSet, isLoop, start, end, allowautoseek
+
+    def tempo_segments(
+        self, proj: Project | None
+    ) -> Iterator[tuple[float, float, float]]:
+        "(time, qn, bpm) at the start of each tempo segment"
+        t, qn, bpm = 0.0, 0.0, DEFAULT_BPM
+        yield t, qn, bpm
+        for mt, mbpm in self.proj(proj).tempo_markers:
+            qn += (mt - t) * bpm / 60
+            t, bpm = mt, mbpm
+            yield t, qn, bpm
+
+    def RPR_TimeMap2_timeToQN(self, proj: Project | None, tpos: float) -> float:
+        seg = (0.0, 0.0, DEFAULT_BPM)
+        for s in self.tempo_segments(proj):
+            if s[0] > tpos:
+                break
+            seg = s
+        t, qn, bpm = seg
+        return qn + (tpos - t) * bpm / 60
+
+    def RPR_TimeMap2_QNToTime(self, proj: Project | None, qn: float) -> float:
+        seg = (0.0, 0.0, DEFAULT_BPM)
+        for s in self.tempo_segments(proj):
+            if s[1] > qn:
+                break
+            seg = s
+        t, sqn, bpm = seg
+        return t + (qn - sqn) * 60 / bpm
+
+    def RPR_SetTempoTimeSigMarker(
+        self,
+        proj: Project | None,
+        ptidx: int,
+        timepos: float,
+        measurepos: int,
+        beatpos: float,
+        bpm: float,
+        timesig_num: int,
+        timesig_denom: int,
+        lineartempo: bool,
+    ) -> bool:
+        markers = self.proj(proj).tempo_markers
+        if ptidx < 0:
+            markers.append((timepos, bpm))
+        elif ptidx < len(markers):
+            markers[ptidx] = (timepos, bpm)
+        else:
+            return False
+        markers.sort()
+        return True
+
+    def RPR_parse_timestr_pos(self, buf: str, modeoverride: int) -> float:
+        "Seconds, or measures.beats (4/4) when modeoverride is 2"
+        if modeoverride == 2:
+            measure, beat = (float(x) for x in buf.split(".")[:2])
+            return self.RPR_TimeMap2_QNToTime(None, (measure - 1) * 4 + beat - 1)
+        try:
+            return float(buf)
+        except ValueError:
+            return 0.0
+
+    # Media insertion and sources
+
+    def RPR_InsertMedia(self, file: str, mode: int) -> int:
+        "At the edit cursor: mode 0 on the first selected track, 1 on a new one below"
+        p = self.project
+        tracks = p.selected_tracks()
+        index = p.tracks.index(tracks[-1]) if tracks else len(p.tracks) - 1
+        if mode & 1 or not p.tracks:
+            track = p.insert_track(index + 1)
+            for t in tracks:
+                t.selected = False
+            track.selected = True
+        else:
+            track = p.tracks[max(index, 0)]
+        source = self.RPR_PCM_Source_CreateFromFile(file)
+        for item in p.selected_items():
+            p.set_item_selected(item, False)
+        p.set_item_selected(p.add_item(track, p.cursor, source.length, source), True)
+        return 1
+
+    def RPR_PCM_Source_CreateFromFile(self, filename: str) -> Source:
+        return Source(filename)
+
+    def RPR_PCM_Source_Destroy(self, src: Source) -> None:
+        src.destroyed = True
+
+    def RPR_PCM_Source_BuildPeaks(self, src: Source, mode: int) -> int:
+        if mode == 0:
+            return int(src.peaks_todo > 0)
+        if mode == 1:
+            src.peaks_todo = max(0, src.peaks_todo - 1)
+            return 100 * src.peaks_todo
+        return 0
+
+    def RPR_GetMediaSourceFileName(
+        self, source: Source, filenamebuf: str, filenamebuf_sz: int
+    ) -> tuple[Source, str, int]:
+        return source, source.path, filenamebuf_sz
+
+    def RPR_GetMediaSourceLength(
+        self, source: Source, lengthIsQN: bool
+    ) -> tuple[float, Source, bool]:
+        return source.length, source, False
+
+    # Tracks
+
+    def RPR_CountSelectedTracks(self, proj: Project | None) -> int:
+        return len(self.proj(proj).selected_tracks())
+
+    def RPR_GetSelectedTrack(
+        self, proj: Project | None, seltrackidx: int
+    ) -> Track | None:
+        tracks = self.proj(proj).selected_tracks()
+        return tracks[seltrackidx] if 0 <= seltrackidx < len(tracks) else None
+
+    def RPR_IsTrackSelected(self, track: Track) -> bool:
+        return track.selected
+
+    def RPR_SetTrackSelected(self, track: Track, selected: bool) -> None:
+        track.selected = bool(selected)
+
+    def RPR_GetTrackName(
+        self, track: Track, buf: str, buf_sz: int
+    ) -> tuple[bool, Track, str, int]:
+        return True, track, track.name, buf_sz
+
+    def RPR_GetMediaTrackInfo_Value(self, tr: Track, parmname: str) -> float:
+        return tr.info.get(parmname, 0.0)
+
+    def RPR_SetMediaTrackInfo_Value(
+        self, tr: Track, parmname: str, newvalue: float
+    ) -> bool:
+        tr.info[parmname] = float(newvalue)
+        return True
+
+    # Items
+
+    def RPR_CountSelectedMediaItems(self, proj: Project | None) -> int:
+        return len(self.proj(proj).selected_items())
+
+    def RPR_GetSelectedMediaItem(
+        self, proj: Project | None, selitem: int
+    ) -> Item | None:
+        items = self.proj(proj).selected_items()
+        return items[selitem] if 0 <= selitem < len(items) else None
+
+    def RPR_IsMediaItemSelected(self, item: Item) -> bool:
+        return item.selected
+
+    def RPR_SetMediaItemSelected(self, item: Item, selected: bool) -> None:
+        self.project.set_item_selected(item, bool(selected))
+
+    def RPR_GetMediaItem_Track(self, item: Item) -> Track:
+        return item.track
+
+    def RPR_GetActiveTake(self, item: Item) -> Take | None:
+        return item.takes[item.active_take] if item.takes else None
+
+    def RPR_GetMediaItemInfo_Value(self, item: Item, parmname: str) -> float:
+        if parmname == "B_UISEL":
+            return float(item.selected)
+        return item.info.get(parmname, 0.0)
+
+    def RPR_SetMediaItemInfo_Value(
+        self, item: Item, parmname: str, newvalue: float
+    ) -> bool:
+        if parmname == "B_UISEL":
+            self.project.set_item_selected(item, bool(newvalue))
+        else:
+            item.info[parmname] = float(newvalue)
+        return True
+
+    def RPR_GetSetMediaItemInfo_String(
+        self, item: Item, parmname: str, stringNeedBig: str, setNewValue: bool
+    ) -> tuple[bool, Item, str, str, bool]:
+        if setNewValue:
+            item.strings[parmname] = stringNeedBig
+        else:
+            stringNeedBig = item.strings.get(parmname, "")
+        return True, item, parmname, stringNeedBig, setNewValue
+
+    # Takes
+
+    def RPR_GetMediaItemTake_Source(self, take: Take) -> Source:
+        return take.source
+
+    def RPR_GetMediaItemTakeInfo_Value(self, take: Take, parmname: str) -> float:
+        return take.info.get(parmname, 0.0)
+
+    def RPR_SetMediaItemTakeInfo_Value(
+        self, take: Take, parmname: str, newvalue: float
+    ) -> bool:
+        take.info[parmname] = float(newvalue)
+        return True
+
+    def RPR_GetNumTakeMarkers(self, take: Take) -> int:
+        return len(take.markers)
+
+    def RPR_GetTakeMarker(
+        self, take: Take, idx: int, nameOut: str, nameOut_sz: int, colorOutOptional: int
+    ) -> tuple[float, Take, int, str, int, int]:
+        if not 0 <= idx < len(take.markers):
+            return -1.0, take, idx, "", nameOut_sz, 0
+        srcpos, name, color = take.markers[idx]
+        return srcpos, take, idx, name, nameOut_sz, color
+
+    def RPR_SetTakeMarker(
+        self,
+        take: Take,
+        idx: int,
+        nameIn: str,
+        srcposInOptional: float,
+        colorInOptional: int,
+    ) -> int:
+        marker = (srcposInOptional, nameIn, colorInOptional)
+        if 0 <= idx < len(take.markers):
+            del take.markers[idx]
+        elif idx != -1:
+            return -1
+        # REAPER keeps them sorted, so the index of the new marker is its place
+        i = sum(1 for m in take.markers if m[0] <= srcposInOptional)
+        take.markers.insert(i, marker)
+        return i
+
+    def RPR_DeleteTakeMarker(self, take: Take, idx: int) -> bool:
+        if not 0 <= idx < len(take.markers):
+            return False
+        del take.markers[idx]
+        return True
+
+
+@dataclass
+class Stats:
+    "Bridge calls made through the stand-in: count and total seconds per function"
+
+    calls: collections.Counter[str] = field(default_factory=collections.Counter)
+    seconds: collections.defaultdict[str, float] = field(
+        default_factory=lambda: collections.defaultdict(float)
+    )
+
+    def reset(self) -> None:
+        self.calls.clear()
+        self.seconds.clear()
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(self.seconds.values())
+
+    def report(self) -> str:
+        lines = [f"{self.total_calls} calls, {1000 * self.total_seconds:.1f} ms"]
+        for name, n in self.calls.most_common():
+            lines.append(f"  {name:40} {n:9} {1000 * self.seconds[name]:10.1f} ms")
+        return "\n".join(lines)
+
+
+stats = Stats()
+sim = Sim()
+
+
+def bridge(f: Callable[..., Any]) -> Callable[..., Any]:
+    "Count and time every call of the stand-in function f in stats"
+    name = f.__name__
+    calls = stats.calls
+    seconds = stats.seconds
+    perf_counter = time.perf_counter
+
+    @functools.wraps(f)
+    def wrapper(*args: Any) -> Any:
+        t = perf_counter()
+        try:
+            return f(*args)
+        finally:
+            seconds[name] += perf_counter() - t
+            calls[name] += 1
+
+    return wrapper
+
+
+def implemented() -> list[str]:
+    return sorted(name for name in vars(Sim) if name.startswith("RPR_"))
+
+
+def fallback_module() -> types.ModuleType:
+    "reaper_python with just the functions of Sim, if reaper_python_sim isn't generated"
+    module = types.ModuleType("reaper_python")
+    for name in implemented():
+
+        def call(*args: Any, name: str = name) -> Any:
+            return getattr(sim, name)(*args)
+
+        call.__name__ = name
+        setattr(module, name, bridge(call))
+    module.__all__ = implemented()  # type: ignore
+    return module
+
+
+def install(project: Project | None = None) -> types.ModuleType:
+    """
+    Make `import reaper_python` give the stand-in, backed by the given project.
+    Call before importing rutil or the actions.
+    """
+    sim.project = project or Project()
+    stats.reset()
+    try:
+        import reaper_python_sim as module
+    except ImportError:
+        module = fallback_module()
+    sys.modules["reaper_python"] = module
+    return module
@@ -0,0 +1,302 @@
+"""
+Opt-in tracing of where an action spends its time: REAPER bridge calls
+(RPR_*), asyncio tasks, subprocesses and the defer cycles of
+ReaperCoopEventLoop. The trace is written as Chrome trace-event JSON, which
+chrome://tracing and https://ui.perfetto.dev can open.
+
+Switch it on for one action:
+
+    reaper_loop_run(amain(), trace="/tmp/split.trace.json")
+
+or for every action on reaper_loop, by starting REAPER with REAPER_TRACE set
+to a file name, or to 1 for /tmp/<script name>.trace.json.
+
+Each RPR_* function of reaper_python is replaced, in reaper_python and in
+every module that imported it (rutil's `import *` included), by a wrapper
+recording its name, duration, caller and the asyncio task it ran in.
+Time within a defer cycle that isn't covered by a bridge call is Python.
+The trace is written when the loop stops.
+
+Actions run concurrently and may stop in any order, so the wrappers are
+shared: they are installed when the first tracer starts, record into the
+tracers that are running, and the originals are restored when the last
+tracer stops.
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+ENV_VAR = "REAPER_TRACE"
+# Long-running actions (like the MuseScore sync) would otherwise grow without bound
+MAX_EVENTS = 1_000_000
+
+PID = 1
+TID = 1
+
+
+def trace_path(trace: str | bool | None, script_name: str) -> str | None:
+    "The file to trace to, from reaper_loop_run's argument or else the environment"
+    if trace is None:
+        trace = os.environ.get(ENV_VAR) or None
+        if trace == "0":
+            trace = None
+    if not trace:
+        return None
+    if trace is True or trace == "1":
+        base = os.path.splitext(os.path.basename(script_name))[0]
+        return os.path.join(tempfile.gettempdir(), f"{base}.trace.json")
+    return str(trace)
+
+
+# Running tracers, in start order
+_active: list["Tracer"] = []
+# id(original) -> (original, wrapper) and id(wrapper) -> (wrapper, original),
+# while the wrappers are installed
+_wrapper_of: dict[int, tuple[Any, Any]] = {}
+_original_of: dict[int, tuple[Any, Any]] = {}
+
+
+def _tracers() -> list["Tracer"]:
+    "The tracers to record into: the one of the running loop, if any, else all"
+    loop = asyncio._get_running_loop()
+    return [t for t in _active if t.loop is loop] or _active
+
+
+def _caller(frame: Any) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{frame.f_lineno} {code.co_name}"
+
+
+def _wrap(name: str, f: Callable[..., Any]) -> Callable[..., Any]:
+    perf_counter = time.perf_counter
+
+    def traced(*args: Any) -> Any:
+        if not _active:
+            return f(*args)
+        start = perf_counter()
+        try:
+            return f(*args)
+        finally:
+            end = perf_counter()
+            where = _caller(sys._getframe(1))
+            for tracer in _tracers():
+                info = {"caller": where, "task": tracer.current_task_name()}
+                tracer.span(name, "rpr", start, end, info)
+
+    traced.__name__ = name
+    traced.__wrapped__ = f  # type: ignore
+    return traced
+
+
+def _wrap_exec(create_subprocess_exec: Callable[..., Any]) -> Callable[..., Any]:
+    async def traced_exec(
+        program: Any, *args: Any, **kwargs: Any
+    ) -> asyncio.subprocess.Process:
+        start = time.perf_counter()
+        proc = await create_subprocess_exec(program, *args, **kwargs)
+        argv = [str(a) for a in (program, *args)]
+        tracers = [(t, t.current_task_name()) for t in _tracers()]
+
+        def exited(_: Any) -> None:
+            end = time.perf_counter()
+            name = os.path.basename(argv[0])
+            for tracer, task_name in tracers:
+                info = {"argv": argv, "returncode": proc.returncode, "task": task_name}
+                span_id = next(tracer.ids)
+                tracer.async_span(name, "subprocess", span_id, start, end, info)
+
+        if tracers:
+            # Not through the task factory, so it doesn't show up as a task
+            asyncio.Task(proc.wait()).add_done_callback(exited)
+        return proc
+
+    traced_exec.__wrapped__ = create_subprocess_exec  # type: ignore
+    return traced_exec
+
+
+def _traced_name(name: str) -> bool:
+    return name.startswith("RPR_") or name == "create_subprocess_exec"
+
+
+def _swap(replacements: dict[int, tuple[Any, Any]]) -> None:
+    "In every module, replace each value `a` of the (a, b) pairs by `b`"
+    for module in list(sys.modules.values()):
+        namespace = getattr(module, "__dict__", None)
+        if not isinstance(namespace, dict):
+            continue
+        for name, value in list(namespace.items()):
+            if _traced_name(name) and id(value) in replacements:
+                old, new = replacements[id(value)]
+                if old is value:
+                    namespace[name] = new
+
+
+def _install() -> None:
+    """
+    Wrap the RPR_* functions and create_subprocess_exec, wherever they are.
+    Also run for later tracers, for modules imported since.
+    """
+    import reaper_python
+
+    originals = [
+        (name, f)
+        for name, f in vars(reaper_python).items()
+        if name.startswith("RPR_") and callable(f)
+    ]
+    originals.append(
+        ("create_subprocess_exec", asyncio.subprocess.create_subprocess_exec)
+    )
+    for name, f in originals:
+        if id(f) in _wrapper_of or id(f) in _original_of:
+            continue
+        if name == "create_subprocess_exec":
+            wrapper = _wrap_exec(f)
+        else:
+            wrapper = _wrap(name, f)
+        _wrapper_of[id(f)] = (f, wrapper)
+        _original_of[id(wrapper)] = (wrapper, f)
+    _swap(_wrapper_of)
+
+
+def _uninstall() -> None:
+    "Put the originals back, including where modules imported the wrappers"
+    _swap(_original_of)
+    _wrapper_of.clear()
+    _original_of.clear()
+
+
+@dataclass
+class Tracer:
+    path: str
+    events: list[dict[str, Any]] = field(default_factory=list)
+    dropped: int = 0
+    t0: float = field(default_factory=time.perf_counter)
+    ids: Any = field(default_factory=itertools.count)
+    # Tasks still running: task -> (id, start)
+    tasks: dict[asyncio.Task[Any], tuple[int, float]] = field(default_factory=dict)
+    loop: asyncio.AbstractEventLoop | None = None
+
+    def us(self, t: float) -> float:
+        return (t - self.t0) * 1e6
+
+    def emit(self, event: dict[str, Any]) -> None:
+        if len(self.events) >= MAX_EVENTS:
+            self.dropped += 1
+            return
+        event.setdefault("pid", PID)
+        event.setdefault("tid", TID)
+        self.events.append(event)
+
+    def span(
+        self,
+        name: str,
+        cat: str,
+        start: float,
+        end: float,
+        args: dict[str, Any] | None = None,
+    ) -> None:
+        event = {
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "ts": self.us(start),
+            "dur": (end - start) * 1e6,
+        }
+        if args:
+            event["args"] = args
+        self.emit(event)
+
+    def async_span(
+        self,
+        name: str,
+        cat: str,
+        span_id: int,
+        start: float,
+        end: float,
+        args: dict[str, Any],
+    ) -> None:
+        "A span that overlaps others on the same thread, like a task or a subprocess"
+        begin = {"ph": "b", "id": span_id, "ts": self.us(start), "args": args}
+        self.emit({"name": name, "cat": cat, **begin})
+        self.emit(
+            {"name": name, "cat": cat, "ph": "e", "id": span_id, "ts": self.us(end)}
+        )
+
+    def task_name(self, task: asyncio.Task[Any], span_id: int) -> str:
+        name = task.get_name()
+        # Python 3.13 names tasks from a task factory "None" unless given a name
+        return f"Task-{span_id}" if name in (None, "None") else name
+
+    def current_task_name(self) -> str | None:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            return None
+        if task is None:
+            return None
+        if task in self.tasks:
+            return self.task_name(task, self.tasks[task][0])
+        return task.get_name()
+
+    def task_factory(
+        self, loop: asyncio.AbstractEventLoop, coro: Any, **kwargs: Any
+    ) -> asyncio.Task[Any]:
+        task = asyncio.Task(coro, loop=loop, **kwargs)
+        self.tasks[task] = (next(self.ids), time.perf_counter())
+        task.add_done_callback(self.task_done)
+        return task
+
+    def task_done(self, task: asyncio.Task[Any]) -> None:
+        if task not in self.tasks:
+            # Finished after the tracer stopped
+            return
+        span_id, start = self.tasks.pop(task)
+        coro = task.get_coro()
+        name = f"{self.task_name(task, span_id)} {getattr(coro, '__qualname__', coro)}"
+        # Not task.exception(): that would keep asyncio from logging
+        # unretrieved exceptions
+        state = "cancelled" if task.cancelled() else "done"
+        end = time.perf_counter()
+        self.async_span(name, "task", span_id, start, end, {"state": state})
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.loop = loop
+        _active.append(self)
+        _install()
+        loop.set_task_factory(self.task_factory)  # type: ignore
+
+    def stop(self) -> None:
+        "Write the trace, and restore what was wrapped if no other tracer runs"
+        if self in _active:
+            _active.remove(self)
+        if not _active:
+            _uninstall()
+        if self.loop is not None:
+            self.loop.set_task_factory(None)
+        now = time.perf_counter()
+        for task, (span_id, start) in self.tasks.items():
+            name = f"{self.task_name(task, span_id)} (still running)"
+            self.async_span(name, "task", span_id, start, now, {"state": "running"})
+        self.tasks.clear()
+        metadata = {
+            "name": "thread_name",
+            "ph": "M",
+            "pid": PID,
+            "tid": TID,
+            "args": {"name": "REAPER main thread"},
+        }
+        trace = {
+            "traceEvents": [metadata, *self.events],
+            "displayTimeUnit": "ms",
+            "droppedEvents": self.dropped,
+        }
+        with open(self.path, "w") as fp:
+            json.dump(trace, fp)
+        print(f"Wrote {len(self.events)} trace events to {self.path}", flush=True)
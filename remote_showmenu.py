@@ -1,6 +1,8 @@
 import argparse
+import collections
 import socket
 import struct
+from typing import Iterable
 
 
 parser = argparse.ArgumentParser()
@@ -9,49 +11,200 @@ OP_GFX_SHOWMENU = 160
 OP_GFX_SHOWMENU_REPLY = 161
 OP_GFX_INIT = 162
 OP_GFX_QUIT = 163
+OP_BATCH = 164
+OP_BATCH_REPLY = 165
+
+# eelsynctest.eel drops the connection on larger messages
+MAX_MSGSIZE = 10000
+
+# eelsynctest.eel listens here
+PORT = 32569
+
+
+def showmenu_message(menustr: str, x: int = 0, y: int = 0) -> bytes:
+    menubytes = menustr.encode()
+    msglen = 9 + len(menubytes)
+    return struct.pack('<IBII', msglen, OP_GFX_SHOWMENU, x, y) + menubytes
+
+
+def gfx_init_message(name: str, width: int, height: int, dockstate: int, xpos: int, ypos: int) -> bytes:
+    namebytes = name.encode()
+    msglen = 21 + len(namebytes)
+    return struct.pack("<IBfffff", msglen, OP_GFX_INIT, width, height, dockstate, xpos, ypos) + namebytes
+
+
+def gfx_quit_message() -> bytes:
+    return struct.pack("<IB", 1, OP_GFX_QUIT)
+
+
+def batch_message(messages: list[bytes]) -> bytes:
+    "One OP_BATCH message running the given messages (made by the functions above)"
+    body = b"".join(messages)
+    return struct.pack("<IBI", 5 + len(body), OP_BATCH, len(messages)) + body
+
+
+def split_batches(messages: Iterable[bytes]) -> list[list[bytes]]:
+    "Group the messages into as few OP_BATCH messages as fit in MAX_MSGSIZE"
+    batches: list[list[bytes]] = [[]]
+    size = 5
+    for message in messages:
+        if 5 + len(message) > MAX_MSGSIZE:
+            raise Exception(f"Message of {len(message)} bytes is too large for OP_BATCH")
+        if size + len(message) > MAX_MSGSIZE:
+            batches.append([])
+            size = 5
+        batches[-1].append(message)
+        size += len(message)
+    return [batch for batch in batches if batch]
+
+
+class RecvBuffer:
+    """
+    Receive buffer that avoids copying: the socket reads into the free space
+    at the end (recv_into), and consuming only moves the start offset.
+    When the end is reached, the unread bytes are moved to the front if at
+    least as many have been consumed, otherwise the buffer doubles, so each
+    byte is copied a bounded number of times on average.
+    """
+
+    def __init__(self, capacity: int = 4096) -> None:
+        self.data = bytearray(capacity)
+        self.start = 0
+        self.end = 0
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def recv_from(self, sock: socket.socket) -> int:
+        "Receive once into the buffer; returns 0 at EOF"
+        if self.end == len(self.data):
+            unread = len(self)
+            if self.start >= unread:
+                self.data[:unread] = self.data[self.start : self.end]
+                self.start, self.end = 0, unread
+            else:
+                self.data.extend(bytes(len(self.data)))
+        with memoryview(self.data) as view:
+            n = sock.recv_into(view[self.end :])
+        self.end += n
+        return n
+
+    def peek(self, i: int = 0) -> int:
+        return self.data[self.start + i]
+
+    def unpack(self, fmt: str) -> tuple:
+        "Unpack and consume a struct from the front of the buffer"
+        values = struct.unpack_from(fmt, self.data, self.start)
+        self.start += struct.calcsize(fmt)
+        return values
+
+    def consume(self, n: int) -> bytes:
+        res = bytes(self.data[self.start : self.start + n])
+        self.start += n
+        return res
 
 
 class Conn:
+    """
+    OP_GFX_SHOWMENU requests can be pipelined: send_showmenu() returns without
+    waiting, and reply() reads the replies in the order the requests were sent.
+    The EEL side handles every complete message it has received in one defer
+    cycle, so a burst of requests costs one round trip instead of one each.
+
+    batch() sends any messages as OP_BATCH and returns one result per message
+    (the choice for a menu, 0 for the others) from a single reply.
+    """
+
     sock: socket.socket
-    buf = b""
 
     def __init__(self, sock: socket.socket) -> None:
         self.sock = sock
+        self.buf = RecvBuffer()
+        # Requests whose replies haven't been read yet, oldest first
+        self.pending: collections.deque[int] = collections.deque()
+        # Replies that were read while waiting for a later request
+        self.replies: dict[int, int | list[int]] = {}
+        self.next_request = 0
 
     def ensure_bytes(self, n: int) -> None:
         while len(self.buf) < n:
-            chunk = self.sock.recv(4096)
-            if not chunk:
+            if not self.buf.recv_from(self.sock):
                 raise Exception("Early EOF")
-            self.buf += chunk
 
     def consume_bytes(self, n: int) -> bytes:
-        res, self.buf = self.buf[:n], self.buf[n:]
-        return res
+        return self.buf.consume(n)
 
-    def showmenu(self, menustr: str, x: int = 0, y: int = 0) -> int:
-        menubytes = menustr.encode()
-        msglen = 9 + len(menubytes)
-        payload = struct.pack('<IBII', msglen, OP_GFX_SHOWMENU, x, y) + menubytes
-        self.sock.sendall(payload)
+    def send_showmenu(self, menustr: str, x: int = 0, y: int = 0) -> int:
+        "Send OP_GFX_SHOWMENU without waiting; returns the request to pass to reply()"
+        self.sock.sendall(showmenu_message(menustr, x, y))
+        return self.add_pending()
+
+    def add_pending(self) -> int:
+        request = self.next_request
+        self.next_request += 1
+        self.pending.append(request)
+        return request
+
+    def send_batch(self, messages: list[bytes]) -> int:
+        "Send OP_BATCH without waiting; returns the request to pass to reply()"
+        self.sock.sendall(batch_message(messages))
+        return self.add_pending()
+
+    def read_reply(self) -> int | list[int]:
         self.ensure_bytes(5)
-        if self.buf[0] != OP_GFX_SHOWMENU_REPLY:
-            raise Exception("Unknown response opcode")
-        n, = struct.unpack("<I", self.consume_bytes(5)[1:5])
+        op = self.buf.peek()
+        if op == OP_GFX_SHOWMENU_REPLY:
+            n, = self.buf.unpack("<xI")
+            return n
+        if op == OP_BATCH_REPLY:
+            count, = struct.unpack_from("<xI", self.buf.data, self.buf.start)
+            self.ensure_bytes(5 + 4 * count)
+            return list(self.buf.unpack(f"<xxxxx{count}i"))
+        raise Exception("Unknown response opcode")
+
+    def reply(self, request: int) -> int | list[int]:
+        "Wait for the reply to the request, keeping the replies to earlier ones"
+        while request not in self.replies:
+            if not self.pending:
+                raise Exception(f"No pending request {request}")
+            self.replies[self.pending.popleft()] = self.read_reply()
+        return self.replies.pop(request)
+
+    def showmenu(self, menustr: str, x: int = 0, y: int = 0) -> int:
+        return self.showmenu_reply(self.send_showmenu(menustr, x, y))
+
+    def showmenus(self, menus: Iterable[str | tuple[str, int, int]]) -> list[int]:
+        "Send all the menus in one write, then read all the replies"
+        messages = [showmenu_message(m) if isinstance(m, str) else showmenu_message(*m) for m in menus]
+        self.sock.sendall(b"".join(messages))
+        requests = [self.add_pending() for _ in messages]
+        return [self.showmenu_reply(request) for request in requests]
+
+    def showmenu_reply(self, request: int) -> int:
+        n = self.reply(request)
+        assert isinstance(n, int)
         return n
 
+    def batch(self, messages: Iterable[bytes]) -> list[int]:
+        "Run the messages in as few OP_BATCH messages as possible; one result per message"
+        requests = [self.send_batch(batch) for batch in split_batches(messages)]
+        results = []
+        for request in requests:
+            reply = self.reply(request)
+            assert isinstance(reply, list)
+            results += reply
+        return results
+
     def gfx_init(self, name: str, width: int, height: int, dockstate: int, xpos: int, ypos: int) -> None:
-        namebytes = name.encode()
-        msglen = 21 + len(namebytes)
-        self.sock.sendall(struct.pack("<IBfffff", msglen, OP_GFX_INIT, width, height, dockstate, xpos, ypos) + namebytes)
+        self.sock.sendall(gfx_init_message(name, width, height, dockstate, xpos, ypos))
 
     def gfx_quit(self) -> None:
-        self.sock.sendall(struct.pack("<IB", 1, OP_GFX_QUIT))
+        self.sock.sendall(gfx_quit_message())
 
 
-def open_conn() -> Conn:
+def open_conn(port: int = PORT) -> Conn:
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.connect(('localhost', 32569))
+    sock.connect(('localhost', port))
     header = sock.recv(4)
     if header != b"Mav\n":
         print(header)
@@ -108,6 +108,14 @@ class RProject:
         "returns latency-compensated actual-what-you-hear position"
         return RPR_GetPlayPositionEx(self.project)
 
+    def get_play_position2(self) -> float:
+        "returns position of next audio block being processed"
+        return RPR_GetPlayPosition2Ex(self.project)
+
+    def get_cursor_position(self) -> float:
+        "edit cursor position"
+        return RPR_GetCursorPositionEx(self.project)
+
     def play(self) -> None:
         RPR_OnPlayButtonEx(self.project)
 
@@ -168,6 +176,17 @@ class RTrack:
 class RMediaSource:
     src: Any
 
+    @classmethod
+    def from_file(cls, path: str) -> "RMediaSource":
+        return cls(RPR_PCM_Source_CreateFromFile(path))
+
+    def destroy(self) -> None:
+        RPR_PCM_Source_Destroy(self.src)
+
+    def build_peaks(self, mode: int) -> int:
+        "mode 0=begin, 1=run (returns percent remaining), 2=finish"
+        return RPR_PCM_Source_BuildPeaks(self.src, mode)
+
     @property
     def path(self) -> str:
         _src, path, _ = RPR_GetMediaSourceFileName(self.src, "", MAX_STRBUF)
@@ -0,0 +1,153 @@
+"""
+Skip silence when stem splitting.
+
+ffmpeg's silencedetect finds the silent regions of a slice. Only the
+non-silent spans are concatenated into a compact file for the separator,
+and the resulting stems are expanded back with silence at the original
+positions, so they line up with the uncompacted slice.
+
+Only depends on the standard library, since lalalcli uses it too.
+Spans are (start, end) pairs in seconds relative to the start of the slice.
+"""
+
+import re
+
+Span = tuple[float, float]
+
+NOISE_DB = -50
+# Only silences at least this long are cut out
+MIN_SILENCE = 2.0
+# Audio kept on either side of a cut, so onsets and tails stay intact
+MARGIN = 0.25
+# Don't bother compacting unless it saves at least this many seconds
+MIN_SAVING = 4.0
+
+
+def silencedetect_cmdline(path: str, start: float, end: float) -> list[str]:
+    return [
+        "ffmpeg",
+        "-v",
+        "info",
+        "-nostats",
+        "-i",
+        path,
+        "-af",
+        f"atrim=start={start}:end={end},asetpts=PTS-STARTPTS,"
+        f"silencedetect=n={NOISE_DB}dB:d={MIN_SILENCE}",
+        "-f",
+        "null",
+        "-",
+    ]
+
+
+def parse_silencedetect(output: str, duration: float) -> list[Span]:
+    "Non-silent spans, given the stderr of silencedetect_cmdline"
+    silences: list[Span] = []
+    silence_start: float | None = None
+    for mo in re.finditer(r"silence_(start|end): (-?[0-9.e+-]+)", output):
+        t = max(0.0, float(mo.group(2)))
+        if mo.group(1) == "start":
+            silence_start = t
+        elif silence_start is not None:
+            silences.append((silence_start, t))
+            silence_start = None
+    if silence_start is not None:
+        silences.append((silence_start, duration))
+    spans: list[Span] = []
+    pos = 0.0
+    for a, b in silences:
+        # Keep a margin of audio, except at the very start and end of the slice
+        cut_start = a + MARGIN if a > 0 else 0.0
+        cut_end = b - MARGIN if b < duration else duration
+        if cut_end - cut_start <= 0:
+            continue
+        if cut_start > pos:
+            spans.append((pos, cut_start))
+        pos = cut_end
+    if pos < duration:
+        spans.append((pos, duration))
+    return spans
+
+
+def worthwhile(spans: list[Span], duration: float) -> bool:
+    return bool(spans) and duration - total_length(spans) >= MIN_SAVING
+
+
+def total_length(spans: list[Span]) -> float:
+    return sum(b - a for a, b in spans)
+
+
+def compact_filter(spans: list[Span], offset: float = 0.0) -> str:
+    "filter_complex concatenating the spans of input 0 (shifted by offset) into [out]"
+    parts = [
+        f"[0:a]atrim=start={offset + a}:end={offset + b},asetpts=PTS-STARTPTS[s{i}]"
+        for i, (a, b) in enumerate(spans)
+    ]
+    labels = "".join(f"[s{i}]" for i in range(len(spans)))
+    return ";".join(parts + [f"{labels}concat=n={len(spans)}:v=0:a=1[out]"])
+
+
+def expand_filter(spans: list[Span], duration: float) -> str:
+    "filter_complex putting the compacted input 0 back at the original positions"
+    parts = []
+    labels = []
+    pos = 0.0
+    compact_pos = 0.0
+
+    def silence(length: float) -> None:
+        # A single muted sample of the input, padded: matches its format exactly
+        label = f"z{len(labels)}"
+        parts.append(
+            f"[0:a]atrim=end_sample=1,volume=0,apad=whole_dur={length},"
+            f"atrim=end={length}[{label}]"
+        )
+        labels.append(f"[{label}]")
+
+    for a, b in spans:
+        if a > pos:
+            silence(a - pos)
+        label = f"s{len(labels)}"
+        parts.append(
+            f"[0:a]atrim=start={compact_pos}:end={compact_pos + b - a},"
+            f"asetpts=PTS-STARTPTS[{label}]"
+        )
+        labels.append(f"[{label}]")
+        compact_pos += b - a
+        pos = b
+    if pos < duration:
+        silence(duration - pos)
+    return ";".join(parts + [f"{''.join(labels)}concat=n={len(labels)}:v=0:a=1[out]"])
+
+
+def compact_cmdline(
+    path: str, spans: list[Span], offset: float, outargs: list[str]
+) -> list[str]:
+    return [
+        "ffmpeg",
+        "-v",
+        "fatal",
+        "-i",
+        path,
+        "-filter_complex",
+        compact_filter(spans, offset),
+        "-map",
+        "[out]",
+        *outargs,
+    ]
+
+
+def expand_cmdline(
+    path: str, spans: list[Span], duration: float, outargs: list[str]
+) -> list[str]:
+    return [
+        "ffmpeg",
+        "-v",
+        "fatal",
+        "-i",
+        path,
+        "-filter_complex",
+        expand_filter(spans, duration),
+        "-map",
+        "[out]",
+        *outargs,
+    ]
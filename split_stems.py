@@ -3,8 +3,9 @@ from dataclasses import dataclass
 
 import autil
 import rutil
+import stemindex
 from autil import SourceSlice
-from rutil import RMediaItem
+from rutil import RMediaItem, TimeRange
 from reaper_python import RPR_InsertMedia
 
 
@@ -12,6 +13,10 @@ from reaper_python import RPR_InsertMedia
 class SplitStems:
     item: RMediaItem
     source_slice: SourceSlice
+    # The selected slice of the original source, before any cutting
+    origin: SourceSlice
+    # Existing stem files that cover source_slice, if any
+    reused: dict[str, str] | None = None
 
     @property
     def dirname(self) -> str:
@@ -22,35 +27,91 @@ class SplitStems:
         return os.path.splitext(os.path.basename(self.source_slice.path))[0]
 
 
-async def prep_split_stems(cut_fraction: float) -> SplitStems:
+async def prep_split_stems(
+    cut_fraction: float, *, splitter: str, stems: list[str]
+) -> SplitStems:
     assert 0 <= cut_fraction <= 1.0
     item = rutil.script_get_single_selected_media_item()
-    source_slice = autil.script_get_selected_audio_source(item)
+    return await prep_split_stems_item(
+        item, cut_fraction, splitter=splitter, stems=stems
+    )
+
+
+async def prep_split_stems_batch(
+    cut_fraction: float, *, splitter: str, stems: list[str]
+) -> list[SplitStems]:
+    assert 0 <= cut_fraction <= 1.0
+    items = rutil.get_item_selection()
+    if not items:
+        raise SystemExit("Please select one or more media items")
+    return [
+        await prep_split_stems_item(item, cut_fraction, splitter=splitter, stems=stems)
+        for item in items
+    ]
+
+
+async def prep_split_stems_item(
+    item: RMediaItem, cut_fraction: float, *, splitter: str, stems: list[str]
+) -> SplitStems:
+    origin = autil.script_get_selected_audio_source(item)
+    found = stemindex.find_covering(origin.path, origin.slice, splitter, stems)
+    if found is not None:
+        print(f"Reusing {splitter} stems of {found.start:.3f}-{found.end:.3f}")
+        source_slice = SourceSlice(
+            origin.path,
+            found.end - found.start,
+            origin.slice - found.start,
+            origin.playrate,
+            origin.itemstart,
+        )
+        return SplitStems(item, source_slice, origin, found.stems)
+    source_slice = origin
     if source_slice.slice_fraction < cut_fraction:
         source_slice = await autil.cut_source_slice_into_new_file(source_slice)
-    return SplitStems(item, source_slice)
+    return SplitStems(item, source_slice, origin)
+
+
+def record_split_stems(
+    prep: SplitStems, splitter: str, stems: dict[str, str], covered: TimeRange
+) -> None:
+    "Remember that the stem files cover `covered` (in source_slice coordinates)"
+    if prep.reused is not None:
+        return
+    shift = prep.origin.slice.start - prep.source_slice.slice.start
+    stemindex.record(prep.origin.path, covered + shift, splitter, stems)
 
 
 def insert_split_stems(prep: SplitStems, paths: list[str]) -> None:
+    insert_split_stems_batch([(prep, paths)])
+
+
+def insert_split_stems_batch(jobs: list[tuple[SplitStems, list[str]]]) -> None:
     with rutil.undoblock("Split stems"):
-        timebase = prep.item.timebase
-        prep.item.selected = False
         rutil.clear_item_selection()
-        # Select item.track to make sure new tracks are right below it
         tracks = rutil.clear_track_selection()
-        prep.item.track.selected = True
         items = []
-        for stem_path in paths:
-            RPR_InsertMedia(stem_path, 1)
-            item2 = rutil.script_get_single_selected_media_item()
-            take2 = item2.active_take
-            print(prep.source_slice.item_time_range)
-            item2.time_range = prep.source_slice.item_time_range
-            take2.playrate = prep.source_slice.playrate
-            take2.startoffs = prep.source_slice.startoffs
-            item2.timebase = timebase
-            item2.selected = False
-            items.append(item2)
+        for prep, paths in jobs:
+            items += _insert_stems_below(prep, paths)
         rutil.set_item_selection(items)
-        prep.item.track.muted = True
+        for prep, _paths in jobs:
+            prep.item.track.muted = True
         rutil.set_track_selection(tracks)
+
+
+def _insert_stems_below(prep: SplitStems, paths: list[str]) -> list[RMediaItem]:
+    timebase = prep.item.timebase
+    # Select item.track to make sure new tracks are right below it
+    rutil.clear_track_selection()
+    prep.item.track.selected = True
+    items = []
+    for stem_path in paths:
+        RPR_InsertMedia(stem_path, 1)
+        item2 = rutil.script_get_single_selected_media_item()
+        take2 = item2.active_take
+        item2.time_range = prep.source_slice.item_time_range
+        take2.playrate = prep.source_slice.playrate
+        take2.startoffs = prep.source_slice.startoffs
+        item2.timebase = timebase
+        item2.selected = False
+        items.append(item2)
+    return items
@@ -2,7 +2,11 @@ import asyncio
 import os
 from typing import Literal
 
+import autil
+import silence
 import split_stems
+from rutil import TimeRange
+from split_stems import SplitStems
 
 
 async def split_stems_demucs(
@@ -17,12 +21,37 @@ async def split_stems_demucs(
         two_stems_arg = []
         stems = ["bass", "drums", "vocals", "other"]
 
-    prep = await split_stems.prep_split_stems(0.5)
-    filename_fmt = f"{prep.basename}_{{stem}}_split_by_demucs.wav"
-    filenames = [filename_fmt.format(stem=s) for s in stems]
-    paths = [os.path.join(prep.dirname, f) for f in filenames]
-    opaths = [os.path.join(prep.dirname, modelname, f) for f in filenames]
-    if not all(os.path.exists(p) for p in paths):
+    splitter = f"demucs:{modelname}"
+    preps = await split_stems.prep_split_stems_batch(
+        0.5, splitter=splitter, stems=stems
+    )
+    # demucs substitutes {track} with the input basename,
+    # so a single invocation can process any number of inputs in one directory.
+    filename_fmt = "{track}_{stem}_split_by_demucs.wav"
+    jobs: list[tuple[SplitStems, list[str]]] = []
+    # Inputs that have no cached stems yet, grouped by output directory
+    todo: dict[str, dict[str, list[str]]] = {}
+    durations = {p.source_slice.path: p.source_slice.source_length for p in preps}
+    # Peak building starts as soon as each stem file is in place
+    peaks: dict[str, asyncio.Task[None]] = {}
+    for prep in preps:
+        if prep.reused is not None:
+            jobs.append((prep, [prep.reused[s] for s in stems]))
+            continue
+        filenames = [filename_fmt.format(track=prep.basename, stem=s) for s in stems]
+        paths = [os.path.join(prep.dirname, f) for f in filenames]
+        jobs.append((prep, paths))
+        if not all(os.path.exists(p) for p in paths):
+            todo.setdefault(prep.dirname, {})[prep.source_slice.path] = filenames
+    for dirname, inputs in todo.items():
+        # Only pass the non-silent parts of each input to demucs
+        spans: dict[str, list[silence.Span]] = {}
+        demucs_inputs = []
+        for inpath in inputs:
+            compact, nonsilent = await compact_silence(inpath, durations[inpath])
+            if nonsilent is not None:
+                spans[inpath] = nonsilent
+            demucs_inputs.append(compact)
         proc = await asyncio.subprocess.create_subprocess_exec(
             "gnome-terminal",
             "--geometry=122x10",
@@ -34,15 +63,55 @@ async def split_stems_demucs(
             modelname,
             "--float32",
             "-o",
-            prep.dirname,
+            dirname,
             "--filename",
             filename_fmt,
-            prep.source_slice.path,
+            *demucs_inputs,
         )
         exitcode = await proc.wait()
         if exitcode:
             raise Exception(f"gnome-terminal/demucs failed with exit code {exitcode}")
-        assert all(os.path.exists(p) for p in opaths)
-        for finalpath, outpath in zip(paths, opaths):
-            os.rename(outpath, finalpath)
-    split_stems.insert_split_stems(prep, paths)
+        for inpath, filenames in inputs.items():
+            opaths = [os.path.join(dirname, modelname, f) for f in filenames]
+            assert all(os.path.exists(p) for p in opaths)
+            for filename, outpath in zip(filenames, opaths):
+                finalpath = os.path.join(dirname, filename)
+                if inpath in spans:
+                    outargs = ["-c:a", "pcm_f32le", "-y", finalpath]
+                    await autil.run_ffmpeg(
+                        silence.expand_cmdline(
+                            outpath, spans[inpath], durations[inpath], outargs
+                        )
+                    )
+                    os.remove(outpath)
+                else:
+                    os.rename(outpath, finalpath)
+                peaks[finalpath] = asyncio.create_task(autil.build_peaks(finalpath))
+        for compact in set(demucs_inputs) - set(inputs):
+            os.remove(compact)
+    for prep, paths in jobs:
+        # demucs always splits the entire (possibly cut) source file
+        covered = TimeRange(0.0, prep.source_slice.source_length)
+        split_stems.record_split_stems(prep, splitter, dict(zip(stems, paths)), covered)
+    await autil.build_peaks_all([p for _, paths in jobs for p in paths], peaks)
+    split_stems.insert_split_stems_batch(jobs)
+
+
+async def compact_silence(
+    inpath: str, duration: float
+) -> tuple[str, list[silence.Span] | None]:
+    "Path to pass to demucs, and the non-silent spans if silence was cut out"
+    nonsilent = await autil.detect_nonsilent_spans(inpath, 0.0, duration)
+    if nonsilent is None:
+        return inpath, None
+    # Same basename in a subdirectory, so demucs' {track} is unchanged
+    dirname, filename = os.path.split(inpath)
+    basename = os.path.splitext(filename)[0]
+    compact = os.path.join(dirname, ".nonsilent", f"{basename}.flac")
+    os.makedirs(os.path.dirname(compact), exist_ok=True)
+    skipped = duration - silence.total_length(nonsilent)
+    print(f"Skipping {skipped:.1f} s of silence in {basename}")
+    await autil.run_ffmpeg(
+        silence.compact_cmdline(inpath, nonsilent, 0.0, ["-y", compact])
+    )
+    return compact, nonsilent
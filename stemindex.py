@@ -0,0 +1,107 @@
+"""
+Index of previously split source ranges.
+
+Each directory holding split sources gets a .stemindex.json that records,
+for every split, which range of the original source the stem files cover.
+A later request for a range inside an indexed range can then reuse the
+existing stem files instead of running the separator again.
+"""
+
+import json
+import os
+from dataclasses import asdict, dataclass
+
+from rutil import TimeRange
+
+INDEX_FILENAME = ".stemindex.json"
+
+# Allow for rounding in the millisecond-based cut file names
+EPSILON = 0.002
+
+
+@dataclass
+class SplitRange:
+    source: str
+    source_mtime: float
+    start: float
+    end: float
+    splitter: str
+    stems: dict[str, str]
+
+    @property
+    def time_range(self) -> TimeRange:
+        return TimeRange(self.start, self.end)
+
+    def covers(self, t: TimeRange) -> bool:
+        return self.start - EPSILON <= t.start and t.end <= self.end + EPSILON
+
+    @property
+    def valid(self) -> bool:
+        try:
+            if os.stat(self.source).st_mtime != self.source_mtime:
+                return False
+        except OSError:
+            return False
+        return all(os.path.exists(p) for p in self.stems.values())
+
+
+def index_path(source: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(source)), INDEX_FILENAME)
+
+
+def load_index(source: str) -> list[SplitRange]:
+    try:
+        with open(index_path(source)) as fp:
+            return [SplitRange(**e) for e in json.load(fp)]
+    except FileNotFoundError:
+        return []
+    except (ValueError, TypeError) as exc:
+        print(f"Ignoring broken {index_path(source)}: {exc}", flush=True)
+        return []
+
+
+def find_covering(
+    source: str, t: TimeRange, splitter: str, stems: list[str]
+) -> SplitRange | None:
+    source = os.path.abspath(source)
+    candidates = [
+        e
+        for e in load_index(source)
+        if e.source == source
+        and e.splitter == splitter
+        and all(s in e.stems for s in stems)
+        and e.covers(t)
+        and e.valid
+    ]
+    # Prefer the smallest covering range
+    return min(candidates, key=lambda e: e.end - e.start, default=None)
+
+
+def record(
+    source: str, t: TimeRange, splitter: str, stems: dict[str, str]
+) -> SplitRange:
+    source = os.path.abspath(source)
+    entry = SplitRange(
+        source,
+        os.stat(source).st_mtime,
+        t.start,
+        t.end,
+        splitter,
+        {s: os.path.abspath(p) for s, p in stems.items()},
+    )
+    entries = [
+        e
+        for e in load_index(source)
+        if e.valid
+        and not (
+            e.source == entry.source
+            and e.splitter == entry.splitter
+            and e.time_range == entry.time_range
+        )
+    ]
+    entries.append(entry)
+    path = index_path(source)
+    with open(f"{path}.tmp", "w") as fp:
+        json.dump([asdict(e) for e in entries], fp, indent=1)
+    os.replace(f"{path}.tmp", path)
+    return entry
@@ -0,0 +1,376 @@
+"""
+Benchmark the play/pause handshake of "Sync MuseScore 4 with REAPER.py"
+outside of REAPER.
+
+The sync coroutines run against a simulated REAPER transport on an event loop
+that, like ReaperCoopEventLoop, runs one iteration per ~30 Hz defer cycle.
+The MuseScore side is musicsyncstub.MusicSyncStub on its own thread.
+Each cycle starts and stops playback once from REAPER and once from the
+stand-in, and reports per play/pause:
+
+- detection latency: from the transport change to the other side applying it
+- seek error: score position of the stand-in minus REAPER's, once settled
+- messages: sent and received by the stand-in
+- applied: how often the other side applied the change; more than once
+  (e.g. over both connections of one stand-in) makes the run exit with 1
+
+    python3 syncbench.py --cycles 5 --delay-ms 20 --jitter-ms 5 --clock-offset 0.3
+"""
+
+import argparse
+import asyncio
+import collections
+import importlib.util
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import types
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+import aiohttp
+
+import musicsyncstub
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--cycles", type=int, default=5)
+parser.add_argument("--protocol-version", type=int, default=2)
+parser.add_argument("--delay-ms", type=float, default=0.0)
+parser.add_argument("--jitter-ms", type=float, default=0.0)
+parser.add_argument("--clock-offset", type=float, default=0.0)
+parser.add_argument("--drift-ppm", type=float, default=0.0)
+parser.add_argument(
+    "--settle",
+    type=float,
+    default=1.5,
+    help="seconds to play before measuring seek error",
+)
+parser.add_argument(
+    "--port",
+    type=int,
+    default=18084,
+    help="stand-in port; the sync server uses the next one",
+)
+parser.add_argument("--json", action="store_true", help="print results as JSON lines")
+
+DEFER_INTERVAL = 1 / 30
+FIRST_MEASURE_START = 2.0
+TIMEOUT = 5.0
+# Applying a change more than once within this is a duplicate
+# (e.g. one sent over both connections)
+DUPLICATE_WINDOW = 0.25
+
+
+@dataclass
+class SimTransport:
+    "REAPER's transport, as far as the sync script can see it through reaper_python"
+
+    playing: bool = False
+    cursor: float = 0.0
+    started_at: float = 0.0
+    calls: collections.Counter[str] = field(default_factory=collections.Counter)
+    # (time.monotonic(), playing) of each play/stop button press by the sync script
+    pressed: list[tuple[float, bool]] = field(default_factory=list)
+
+    def position(self) -> float:
+        if not self.playing:
+            return self.cursor
+        return self.cursor + time.monotonic() - self.started_at
+
+    def play(self) -> None:
+        self.started_at = time.monotonic()
+        self.playing = True
+
+    def stop(self) -> None:
+        self.playing = False
+
+    def reaper_python(self) -> types.ModuleType:
+        "The subset of reaper_python used by the sync script, counting every call"
+        module = types.ModuleType("reaper_python")
+
+        def counted(f: Callable[..., Any]) -> Callable[..., Any]:
+            def wrapper(*args: Any) -> Any:
+                self.calls[f.__name__] += 1
+                return f(*args)
+
+            setattr(module, f.__name__, wrapper)
+            return wrapper
+
+        @counted
+        def RPR_EnumProjects(idx: int, buf: str, sz: int) -> tuple[Any, int, str, int]:
+            return ("sim", 0, "sim.rpp", sz)
+
+        @counted
+        def RPR_parse_timestr_pos(buf: str, modeoverride: int) -> float:
+            return FIRST_MEASURE_START
+
+        @counted
+        def RPR_GetPlayStateEx(proj: Any) -> int:
+            return int(self.playing)
+
+        @counted
+        def RPR_GetPlayPositionEx(proj: Any) -> float:
+            return self.position()
+
+        @counted
+        def RPR_GetPlayPosition2Ex(proj: Any) -> float:
+            return self.position()
+
+        @counted
+        def RPR_GetCursorPositionEx(proj: Any) -> float:
+            return self.cursor
+
+        @counted
+        def RPR_OnPlayButtonEx(proj: Any) -> None:
+            self.pressed.append((time.monotonic(), True))
+            self.play()
+
+        @counted
+        def RPR_OnStopButtonEx(proj: Any) -> None:
+            self.pressed.append((time.monotonic(), False))
+            self.stop()
+
+        @counted
+        def RPR_SetEditCurPos2(
+            proj: Any, pos: float, moveview: bool, seekplay: bool
+        ) -> None:
+            self.cursor = pos
+            if self.playing and seekplay:
+                self.started_at = time.monotonic()
+
+        return module
+
+
+class DeferCycleLoop(asyncio.SelectorEventLoop):
+    "Runs one iteration per simulated REAPER defer cycle, like ReaperCoopEventLoop"
+
+    def _run_once(self) -> None:
+        self.call_soon(lambda: None)
+        super()._run_once()  # type: ignore
+        time.sleep(DEFER_INTERVAL)
+
+
+def load_sync_script(transport: SimTransport) -> types.ModuleType:
+    sys.modules["reaper_python"] = transport.reaper_python()
+    path = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "Sync MuseScore 4 with REAPER.py"
+    )
+    spec = importlib.util.spec_from_file_location("sync_musescore", path)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_stub(
+    stub: musicsyncstub.MusicSyncStub, port: int, ready: threading.Event
+) -> asyncio.AbstractEventLoop:
+    loop = asyncio.new_event_loop()
+
+    async def amain() -> None:
+        await stub.listen(port)
+        asyncio.create_task(stub.push_play_state())
+        ready.set()
+        async with aiohttp.ClientSession() as session:
+            while True:
+                try:
+                    await stub.connect(session, port + 1)
+                except OSError:
+                    await asyncio.sleep(0.1)
+
+    threading.Thread(
+        target=loop.run_until_complete, args=(amain(),), daemon=True
+    ).start()
+    return loop
+
+
+@dataclass
+class Result:
+    initiator: str
+    playing: bool
+    latency: float | None
+    seek_error: float | None
+    messages_sent: int
+    messages_received: int
+    reaper_calls: int
+    # How often the other side applied the change; anything but 1 is a bug
+    applied: int
+
+    def row(self) -> str:
+        action = "play" if self.playing else "stop"
+        latency = (
+            "timeout" if self.latency is None else f"{1000 * self.latency:7.1f} ms"
+        )
+        error = "" if self.seek_error is None else f"{1000 * self.seek_error:+7.1f} ms"
+        return (
+            f"{self.initiator:8} {action:5} {latency:>10} {error:>10} "
+            f"{self.messages_sent:5} {self.messages_received:5} "
+            f"{self.reaper_calls:7} {self.applied:7}"
+        )
+
+
+async def wait_until(predicate: Callable[[], bool]) -> bool:
+    deadline = time.monotonic() + TIMEOUT
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0)
+    return True
+
+
+async def measure(
+    args: argparse.Namespace,
+    stub: musicsyncstub.MusicSyncStub,
+    stub_loop: asyncio.AbstractEventLoop,
+    transport: SimTransport,
+    initiator: str,
+    playing: bool,
+) -> Result:
+    sent = sum(stub.sent.values())
+    received = sum(stub.received.values())
+    calls = sum(transport.calls.values())
+    t0 = time.monotonic()
+    if initiator == "REAPER":
+        transport.play() if playing else transport.stop()
+        done = lambda: any(t >= t0 and p == playing for t, p, _ in stub.applied)
+    else:
+        stub_loop.call_soon_threadsafe(stub.user_play if playing else stub.user_stop)
+        done = lambda: any(t >= t0 and p == playing for t, p in transport.pressed)
+    latency = None
+    times: list[float] = []
+    if await wait_until(done):
+        await asyncio.sleep(DUPLICATE_WINDOW)
+        times = (
+            [t for t, p, _ in stub.applied]
+            if initiator == "REAPER"
+            else [t for t, p in transport.pressed]
+        )
+        times = [t for t in times if t >= t0]
+        latency = min(times) - t0
+        times = [t for t in times if t <= t0 + latency + DUPLICATE_WINDOW]
+    seek_error = None
+    if playing:
+        await asyncio.sleep(args.settle)
+        seek_error = stub.playback.pos() - (transport.position() - FIRST_MEASURE_START)
+    else:
+        await asyncio.sleep(0.5)
+    return Result(
+        initiator,
+        playing,
+        latency,
+        seek_error,
+        sum(stub.sent.values()) - sent,
+        sum(stub.received.values()) - received,
+        sum(transport.calls.values()) - calls,
+        len(times),
+    )
+
+
+async def bench(
+    args: argparse.Namespace, sync: types.ModuleType, transport: SimTransport
+) -> list[Result]:
+    stub = musicsyncstub.MusicSyncStub(
+        protocol_version=args.protocol_version,
+        delay=args.delay_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        clock_offset=args.clock_offset,
+        playback=musicsyncstub.SimPlayback(rate=1 + args.drift_ppm * 1e-6),
+    )
+    ready = threading.Event()
+    stub_loop = run_stub(stub, args.port, ready)
+    ready.wait()
+    proj = sync.rutil.get_current_project_index_name()[0]
+    ctx = sync.Context(first_measure_start=sync.RPR_parse_timestr_pos("1.1.00", 2))
+    transport.cursor = FIRST_MEASURE_START + 1.0
+    tasks = [
+        asyncio.create_task(sync.server_main(args.port + 1, ctx, proj)),
+        asyncio.create_task(sync.detect_local_play_pause(ctx, proj)),
+        asyncio.create_task(sync.ping_loop()),
+        asyncio.create_task(sync.correct_drift(ctx, proj)),
+    ]
+    async with aiohttp.ClientSession() as session:
+        async with session.ws_connect(f"http://localhost:{args.port}") as ws:
+            client = asyncio.create_task(
+                sync.handle_sync_connection(ctx, proj, ws, f"stand-in on {args.port}")
+            )
+            # Both connections are up and a few pings have gone through
+            await wait_until(
+                lambda: stub.received["hello"] == 2 and stub.sent["helloReply"] == 2
+            )
+            await asyncio.sleep(0.5)
+            if len(sync.peers) != 1:
+                raise SystemExit(
+                    f"The stand-in's two connections became {len(sync.peers)} "
+                    "peers instead of one"
+                )
+            await asyncio.sleep(2 * sync.PING_INTERVAL + 0.5)
+            results = []
+            for _ in range(args.cycles):
+                for initiator in ("REAPER", "stand-in"):
+                    for playing in (True, False):
+                        results.append(
+                            await measure(
+                                args, stub, stub_loop, transport, initiator, playing
+                            )
+                        )
+                        if args.json:
+                            print(json.dumps(results[-1].__dict__), flush=True)
+                        else:
+                            print(results[-1].row(), flush=True)
+            client.cancel()
+    for task in tasks:
+        task.cancel()
+    return results
+
+
+def summary(results: list[Result]) -> str:
+    lines = []
+    for initiator in ("REAPER", "stand-in"):
+        for playing in (True, False):
+            rs = [
+                r for r in results if r.initiator == initiator and r.playing == playing
+            ]
+            latencies = [1000 * r.latency for r in rs if r.latency is not None]
+            action = "play" if playing else "stop"
+            line = f"{initiator} {action}: latency "
+            if latencies:
+                mean = statistics.fmean(latencies)
+                line += f"mean {mean:.1f} / max {max(latencies):.1f} ms"
+            line += f", {len(rs) - len(latencies)} timeouts"
+            errors = [1000 * abs(r.seek_error) for r in rs if r.seek_error is not None]
+            if errors:
+                mean = statistics.fmean(errors)
+                line += f", seek error mean {mean:.1f} / max {max(errors):.1f} ms"
+            messages = statistics.fmean(
+                r.messages_sent + r.messages_received for r in rs
+            )
+            line += f", {messages:.1f} messages"
+            if duplicates := sum(r.applied > 1 for r in rs):
+                line += f", {duplicates} applied more than once"
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def main() -> None:
+    args = parser.parse_args()
+    transport = SimTransport()
+    sync = load_sync_script(transport)
+    if not args.json:
+        print(
+            f"{'from':8} {'what':5} {'latency':>10} {'seek err':>10} "
+            f"{'sent':>5} {'recv':>5} {'calls':>7} {'applied':>7}"
+        )
+    loop = DeferCycleLoop()
+    asyncio.set_event_loop(loop)
+    results = loop.run_until_complete(bench(args, sync, transport))
+    if not args.json:
+        print(summary(results))
+    if any(r.applied > 1 for r in results):
+        raise SystemExit("Some play state changes were applied more than once")
+
+
+if __name__ == "__main__":
+    main()
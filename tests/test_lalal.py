@@ -0,0 +1,242 @@
+import hashlib
+import http.client
+import os
+import sys
+import threading
+from typing import Any, Iterator
+
+import pytest
+
+import lalal
+import lalalstub
+
+
+@pytest.fixture
+def stub() -> Iterator[lalalstub.StubServer]:
+    server = lalalstub.StubServer(0, lalalstub.StubState(split_seconds=0))
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(stub: lalalstub.StubServer) -> Iterator[lalal.LalalClient]:
+    client = lalal.LalalClient("key", f"http://localhost:{stub.server_port}")
+    yield client
+    client.pool.close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch: pytest.MonkeyPatch) -> list[float]:
+    "Retry delays, without waiting for them"
+    res: list[float] = []
+    monkeypatch.setattr(lalal.time, "sleep", res.append)
+    return res
+
+
+@pytest.fixture
+def responses(monkeypatch: pytest.MonkeyPatch) -> list[tuple[dict[str, str], Any]]:
+    "Request headers and response status (or exception) of each pool request"
+    res: list[tuple[dict[str, str], Any]] = []
+    request = lalal.HTTPPool.request
+
+    def recording(self: lalal.HTTPPool, method: str, url: str, *args: Any, **kw: Any):
+        headers = kw.get("headers") or (args[1] if len(args) > 1 else None) or {}
+        try:
+            result = request(self, method, url, *args, **kw)
+        except lalal.HTTPError as exc:
+            res.append((headers, exc.status))
+            raise
+        res.append((headers, result[0]))
+        return result
+
+    monkeypatch.setattr(lalal.HTTPPool, "request", recording)
+    return res
+
+
+def chunks() -> Iterator[bytes]:
+    for i in range(20):
+        yield bytes([i]) * (1000 * i + 1)
+
+
+def split_stem(client: lalal.LalalClient, stub: lalalstub.StubServer) -> str:
+    "Upload and split something; returns the stem track URL"
+    file_id = client.upload_chunks("a.flac", chunks)["id"]
+    client.split([{"id": file_id, "stem": "vocals"}])
+    return client.wait_for_split(file_id)["stem_track"]
+
+
+def test_upload_chunks_is_byte_exact(client, stub) -> None:
+    res = client.upload_chunks("a.flac", chunks)
+    upload = stub.state.uploads[res["id"]]
+    assert upload.filename == "a.flac"
+    assert upload.data == b"".join(chunks())
+
+
+def test_upload_file(client, stub, tmp_path) -> None:
+    path = tmp_path / "a.flac"
+    path.write_bytes(os.urandom(100000))
+    res = client.upload("a.flac", str(path))
+    assert stub.state.uploads[res["id"]].data == path.read_bytes()
+
+
+def test_requests_share_a_connection(client, stub) -> None:
+    client.get_limits()
+    client.upload_chunks("a.flac", chunks)
+    client.get_limits()
+    assert len(stub.state.connections) == 1
+
+
+def part_path(path: str, url: str) -> str:
+    return f"{path}.{hashlib.sha256(url.encode()).hexdigest()[:16]}.part"
+
+
+def test_download(client, stub, tmp_path, responses) -> None:
+    url = split_stem(client, stub)
+    path = str(tmp_path / "stem.flac")
+    client.pool.download(url, path)
+    file_id = url.split("/")[-2]
+    with open(path, "rb") as fp:
+        assert fp.read() == stub.state.stem_bytes(file_id, "stem_track")
+    assert responses[-1] == ({}, 200)
+    assert not os.path.exists(part_path(path, url))
+
+
+def test_download_resumes_part(client, stub, tmp_path, responses) -> None:
+    url = split_stem(client, stub)
+    data = stub.state.stem_bytes(url.split("/")[-2], "stem_track")
+    path = str(tmp_path / "stem.flac")
+    with open(part_path(path, url), "wb") as fp:
+        fp.write(data[:1000])
+    client.pool.download(url, path)
+    with open(path, "rb") as fp:
+        assert fp.read() == data
+    assert responses[-1] == ({"Range": "bytes=1000-"}, 206)
+
+
+def test_download_complete_part(client, stub, tmp_path, responses) -> None:
+    url = split_stem(client, stub)
+    data = stub.state.stem_bytes(url.split("/")[-2], "stem_track")
+    path = str(tmp_path / "stem.flac")
+    with open(part_path(path, url), "wb") as fp:
+        fp.write(data)
+    client.pool.download(url, path)
+    with open(path, "rb") as fp:
+        assert fp.read() == data
+    assert responses[-1] == ({"Range": f"bytes={len(data)}-"}, 416)
+
+
+def test_download_restarts_stale_part(client, stub, tmp_path, responses) -> None:
+    url = split_stem(client, stub)
+    data = stub.state.stem_bytes(url.split("/")[-2], "stem_track")
+    path = str(tmp_path / "stem.flac")
+    with open(part_path(path, url), "wb") as fp:
+        fp.write(b"\0" * (len(data) + 10))
+    client.pool.download(url, path)
+    with open(path, "rb") as fp:
+        assert fp.read() == data
+    assert responses[-2:] == [({"Range": f"bytes={len(data) + 10}-"}, 416), ({}, 200)]
+
+
+def test_retries_transient_errors(client, stub, sleeps) -> None:
+    stub.state.fail_every = 2
+    for i in range(3):
+        assert client.get_limits()["email"] == "stub@localhost"
+    res = client.upload_chunks("a.flac", chunks)
+    assert stub.state.uploads[res["id"]].data == b"".join(chunks())
+    assert sleeps == [0.5, 0.5, 0.5]
+
+
+def test_retry_backoff(sleeps) -> None:
+    calls = 0
+
+    def fail() -> None:
+        nonlocal calls
+        calls += 1
+        raise lalal.TransientHTTPError(503, b"")
+
+    with pytest.raises(lalal.TransientHTTPError):
+        lalal.retry(fail, attempts=4, backoff=0.5)
+    assert calls == 4
+    assert sleeps == [0.5, 1.0, 2.0]
+
+
+def test_retry_only_retries_retry_on(sleeps) -> None:
+    def fail() -> None:
+        raise lalal.HTTPError(403, b"")
+
+    with pytest.raises(lalal.HTTPError):
+        lalal.retry(fail)
+    assert sleeps == []
+
+
+def test_split_uses_a_fresh_connection(client, stub) -> None:
+    file_id = client.upload_chunks("a.flac", chunks)["id"]
+    # An idle connection that fails when used, like one the server has closed
+    netloc = f"localhost:{stub.server_port}"
+    dead = http.client.HTTPConnection("localhost", 1)
+    client.pool._put("http", netloc, dead)
+    client.split([{"id": file_id, "stem": "vocals"}])
+    assert stub.state.uploads[file_id].params["stem"] == "vocals"
+    assert dead in client.pool._idle[("http", netloc)]
+
+
+def test_aborted_body_closes_connection(client, stub) -> None:
+    def body() -> Iterator[bytes]:
+        yield b"x" * 1000
+        raise SystemExit(1)
+
+    with pytest.raises(SystemExit):
+        client.pool.request("POST", f"{client.base_url}/api/upload/", body())
+    assert not client.pool._idle
+    assert client.get_limits()["email"] == "stub@localhost"
+    assert not stub.state.uploads
+
+
+def test_parse_content_range() -> None:
+    assert lalal.parse_content_range("bytes 10-99/100") == (10, 100)
+    assert lalal.parse_content_range("bytes */100") == (None, 100)
+    assert lalal.parse_content_range("bytes 0-9/*") == (0, None)
+    assert lalal.parse_content_range(None) == (None, None)
+
+
+def test_encoder_upload_is_byte_exact(client, stub, tmp_path) -> None:
+    path = tmp_path / "a.flac"
+    path.write_bytes(os.urandom(300000))
+    encoder = lalal.Encoder(["cat", str(path)], chunk_size=4096)
+    res = client.upload_chunks("a.flac", encoder.chunks)
+    assert stub.state.uploads[res["id"]].data == path.read_bytes()
+    assert encoder.proc is not None and encoder.proc.returncode == 0
+
+
+def test_encoder_failure_aborts_upload(client, stub) -> None:
+    encoder = lalal.Encoder([sys.executable, "-c", "print('x'); raise SystemExit(3)"])
+    with pytest.raises(SystemExit, match="exit code 3"):
+        client.upload_chunks("a.flac", encoder.chunks)
+    assert not stub.state.uploads
+
+
+def test_encoder_terminate_while_running() -> None:
+    encoder = lalal.Encoder(
+        [
+            sys.executable,
+            "-c",
+            "import sys, time; sys.stdout.write('x'); sys.stdout.flush(); time.sleep(60)",
+        ]
+    )
+    chunks = encoder.chunks()
+    assert next(chunks) == b"x"
+    encoder.terminate()
+    with pytest.raises(SystemExit):
+        next(chunks)
+    assert encoder.proc is not None and encoder.proc.returncode < 0
+
+
+def test_encoder_terminate_before_start() -> None:
+    encoder = lalal.Encoder([sys.executable, "-c", "print('x')"])
+    encoder.terminate()
+    with pytest.raises(SystemExit):
+        next(encoder.chunks())
+    assert encoder.proc is None
@@ -0,0 +1,132 @@
+import asyncio
+import struct
+from typing import Any, Awaitable, Callable
+
+import pytest
+
+import mavclient
+import mavstub
+from remote_showmenu import (
+    OP_BATCH,
+    OP_GFX_SHOWMENU_REPLY,
+    gfx_init_message,
+    gfx_quit_message,
+    showmenu_message,
+)
+
+
+def menu(n: int) -> str:
+    "A menu that mavstub answers with n"
+    return "|".join(f"item {i}" for i in range(n))
+
+
+async def with_stub(
+    fn: Callable[[mavstub.MavStub, int], Awaitable[Any]], tick: float = 0.0
+) -> Any:
+    stub = mavstub.MavStub(tick=tick)
+    server = await stub.listen(0)
+    async with server:
+        return await fn(stub, server.sockets[0].getsockname()[1])
+
+
+def test_replies_in_request_order() -> None:
+    async def run(stub: mavstub.MavStub, port: int) -> None:
+        conn = await mavclient.open_conn(port=port)
+        try:
+            sizes = [1 + (i * 7) % 50 for i in range(300)]
+            results = await asyncio.gather(
+                *(conn.showmenu(menu(n)) for n in sizes),
+                conn.batch([showmenu_message(menu(3)), gfx_quit_message()]),
+                *(conn.showmenu(menu(n)) for n in sizes),
+            )
+            assert results == [*sizes, [3, 0], *sizes]
+            assert stub.ops["showmenu"] == 601
+        finally:
+            await conn.close()
+
+    # A tick makes replies arrive in bursts, like from REAPER
+    asyncio.run(with_stub(run, tick=0.005))
+
+
+def test_batch_results() -> None:
+    async def run(stub: mavstub.MavStub, port: int) -> None:
+        client = mavclient.MavClient(port=port)
+        try:
+            messages = [gfx_init_message("foo", 200, 150, 0, 0, 0)]
+            messages += [showmenu_message(menu(1 + i % 20)) for i in range(2000)]
+            results = await client.batch(messages)
+            assert results == [0, *(1 + i % 20 for i in range(2000))]
+            assert stub.gfx_open
+            # Split into several OP_BATCH messages to stay below MAX_MSGSIZE
+            assert stub.ops["batch"] > 1
+        finally:
+            await client.close()
+
+    asyncio.run(with_stub(run))
+
+
+def test_in_flight_limit() -> None:
+    async def run() -> None:
+        received = bytearray()
+        connected: asyncio.Future[asyncio.StreamWriter] = asyncio.Future()
+
+        async def serve(
+            reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+        ) -> None:
+            # Reads requests but only replies when the test says so
+            writer.write(mavclient.HANDSHAKE)
+            connected.set_result(writer)
+            while data := await reader.read(65536):
+                received.extend(data)
+
+        server = await asyncio.start_server(serve, "localhost", 0)
+        async with server:
+            port = server.sockets[0].getsockname()[1]
+            conn = await mavclient.open_conn(port=port)
+            writer = await connected
+            n = mavclient.MAX_IN_FLIGHT + 10
+            message = showmenu_message("a|b")
+            tasks = [asyncio.create_task(conn.showmenu("a|b")) for _ in range(n)]
+            await asyncio.sleep(0.1)
+            assert len(conn.waiting) == mavclient.MAX_IN_FLIGHT
+            assert len(received) == mavclient.MAX_IN_FLIGHT * len(message)
+            assert not any(t.done() for t in tasks)
+
+            # Each reply makes room for one more request
+            writer.write(struct.pack("<Bi", OP_GFX_SHOWMENU_REPLY, 0) * 5)
+            await asyncio.sleep(0.1)
+            assert sum(t.done() for t in tasks) == 5
+            assert len(received) == (mavclient.MAX_IN_FLIGHT + 5) * len(message)
+
+            # Like the server, only reply to requests that have been sent
+            for k in (mavclient.MAX_IN_FLIGHT, n - 5 - mavclient.MAX_IN_FLIGHT):
+                writer.write(struct.pack("<Bi", OP_GFX_SHOWMENU_REPLY, 2) * k)
+                await asyncio.sleep(0.1)
+            assert await asyncio.gather(*tasks) == [0] * 5 + [2] * (n - 5)
+            await conn.close()
+
+    asyncio.run(run())
+
+
+def test_reconnect() -> None:
+    async def run(stub: mavstub.MavStub, port: int) -> None:
+        client = mavclient.MavClient(port=port)
+        try:
+            assert await client.showmenu(menu(2)) == 2
+            conn = await client.connection()
+            waiting = asyncio.create_task(client.showmenu(menu(3)))
+            # mavstub drops the connection on a malformed OP_BATCH
+            with pytest.raises(Exception, match="connection lost"):
+                await conn.request(struct.pack("<IB", 1, OP_BATCH))
+            # Requests waiting for a reply fail rather than hang
+            with pytest.raises(Exception, match="connection lost"):
+                await waiting
+            assert conn.error is not None
+            with pytest.raises(Exception, match="connection lost"):
+                await conn.showmenu(menu(2))
+            assert await client.showmenu(menu(4)) == 4
+            assert client.conn is not conn
+        finally:
+            await client.close()
+
+    asyncio.run(with_stub(run))
@@ -0,0 +1,147 @@
+import asyncio
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Any
+
+import pytest
+
+import pwgraph
+import pwlink
+import pwstub
+
+CHANNELS = 8
+
+
+@dataclass
+class Stub:
+    state: str
+    tools: dict[str, Any]
+    dumps: int = 0
+    running: int = 0
+    max_running: int = 0
+    runs: list[tuple[str, ...]] = field(default_factory=list)
+
+    def links(self) -> set[tuple[int, int]]:
+        "(output, input) port ids of the links in the stand-in's graph"
+        with open(self.state) as fp:
+            objs = json.load(fp)
+        return {
+            (o["info"]["output-port-id"], o["info"]["input-port-id"])
+            for o in objs
+            if o["type"] == pwstub.LINK
+        }
+
+    def port_id(self, alias: str) -> int:
+        with open(self.state) as fp:
+            objs = json.load(fp)
+        for o in objs:
+            if o["type"] == pwstub.PORT and o["info"]["props"]["port.alias"] == alias:
+                return o["id"]
+        raise KeyError(alias)
+
+
+@pytest.fixture
+def stub(tmp_path, monkeypatch: pytest.MonkeyPatch) -> Stub:
+    state = str(tmp_path / "graph.json")
+    with open(state, "w") as fp:
+        json.dump(pwstub.generate(CHANNELS, 5), fp)
+    bindir = str(tmp_path / "bin")
+    pwstub.install(bindir, state, 0)
+    stub = Stub(
+        state,
+        dict(
+            cmd=os.path.join(bindir, "pw-link"),
+            dump_cmdline=(os.path.join(bindir, "pw-dump"),),
+            verbose=False,
+        ),
+    )
+    dump = pwgraph.dump
+    pw_link = pwlink.pw_link
+
+    async def counting_dump(cmdline: tuple[str, ...]) -> pwgraph.Graph:
+        stub.dumps += 1
+        return await dump(cmdline)
+
+    async def counting_pw_link(*args: str, cmd: str) -> int:
+        stub.runs.append(args)
+        stub.running += 1
+        stub.max_running = max(stub.max_running, stub.running)
+        try:
+            return await pw_link(*args, cmd=cmd)
+        finally:
+            stub.running -= 1
+
+    monkeypatch.setattr(pwgraph, "dump", counting_dump)
+    monkeypatch.setattr(pwlink, "pw_link", counting_pw_link)
+    return stub
+
+
+def capture_pairs(stub: Stub, channels: int) -> list[tuple[int, int]]:
+    return [
+        (
+            stub.port_id(f"Stub Capture:capture_AUX{n}"),
+            stub.port_id(f"REAPER:in{25 + n}"),
+        )
+        for n in range(channels)
+    ]
+
+
+def test_create_links(stub: Stub) -> None:
+    pairs = capture_pairs(stub, CHANNELS)
+    graph = asyncio.run(pwlink.apply_links(pairs, **stub.tools))
+    assert graph is not None
+    assert stub.links() == set(pairs)
+    assert all(graph.has_link(out, inp) for out, inp in pairs)
+    assert len(graph.links) == CHANNELS
+    assert stub.dumps == 1
+    assert stub.max_running > 1
+
+
+def test_create_links_by_alias(stub: Stub) -> None:
+    pairs = [
+        (f"Stub Capture:capture_AUX{n}", f"REAPER:in{25 + n}") for n in range(CHANNELS)
+    ]
+    asyncio.run(pwlink.apply_links(pairs, **stub.tools))
+    assert stub.links() == set(capture_pairs(stub, CHANNELS))
+    assert stub.dumps == 1
+
+
+def test_destroy_and_create(stub: Stub) -> None:
+    old = capture_pairs(stub, CHANNELS)
+    graph = asyncio.run(pwlink.apply_links(old, **stub.tools))
+    assert graph is not None
+    link_ids = [link_id for out, _ in old for link_id in graph.links_by_output[out]]
+    new = [(out, stub.port_id(f"REAPER:in{n + 1}")) for n, (out, _) in enumerate(old)]
+    graph = asyncio.run(pwlink.apply_links(new, link_ids, **stub.tools))
+    assert graph is not None
+    assert stub.links() == set(new)
+    assert set(graph.links) == {
+        link_id for out, _ in new for link_id in graph.links_by_output[out]
+    }
+    assert stub.dumps == 2
+    # All links are destroyed before any new one is created
+    assert [args[0] == "-d" for args in stub.runs[CHANNELS:]] == [True] * CHANNELS + [
+        False
+    ] * CHANNELS
+
+
+def test_small_link_sets_are_sequential(stub: Stub) -> None:
+    pairs = capture_pairs(stub, pwlink.SEQUENTIAL_MAX)
+    asyncio.run(pwlink.apply_links(pairs, **stub.tools))
+    assert stub.links() == set(pairs)
+    assert stub.max_running == 1
+    assert stub.runs == [(str(out), str(inp)) for out, inp in pairs]
+
+
+def test_verify_reports_missing_links(stub: Stub) -> None:
+    pairs = capture_pairs(stub, 2) + [("Stub Capture:capture_AUX0", "Nowhere:in")]
+    with pytest.raises(Exception, match="Nowhere:in"):
+        asyncio.run(pwlink.apply_links(pairs, **stub.tools))
+    assert stub.links() == set(capture_pairs(stub, 2))
+
+
+def test_without_verify(stub: Stub) -> None:
+    pairs = [("Stub Capture:capture_AUX0", "Nowhere:in")]
+    assert asyncio.run(pwlink.apply_links(pairs, verify=False, **stub.tools)) is None
+    assert stub.dumps == 0